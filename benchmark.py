@@ -0,0 +1,246 @@
+"""Throughput benchmark for the invoice generator.
+
+Builds a synthetic template with the documented layout and synthetic data
+workbooks, then times the three stages of a run separately:
+
+- load:   InvoiceGenerator.load_columns on the whole data file
+- render: preparing one invoice (template copy, layout, cell values)
+- save:   building its file (filling the sheet, workbook.save or the fast
+          writer) and writing it to disk
+
+Both come from the stage timings of render_invoice_batch, the function a real
+run calls for every invoice.
+
+The result is printed as JSON (invoices/s, line items/s, peak RSS) so runs can
+be compared across versions on the same machine:
+
+    python benchmark.py --sizes 1000,10000 --backend fast --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+from contextlib import redirect_stdout
+from datetime import datetime
+
+from main import InvoiceGenerator, render_invoice_batch, START_ROW, MAX_ROWS_PER_INVOICE
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+
+
+def make_template(template_path):
+    """Write a template with the layout described in the README (table at row 12, totals below)"""
+    import openpyxl
+    from openpyxl.styles import Font, Border, Side
+
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Facture"
+
+    sheet['A1'] = "SOCIETE EXEMPLE"
+    sheet['A1'].font = Font(bold=True, size=16)
+    sheet['D3'] = "Facture N°"
+    sheet['H3'] = "Date"
+    sheet['G5'] = "Client"
+    sheet['G7'] = "Adresse"
+    sheet['G9'] = "ICE"
+    sheet.cell(row=START_ROW - 1, column=1).value = "Désignation"
+    sheet.cell(row=START_ROW - 1, column=8).value = "Qté"
+    sheet.cell(row=START_ROW - 1, column=9).value = "P.U"
+    sheet.cell(row=START_ROW - 1, column=10).value = "Montant"
+
+    # Item table: description merged over A-D, bordered columns
+    thin = Side(style='thin')
+    end_row = START_ROW + MAX_ROWS_PER_INVOICE - 1
+    for row in range(START_ROW, end_row + 1):
+        sheet.merge_cells(f"A{row}:D{row}")
+        for column in range(1, 11):
+            sheet.cell(row=row, column=column).border = Border(left=thin, right=thin)
+
+    # Zeros under the table and the totals block
+    sheet.cell(row=end_row + 1, column=10).value = 0
+    sheet.cell(row=end_row + 2, column=10).value = 0
+    sheet.cell(row=end_row + 3, column=9).value = "Total HT"
+    sheet.cell(row=end_row + 4, column=9).value = "TVA 20%"
+    sheet.cell(row=end_row + 5, column=9).value = "Total TTC"
+
+    workbook.save(template_path)
+    return template_path
+
+
+def make_data(data_path, rows, seed=0):
+    """Write a data workbook of `rows` line items (description, quantity, unit price)"""
+    import openpyxl
+
+    # write_only keeps memory flat even for a million rows
+    generator = random.Random(seed)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for index in range(rows):
+        sheet.append([f"Article {index}", generator.randint(1, 50), round(generator.uniform(1, 500), 2)])
+    workbook.save(data_path)
+    return data_path
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where the resource module is missing"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def render_and_save(template_path, backend, batch):
+    """Write one batch with render_invoice_batch, returning (render seconds, save seconds)"""
+    timings = {}
+    render_invoice_batch(template_path, backend, batch, timings)
+    render_seconds = sum(timings.get(stage, 0.0) for stage in ('template', 'layout', 'cells'))
+    save_seconds = sum(timings.get(stage, 0.0) for stage in ('save', 'fallback'))
+    return render_seconds, save_seconds
+
+
+def run_case(generator, data_file, rows, backend, max_invoices):
+    """Time load, render and save for one data file and one backend"""
+    # The generator prints a line per skipped row and per total formula; keep the JSON clean
+    with open(os.devnull, 'w') as quiet, redirect_stdout(quiet):
+        started = time.perf_counter()
+        data = generator.load_columns(data_file)
+        load_seconds = time.perf_counter() - started
+
+        invoice_date = datetime.now().strftime("%d/%m/%Y")
+        batches = generator._plan_batches(data, "001", "FA 001/BENCH", None, {
+            'name': "CLIENT BENCHMARK", 'address': "1 rue de l'Exemple", 'ice': "000000000000000"
+        }, invoice_date)
+
+        # Rendering every invoice of a million lines takes a while; a sample gives the rate
+        sample = batches[:max_invoices] if max_invoices else batches
+
+        # First invoice parses the template; keep it out of the steady-state numbers
+        warm_render, warm_save = render_and_save(generator.template_path, backend, sample[0])
+
+        render_seconds = 0.0
+        save_seconds = 0.0
+        for batch in sample:
+            render_time, save_time = render_and_save(generator.template_path, backend, batch)
+            render_seconds += render_time
+            save_seconds += save_time
+
+    invoices = len(sample)
+    items = sum(len(batch['items']) for batch in sample)
+    elapsed = render_seconds + save_seconds
+
+    return {
+        'rows': rows,
+        'backend': backend,
+        'valid_rows': len(data['descriptions']),
+        'total_invoices': len(batches),
+        'sampled_invoices': invoices,
+        'load_seconds': round(load_seconds, 4),
+        'load_rows_per_second': round(rows / load_seconds, 1) if load_seconds else None,
+        'first_invoice_seconds': round(warm_render + warm_save, 4),
+        'render_seconds': round(render_seconds, 4),
+        'save_seconds': round(save_seconds, 4),
+        'render_ms_per_invoice': round(render_seconds / invoices * 1000, 3),
+        'save_ms_per_invoice': round(save_seconds / invoices * 1000, 3),
+        'invoices_per_second': round(invoices / elapsed, 1) if elapsed else None,
+        'items_per_second': round(items / elapsed, 1) if elapsed else None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def environment():
+    """Versions and machine details stored with the results"""
+    import openpyxl
+    import pandas
+
+    return {
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'openpyxl': openpyxl.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'date': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def _sizes_arg(value):
+    """Parse --sizes: comma-separated row counts, "1k"/"1M" suffixes allowed"""
+    sizes = []
+    for part in value.split(","):
+        part = part.strip().lower()
+        multiplier = {'k': 1000, 'm': 1000000}.get(part[-1:], 1)
+        try:
+            sizes.append(int(part.rstrip('km')) * multiplier)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid size: {part}")
+    return sizes
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmark", description="Load / render / save throughput benchmark")
+    parser.add_argument("--sizes", type=_sizes_arg, default=list(DEFAULT_SIZES),
+                        help="data sizes in line items (default: 1k,10k,100k,1M)")
+    parser.add_argument("--backend", choices=("openpyxl", "fast", "both"), default="both", help="writer backend(s)")
+    parser.add_argument("--max-invoices", type=int, default=200,
+                        help="invoices rendered per case, 0 for all (default: 200)")
+    parser.add_argument("--workdir", help="folder for the synthetic files (kept between runs, default: temporary)")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    return parser
+
+
+def run(sizes=DEFAULT_SIZES, backends=("openpyxl", "fast"), max_invoices=200, workdir=None):
+    """Run every (size, backend) case and return the report as a dict"""
+    workdir = workdir or tempfile.mkdtemp(prefix="invoice_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    output_folder = os.path.join(workdir, "out")
+    os.makedirs(output_folder, exist_ok=True)
+
+    generator = InvoiceGenerator()
+    generator.output_folder = output_folder
+    generator.template_path = os.path.join(workdir, "template.xlsx")
+    # Measure pandas parsing every time, not the parsed-data cache
+    generator.data_cache = None
+    if not os.path.exists(generator.template_path):
+        make_template(generator.template_path)
+    # pandas and numpy are imported on first use; keep their import out of the first load_seconds
+    generator.warm_up()
+
+    results = []
+    # Smallest first: peak RSS only grows, so each figure covers the sizes run so far
+    for rows in sorted(sizes):
+        data_file = os.path.join(workdir, f"data_{rows}.xlsx")
+        if not os.path.exists(data_file):
+            print(f"Generating {rows} rows...", file=sys.stderr)
+            make_data(data_file, rows)
+
+        for backend in backends:
+            print(f"Benchmarking {rows} rows with {backend}...", file=sys.stderr)
+            results.append(run_case(generator, data_file, rows, backend, max_invoices))
+
+    return {'environment': environment(), 'max_invoices': max_invoices, 'results': results}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    backends = ("openpyxl", "fast") if args.backend == "both" else (args.backend,)
+
+    report = run(args.sizes, backends, args.max_invoices, args.workdir)
+    text = json.dumps(report, indent=2)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as handle:
+            handle.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""On-disk cache of parsed data files.
+
+Reading an Excel file with pandas and converting its columns takes far longer
+than loading the same arrays back from disk, and the GUI tends to load the same
+data file several times per session. The columns returned by
+InvoiceGenerator.load_columns are therefore stored as uncompressed .npz files:
+quantities, unit prices and row numbers as numpy arrays, descriptions as one
+UTF-8 string table plus offsets, and the validation issues as JSON text, so
+nothing needs pickle to load back.
+
+Entries are named after the SHA-1 of the data file's content. An index maps
+(path, size, mtime) to that hash so an unchanged file is found without reading
+it; a touched or copied file is hashed and still hits. The least recently used
+entries are removed once the cache grows past max_bytes.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+# Bump when load_columns changes what it returns, so old entries are not reused
+FORMAT_VERSION = 2
+
+INDEX_NAME = "index.json"
+
+
+def content_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DataCache:
+    """Parsed columns of data files, keyed by path, size, mtime and content hash"""
+
+    def __init__(self, folder, max_bytes=256 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, digest):
+        return os.path.join(self.folder, f"{digest}.v{FORMAT_VERSION}.npz")
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.folder, INDEX_NAME), 'r', encoding='utf-8') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        path = os.path.join(self.folder, INDEX_NAME)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump(index, handle)
+        os.replace(temp_path, path)
+
+    def _lookup_hash(self, index, data_file, stat):
+        """Content hash of data_file, taken from the index when path, size and mtime still match"""
+        path = os.path.abspath(data_file)
+        for digest, entry in index.items():
+            if entry['path'] == path and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                return digest
+        return content_hash(data_file)
+
+    def get(self, data_file):
+        """Return the cached columns of data_file, or None"""
+        import numpy as np
+
+        stat = os.stat(data_file)
+        index = self._read_index()
+        digest = self._lookup_hash(index, data_file, stat)
+        entry_path = self._entry_path(digest)
+
+        try:
+            with np.load(entry_path, allow_pickle=False) as arrays:
+                table = arrays['description_table'].tobytes().decode('utf-8')
+                offsets = arrays['description_offsets'].tolist()
+                descriptions = np.empty(len(offsets) - 1, dtype=object)
+                descriptions[:] = [table[start:end] for start, end in zip(offsets, offsets[1:])]
+                columns = {
+                    'descriptions': descriptions,
+                    'quantities': arrays['quantities'],
+                    'unit_prices': arrays['unit_prices'],
+                    'rows': arrays['rows'],
+                    'skipped': [
+                        (row, reason) for row, reason in
+                        zip(arrays['skipped_rows'].tolist(), arrays['skipped_reasons'].tolist())
+                    ],
+                    'issues': json.loads(arrays['issues'].tobytes().decode('utf-8'))
+                }
+        except (OSError, KeyError, ValueError):
+            return None
+
+        # Remember where this content lives now and when it was last used
+        index[digest] = {
+            'path': os.path.abspath(data_file),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'bytes': os.path.getsize(entry_path),
+            'used': time.time()
+        }
+        self._write_index(index)
+        return columns
+
+    def put(self, data_file, columns):
+        """Store the columns parsed from data_file, then evict down to max_bytes"""
+        import numpy as np
+
+        os.makedirs(self.folder, exist_ok=True)
+        stat = os.stat(data_file)
+        digest = content_hash(data_file)
+        entry_path = self._entry_path(digest)
+
+        # Descriptions as one string table; offsets count characters, not bytes
+        descriptions = [str(description) for description in columns['descriptions']]
+        offsets = np.zeros(len(descriptions) + 1, dtype=np.int64)
+        np.cumsum([len(description) for description in descriptions], out=offsets[1:])
+        skipped = columns['skipped']
+
+        temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+        np.savez(
+            temp_path,
+            description_table=np.frombuffer("".join(descriptions).encode('utf-8'), dtype=np.uint8),
+            description_offsets=offsets,
+            quantities=np.asarray(columns['quantities'], dtype=np.float64),
+            unit_prices=np.asarray(columns['unit_prices'], dtype=np.float64),
+            rows=np.asarray(columns['rows'], dtype=np.int64),
+            skipped_rows=np.array([row for row, _ in skipped], dtype=np.int64),
+            skipped_reasons=np.array([reason for _, reason in skipped], dtype=str),
+            issues=np.frombuffer(json.dumps(columns.get('issues', [])).encode('utf-8'), dtype=np.uint8)
+        )
+        os.replace(temp_path, entry_path)
+
+        index = self._read_index()
+        index[digest] = {
+            'path': os.path.abspath(data_file),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'bytes': os.path.getsize(entry_path),
+            'used': time.time()
+        }
+        self._evict(index)
+        self._write_index(index)
+
+    def _evict(self, index):
+        """Drop the least recently used entries until the cache fits in max_bytes"""
+        total = sum(entry['bytes'] for entry in index.values())
+        for digest in sorted(index, key=lambda digest: index[digest]['used']):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._entry_path(digest))
+            except OSError:
+                pass
+            total -= index.pop(digest)['bytes']
+
+    def clear(self):
+        """Remove every cached entry"""
+        for digest in self._read_index():
+            try:
+                os.remove(self._entry_path(digest))
+            except OSError:
+                pass
+        os.makedirs(self.folder, exist_ok=True)
+        self._write_index({})
@@ -0,0 +1,431 @@
+"""Direct XML-patch writer for the invoice template.
+
+The template's .xlsx parts are kept in memory as bytes. For every invoice only
+the active worksheet XML is rewritten with the new cell values; styles,
+drawings, images and every other part are copied byte-for-byte.
+"""
+import io
+import os
+import posixpath
+import re
+import zipfile
+import threading
+
+# Writers keyed on template path: (mtime, size, writer)
+_writer_cache = {}
+
+_ROW_RE = re.compile(r'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+_CELL_RE = re.compile(r'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+_XF_RE = re.compile(r'<xf\b[^>]*?(?:/>|>.*?</xf>)', re.S)
+_ILLEGAL_CHARS_RE = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+CALC_CHAIN_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/calcChain"
+
+# Width, in characters, of a column without a <col> entry or sheet default (Excel's Calibri 11)
+DEFAULT_COLUMN_WIDTH = 8.43
+
+
+def escape(text):
+    """Escape &, < and > in XML character data"""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def unescape(text):
+    """Undo the XML escapes Excel writes (xml.sax.saxutils pulls in urllib at import time)"""
+    if "&" not in text:
+        return text
+    for entity, char in (("&lt;", "<"), ("&gt;", ">"), ("&quot;", '"'), ("&apos;", "'")):
+        text = text.replace(entity, char)
+    text = re.sub(r'&#x([0-9a-fA-F]+);', lambda m: chr(int(m.group(1), 16)), text)
+    text = re.sub(r'&#(\d+);', lambda m: chr(int(m.group(1))), text)
+    return text.replace("&amp;", "&")
+
+
+def _attribute(tag, name):
+    """Return the value of attribute `name` in an XML start tag, or None"""
+    match = re.search(r'\s%s="([^"]*)"' % name, tag)
+    return unescape(match.group(1)) if match else None
+
+
+def _split_coordinate(coordinate):
+    """Split 'J12' into (12, 10)"""
+    letters = coordinate.rstrip('0123456789')
+    column = 0
+    for letter in letters.upper():
+        column = column * 26 + ord(letter) - 64
+    return int(coordinate[len(letters):]), column
+
+
+def column_letter(column):
+    """Convert a 1-based column number to its letters (10 -> 'J')"""
+    letters = ""
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _text(value):
+    """Escape a string for use as XML character data"""
+    return escape(_ILLEGAL_CHARS_RE.sub("", value))
+
+
+class Formula(str):
+    """A formula ("=...") carrying the value it evaluates to, stored as the cell's cached result"""
+
+    def __new__(cls, text, cached=None):
+        formula = super().__new__(cls, text)
+        formula.cached = cached
+        return formula
+
+
+def _number(value):
+    """Format a number the way Excel stores it"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class FastTemplateWriter:
+    """Fill template cells by patching the worksheet XML instead of round-tripping through openpyxl"""
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+
+        with zipfile.ZipFile(template_path) as archive:
+            self.part_names = [info.filename for info in archive.infolist()]
+            self.parts = {name: archive.read(name) for name in self.part_names}
+
+        self.sheet_part = self._find_active_sheet()
+        self.shared_strings = self._read_shared_strings()
+        self._drop_calc_chain()
+        self._parse_sheet(self.parts[self.sheet_part].decode('utf-8'))
+        self._parse_styles()
+        self._build_base()
+
+    @classmethod
+    def for_template(cls, template_path):
+        """Return a writer for template_path, re-reading the file only when it changed"""
+        stat = os.stat(template_path)
+        cached = _writer_cache.get(template_path)
+
+        if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+            cached = (stat.st_mtime_ns, stat.st_size, cls(template_path))
+            _writer_cache[template_path] = cached
+
+        return cached[2]
+
+    # ------------------------------------------------------------------
+    # Template parsing (runs once per template)
+    # ------------------------------------------------------------------
+
+    def _resolve(self, base_part, target):
+        """Resolve a relationship target relative to the part that owns it"""
+        if target.startswith('/'):
+            return target.lstrip('/')
+        return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+    def _relationships(self, rels_part):
+        """Return the relationship tags of a .rels part"""
+        return re.findall(r'<Relationship\b[^>]*/?>', self.parts.get(rels_part, b"").decode('utf-8'))
+
+    def _find_active_sheet(self):
+        """Locate the worksheet part that openpyxl would return as workbook.active"""
+        workbook = self.parts['xl/workbook.xml'].decode('utf-8')
+        view = re.search(r'<workbookView\b[^>]*>', workbook)
+        active_tab = int(_attribute(view.group(0), 'activeTab') or 0) if view else 0
+
+        sheets = re.findall(r'<sheet\b[^>]*>', workbook)
+        sheet_tag = sheets[min(active_tab, len(sheets) - 1)]
+        rel_id = re.search(r'\sr:id="([^"]*)"', sheet_tag).group(1)
+
+        for rel in self._relationships('xl/_rels/workbook.xml.rels'):
+            if _attribute(rel, 'Id') == rel_id:
+                return self._resolve('xl/workbook.xml', _attribute(rel, 'Target'))
+
+        raise ValueError(f"Feuille active introuvable dans le modèle: {self.template_path}")
+
+    def _read_shared_strings(self):
+        """Read the shared string table so template labels can be inspected"""
+        strings = []
+        xml = self.parts.get('xl/sharedStrings.xml', b"").decode('utf-8')
+        for item in re.findall(r'<si>(.*?)</si>', xml, re.S):
+            texts = re.findall(r'<t\b[^>]*>(.*?)</t>', item, re.S)
+            strings.append(unescape("".join(texts)))
+        return strings
+
+    def _drop_calc_chain(self):
+        """Remove calcChain.xml - it would list stale formula cells once the sheet is rewritten"""
+        if 'xl/calcChain.xml' in self.parts:
+            del self.parts['xl/calcChain.xml']
+            self.part_names.remove('xl/calcChain.xml')
+
+            rels = self.parts['xl/_rels/workbook.xml.rels'].decode('utf-8')
+            rels = re.sub(r'<Relationship\b[^>]*Type="%s"[^>]*/>' % re.escape(CALC_CHAIN_TYPE), "", rels)
+            self.parts['xl/_rels/workbook.xml.rels'] = rels.encode('utf-8')
+
+            types = self.parts['[Content_Types].xml'].decode('utf-8')
+            types = re.sub(r'<Override\b[^>]*PartName="/xl/calcChain.xml"[^>]*/>', "", types)
+            self.parts['[Content_Types].xml'] = types.encode('utf-8')
+
+        # Ask Excel to recalculate the formulas when the file is opened, as openpyxl does
+        workbook = self.parts['xl/workbook.xml'].decode('utf-8')
+        calc = re.search(r'<calcPr\b[^>]*?/?>', workbook)
+        if calc is None:
+            anchor = '</definedNames>' if '</definedNames>' in workbook else '</sheets>'
+            workbook = workbook.replace(anchor, anchor + '<calcPr fullCalcOnLoad="1"/>', 1)
+        elif 'fullCalcOnLoad' not in calc.group(0):
+            tag = re.sub(r'\s*(/?>)$', r' fullCalcOnLoad="1"\1', calc.group(0))
+            workbook = workbook.replace(calc.group(0), tag, 1)
+        self.parts['xl/workbook.xml'] = workbook.encode('utf-8')
+
+    def _parse_sheet(self, xml):
+        """Split the worksheet into the text around sheetData and a row/cell model"""
+        match = re.search(r'<sheetData\s*/>|<sheetData\b[^>]*>(.*?)</sheetData>', xml, re.S)
+        self.sheet_head = xml[:match.start()] + '<sheetData>'
+        self.sheet_tail = '</sheetData>' + xml[match.end():]
+
+        # rows: {row number: [open tag, {column: (cell xml, style)}]}
+        self.rows = {}
+        row_number = 0
+        for row_xml in _ROW_RE.findall(match.group(1) or ""):
+            open_tag = re.match(r'<row\b[^>]*?/?>', row_xml).group(0)
+            row_number = int(_attribute(open_tag, 'r') or row_number + 1)
+
+            cells = {}
+            column = 0
+            for cell_xml in _CELL_RE.findall(row_xml[len(open_tag):]):
+                cell_tag = re.match(r'<c\b[^>]*?/?>', cell_xml).group(0)
+                reference = _attribute(cell_tag, 'r')
+                column = _split_coordinate(reference)[1] if reference else column + 1
+                cells[column] = (cell_xml, _attribute(cell_tag, 's'))
+
+            # Spans are only a loading hint and may be wrong once cells are added
+            open_tag = re.sub(r'\sspans="[^"]*"', "", open_tag).replace('/>', '>')
+            self.rows[row_number] = [open_tag, cells]
+
+        # Column widths in characters, from <cols>; other columns, and a width of 0, get the sheet's
+        # default width, as openpyxl's customWidth does for _SheetReader
+        self.column_widths = {}
+        for tag in re.findall(r'<col\b[^>]*?/?>', self.sheet_head):
+            width = _attribute(tag, 'width')
+            if width and float(width):
+                for column in range(int(_attribute(tag, 'min')), int(_attribute(tag, 'max')) + 1):
+                    self.column_widths[column] = float(width)
+        sheet_format = re.search(r'<sheetFormatPr\b[^>]*>', self.sheet_head)
+        default_width = sheet_format and _attribute(sheet_format.group(0), 'defaultColWidth')
+        self.default_column_width = float(default_width) if default_width else DEFAULT_COLUMN_WIDTH
+
+        # Every cell covered by a merged range except its top-left anchor
+        self.merged_children = set()
+        for reference in re.findall(r'<mergeCell\b[^>]*\sref="([^"]*)"', xml):
+            if ':' not in reference:
+                continue
+            first, last = reference.split(':')
+            min_row, min_col = _split_coordinate(first)
+            max_row, max_col = _split_coordinate(last)
+            for row in range(min_row, max_row + 1):
+                for column in range(min_col, max_col + 1):
+                    if (row, column) != (min_row, min_col):
+                        self.merged_children.add((row, column))
+
+    def column_width(self, column):
+        return self.column_widths.get(column, self.default_column_width)
+
+    def _parse_styles(self):
+        """Index the cellXfs so bold variants of existing styles can be appended"""
+        styles = self.parts['xl/styles.xml'].decode('utf-8')
+        cell_xfs = re.search(r'<cellXfs\b[^>]*>(.*?)</cellXfs>', styles, re.S)
+        self.cell_xfs = _XF_RE.findall(cell_xfs.group(1)) if cell_xfs else ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>']
+        self.bold_styles = {}
+        self.bold_font_id = None
+        # Writers are shared through _writer_cache by every render thread
+        self._style_lock = threading.Lock()
+
+    def _bold_style(self, style):
+        """Return the index of a copy of cell style `style` whose font is bold"""
+        style = style or '0'
+        bold = self.bold_styles.get(style)
+        if bold is None:
+            with self._style_lock:
+                bold = self.bold_styles.get(style)
+                if bold is None:
+                    bold = self._add_bold_style(style)
+        return bold
+
+    def _add_bold_style(self, style):
+        """Append a bold copy of cell style `style` to styles.xml; called with _style_lock held"""
+        styles = self.parts['xl/styles.xml'].decode('utf-8')
+
+        if self.bold_font_id is None:
+            fonts = re.search(r'<fonts\b[^>]*>(.*?)</fonts>', styles, re.S)
+            self.bold_font_id = len(re.findall(r'<font\b[^>]*?(?:/>|>.*?</font>)', fonts.group(1), re.S))
+            new_fonts = re.sub(r'\scount="\d+"', ' count="%d"' % (self.bold_font_id + 1), fonts.group(0)[:fonts.start(1) - fonts.start()])
+            new_fonts += fonts.group(1) + '<font><b/></font></fonts>'
+            styles = styles.replace(fonts.group(0), new_fonts, 1)
+
+        base = self.cell_xfs[int(style)] if int(style) < len(self.cell_xfs) else self.cell_xfs[0]
+        base_tag = re.match(r'<xf\b[^>]*?/?>', base).group(0)
+        tag = re.sub(r'\sfontId="\d+"', "", base_tag)
+        tag = re.sub(r'\sapplyFont="\d"', "", tag)
+        tag = tag.replace('<xf', '<xf fontId="%d" applyFont="1"' % self.bold_font_id, 1)
+        xf = tag + base[len(base_tag):]
+
+        self.cell_xfs.append(xf)
+        styles = re.sub(r'<cellXfs\b[^>]*>.*?</cellXfs>',
+                        lambda m: '<cellXfs count="%d">%s</cellXfs>' % (len(self.cell_xfs), "".join(self.cell_xfs)),
+                        styles, count=1, flags=re.S)
+
+        self.parts['xl/styles.xml'] = styles.encode('utf-8')
+        self._build_base()
+        # Published last: a thread that sees the new index also sees the base archive defining it
+        self.bold_styles[style] = str(len(self.cell_xfs) - 1)
+        return self.bold_styles[style]
+
+    def _build_base(self):
+        """Compress every unchanged part once; each invoice only appends its own worksheet"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name in self.part_names:
+                if name != self.sheet_part:
+                    archive.writestr(name, self.parts[name])
+        self.base_archive = buffer.getvalue()
+
+    # ------------------------------------------------------------------
+    # Reading template values
+    # ------------------------------------------------------------------
+
+    def value(self, row, column):
+        """Return the template's value at (row, column), like openpyxl's cell.value"""
+        cell = self.rows.get(row, (None, {}))[1].get(column)
+        if cell is None:
+            return None
+
+        cell_xml = cell[0]
+        cell_tag = re.match(r'<c\b[^>]*?/?>', cell_xml).group(0)
+        cell_type = _attribute(cell_tag, 't') or 'n'
+        formula = re.search(r'<f\b[^>]*>(.*?)</f>', cell_xml, re.S)
+        if formula:
+            return '=' + unescape(formula.group(1))
+
+        if cell_type == 'inlineStr':
+            return unescape("".join(re.findall(r'<t\b[^>]*>(.*?)</t>', cell_xml, re.S)))
+
+        raw = re.search(r'<v>(.*?)</v>', cell_xml, re.S)
+        if raw is None:
+            return None
+        raw = unescape(raw.group(1))
+
+        if cell_type == 's':
+            return self.shared_strings[int(raw)]
+        if cell_type in ('str', 'e'):
+            return raw
+        if cell_type == 'b':
+            return raw == '1'
+        number = float(raw)
+        return int(number) if number.is_integer() and 'E' not in raw.upper() and '.' not in raw else number
+
+    # ------------------------------------------------------------------
+    # Writing invoices
+    # ------------------------------------------------------------------
+
+    def _cell_xml(self, row, column, value, style):
+        """Serialize one cell; strings are written inline so sharedStrings stays untouched"""
+        reference = f"{column_letter(column)}{row}"
+        style_attr = f' s="{style}"' if style else ""
+
+        if value is None:
+            return f'<c r="{reference}"{style_attr}/>'
+        if isinstance(value, bool):
+            return f'<c r="{reference}"{style_attr} t="b"><v>{int(value)}</v></c>'
+        if isinstance(value, (int, float)):
+            return f'<c r="{reference}"{style_attr}><v>{_number(value)}</v></c>'
+
+        cached = getattr(value, 'cached', None)
+        value = str(value)
+        if value.startswith('='):
+            result = f'<v>{_number(cached)}</v>' if cached is not None else ""
+            return f'<c r="{reference}"{style_attr}><f>{_text(value[1:])}</f>{result}</c>'
+
+        space = ' xml:space="preserve"' if value != value.strip() else ""
+        return f'<c r="{reference}"{style_attr} t="inlineStr"><is><t{space}>{_text(value)}</t></is></c>'
+
+    def render_sheet(self, cells, bold_cells=()):
+        """Return the worksheet XML with `cells` ({(row, column): value}) filled in"""
+        bold_cells = set(bold_cells)
+
+        # Group the new values by row
+        updates = {}
+        for (row, column), value in cells.items():
+            updates.setdefault(row, {})[column] = value
+        for row, column in bold_cells:
+            updates.setdefault(row, {}).setdefault(column, self.value(row, column))
+
+        parts = [self.sheet_head]
+        for row in sorted(set(self.rows) | set(updates)):
+            open_tag, row_cells = self.rows.get(row, (f'<row r="{row}">', {}))
+            if row not in updates:
+                parts.append(open_tag + "".join(xml for xml, _ in row_cells.values()) + '</row>')
+                continue
+
+            merged_cells = dict(row_cells)
+            for column, value in updates[row].items():
+                style = row_cells.get(column, (None, None))[1]
+                if (row, column) in bold_cells:
+                    style = self._bold_style(style)
+                merged_cells[column] = (self._cell_xml(row, column, value, style), style)
+
+            parts.append(open_tag + "".join(merged_cells[column][0] for column in sorted(merged_cells)) + '</row>')
+        parts.append(self.sheet_tail)
+
+        return "".join(parts).encode('utf-8')
+
+    def render(self, cells, bold_cells=()):
+        """Return the bytes of a complete .xlsx file with `cells` filled in"""
+        sheet = self.render_sheet(cells, bold_cells)
+
+        buffer = io.BytesIO(self.base_archive)
+        buffer.seek(0, io.SEEK_END)
+        with zipfile.ZipFile(buffer, 'a', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(self.sheet_part, sheet)
+        return buffer.getvalue()
+
+
+def patch_cached_values(xlsx, sheets):
+    """Add the cached results of Formula values to a workbook saved by openpyxl
+
+    sheets maps each worksheet part ("xl/worksheets/sheet1.xml") to the cells written
+    on it. openpyxl writes formulas with an empty <v/>; those worksheet XMLs are
+    patched and the archive rebuilt. Returns the new .xlsx bytes.
+    """
+    patched = {}
+    source = zipfile.ZipFile(io.BytesIO(xlsx))
+
+    for sheet_part, cells in sheets.items():
+        cached = {
+            f"{column_letter(column)}{row}": value.cached
+            for (row, column), value in cells.items()
+            if getattr(value, 'cached', None) is not None
+        }
+        if not cached:
+            continue
+
+        def fill(match):
+            value = cached.get(match.group(2))
+            if value is None:
+                return match.group(0)
+            return f"{match.group(1)}<v>{_number(value)}</v>"
+
+        sheet = source.read(sheet_part).decode('utf-8')
+        patched[sheet_part] = re.sub(
+            r'(<c r="([A-Z]+[0-9]+)"[^>]*>\s*<f>[^<]*</f>\s*)<v\s*/>', fill, sheet
+        ).encode('utf-8')
+
+    if not patched:
+        return xlsx
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for info in source.infolist():
+            archive.writestr(info, patched.get(info.filename) or source.read(info.filename))
+    return buffer.getvalue()
@@ -0,0 +1,520 @@
+"""Tkinter interface for the invoice generator.
+
+Only imported when the GUI is launched, so headless runs never load tkinter.
+"""
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+from tkinter.scrolledtext import ScrolledText
+
+class InvoiceApp:
+    def __init__(self, root, generator):
+        self.root = root
+        self.root.title("Générateur de Factures")
+        self.root.geometry("750x600")
+        self.root.configure(padx=20, pady=20)
+        # The invoice generator driven by this window
+        self.generator = generator
+        
+        # Generation runs on a worker thread that reports back through this queue
+        self.events = queue.Queue()
+        self.cancel_event = None
+        self.last_progress_log = 0.0
+        
+        # Check if template file exists
+        if not os.path.exists(self.generator.template_path):
+            messagebox.showwarning(
+                "Fichier modèle manquant",
+                f"Le fichier modèle n'a pas été trouvé à l'emplacement:\n{self.generator.template_path}\n\n"
+                "Veuillez sélectionner le fichier modèle lors de la première utilisation."
+            )
+        
+        # Default data file path
+        self.data_file = os.path.join(self.generator.base_path, "AZZOUZIFCT.xlsx")
+        
+        # Check if data file exists
+        if not os.path.exists(self.data_file):
+            # Set to empty and will require user selection
+            self.data_file = ""
+        
+        # Create the main frame
+        self.main_frame = ttk.Frame(root)
+        self.main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Create styles
+        self.style = ttk.Style()
+        self.style.configure("TLabel", font=("Arial", 11))
+        self.style.configure("TButton", font=("Arial", 11))
+        self.style.configure("TEntry", font=("Arial", 11))
+        self.style.configure("Header.TLabel", font=("Arial", 14, "bold"))
+        
+        # Create the header
+        header = ttk.Label(self.main_frame, text="Générateur de Factures", style="Header.TLabel")
+        header.pack(pady=(0, 20))
+        
+        # Create the form frame
+        form_frame = ttk.Frame(self.main_frame)
+        form_frame.pack(fill=tk.X, pady=10)
+        
+        # Data file selection
+        file_frame = ttk.Frame(form_frame)
+        file_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(file_frame, text="Fichier de données:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.data_file_var = tk.StringVar(value=self.data_file)
+        data_file_entry = ttk.Entry(file_frame, textvariable=self.data_file_var, width=40)
+        data_file_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        
+        browse_btn = ttk.Button(file_frame, text="Parcourir...", command=self.browse_data_file)
+        browse_btn.pack(side=tk.LEFT)
+        
+        # Invoice ID
+        id_frame = ttk.Frame(form_frame)
+        id_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(id_frame, text="Numéro de facture:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.invoice_id_var = tk.StringVar()
+        invoice_id_entry = ttk.Entry(id_frame, textvariable=self.invoice_id_var, width=15)
+        invoice_id_entry.pack(side=tk.LEFT)
+        
+        ttk.Label(id_frame, text="(Laissez vide pour générer automatiquement)").pack(side=tk.LEFT, padx=(10, 0))
+        
+        # Client info
+        client_frame = ttk.LabelFrame(form_frame, text="Informations client")
+        client_frame.pack(fill=tk.X, pady=10)
+        
+        # Client name
+        name_frame = ttk.Frame(client_frame)
+        name_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(name_frame, text="Nom / Société:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.client_name_var = tk.StringVar()
+        client_name_entry = ttk.Entry(name_frame, textvariable=self.client_name_var, width=40)
+        client_name_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # Client address
+        address_frame = ttk.Frame(client_frame)
+        address_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(address_frame, text="Adresse:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.client_address_var = tk.StringVar()
+        client_address_entry = ttk.Entry(address_frame, textvariable=self.client_address_var, width=40)
+        client_address_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # Client ICE
+        ice_frame = ttk.Frame(client_frame)
+        ice_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(ice_frame, text="ICE:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.client_ice_var = tk.StringVar()
+        client_ice_entry = ttk.Entry(ice_frame, textvariable=self.client_ice_var, width=40)
+        client_ice_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # Output options
+        output_frame = ttk.LabelFrame(form_frame, text="Options de sortie")
+        output_frame.pack(fill=tk.X, pady=10)
+        
+        # Output folder
+        folder_frame = ttk.Frame(output_frame)
+        folder_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(folder_frame, text="Dossier de sortie:").pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.output_folder_var = tk.StringVar(value=self.generator.output_folder)
+        output_folder_entry = ttk.Entry(folder_frame, textvariable=self.output_folder_var, width=40)
+        output_folder_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
+        
+        browse_output_btn = ttk.Button(folder_frame, text="Parcourir...", command=self.browse_output_folder)
+        browse_output_btn.pack(side=tk.LEFT)
+        
+        # Incremental regeneration
+        self.incremental_var = tk.BooleanVar(value=self.generator.incremental)
+        incremental_check = ttk.Checkbutton(
+            output_frame, text="Ne régénérer que les factures modifiées", variable=self.incremental_var
+        )
+        incremental_check.pack(anchor=tk.W, pady=5)
+        
+        # Strict validation: nothing is written when the data has errors
+        self.strict_var = tk.BooleanVar(value=self.generator.strict_validation)
+        strict_check = ttk.Checkbutton(
+            output_frame, text="Ne rien générer si les données contiennent des erreurs", variable=self.strict_var
+        )
+        strict_check.pack(anchor=tk.W)
+        
+        # Per-line TVA rates from the fourth column of the data file
+        self.line_rates_var = tk.BooleanVar(value=self.generator.line_rates)
+        line_rates_check = ttk.Checkbutton(
+            output_frame, text="Taux de TVA par ligne (4e colonne du fichier de données)",
+            variable=self.line_rates_var
+        )
+        line_rates_check.pack(anchor=tk.W, pady=5)
+        
+        # Buttons
+        button_frame = ttk.Frame(self.main_frame)
+        button_frame.pack(fill=tk.X, pady=20)
+        
+        self.generate_btn = ttk.Button(button_frame, text="Générer la facture", command=self.generate_invoice)
+        self.generate_btn.pack(side=tk.RIGHT, padx=5)
+        
+        self.cancel_btn = ttk.Button(button_frame, text="Annuler", command=self.cancel_generation, state=tk.DISABLED)
+        self.cancel_btn.pack(side=tk.RIGHT, padx=5)
+        
+        reset_btn = ttk.Button(button_frame, text="Réinitialiser", command=self.reset_form)
+        reset_btn.pack(side=tk.RIGHT, padx=5)
+        
+        # Log area
+        log_frame = ttk.LabelFrame(self.main_frame, text="Journal")
+        log_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        self.log_text = ScrolledText(log_frame, height=10)
+        self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.log_text.config(state=tk.DISABLED)
+        
+        # Status bar
+        self.status_var = tk.StringVar(value="Prêt")
+        status_bar = ttk.Label(self.main_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.pack(fill=tk.X, side=tk.BOTTOM, pady=(10, 0))
+        
+    def log(self, message):
+        """Add a message to the log area"""
+        self.log_text.config(state=tk.NORMAL)
+        self.log_text.insert(tk.END, f"{datetime.now().strftime('%H:%M:%S')} - {message}\n")
+        self.log_text.see(tk.END)
+        self.log_text.config(state=tk.DISABLED)
+        
+    def browse_data_file(self):
+        """Open file dialog to select data file"""
+        file_path = filedialog.askopenfilename(
+            title="Sélectionner le fichier de données",
+            filetypes=[("Data files", "*.xlsx *.xls *.csv *.parquet *.feather"), ("Excel files", "*.xlsx *.xls"),
+                       ("CSV files", "*.csv"), ("All files", "*.*")],
+            initialdir=self.generator.base_path
+        )
+        
+        if file_path:
+            self.data_file_var.set(file_path)
+            self.log(f"Fichier de données sélectionné: {file_path}")
+    
+    def browse_output_folder(self):
+        """Open folder dialog to select output folder"""
+        folder_path = filedialog.askdirectory(
+            title="Sélectionner le dossier de sortie",
+            initialdir=self.generator.output_folder
+        )
+        
+        if folder_path:
+            self.output_folder_var.set(folder_path)
+            self.log(f"Dossier de sortie sélectionné: {folder_path}")
+    
+    def generate_invoice(self):
+        """Generate the invoice(s) with the provided information on a worker thread"""
+        try:
+            # Disable the generate button during processing
+            self.generate_btn.config(state=tk.DISABLED)
+            self.status_var.set("Génération en cours...")
+            
+            # Get values from form
+            data_file = self.data_file_var.get()
+            invoice_id = self.invoice_id_var.get() if self.invoice_id_var.get() else None
+            output_folder = self.output_folder_var.get()
+            
+            # Create client info dictionary
+            client_info = {}
+            if self.client_name_var.get():
+                client_info['name'] = self.client_name_var.get()
+            if self.client_address_var.get():
+                client_info['address'] = self.client_address_var.get()
+            if self.client_ice_var.get():
+                client_info['ice'] = self.client_ice_var.get()
+            
+            # Validate inputs
+            if not os.path.exists(data_file):
+                raise ValueError(f"Le fichier de données n'existe pas: {data_file}")
+                
+            if not os.path.exists(self.generator.template_path):
+                raise ValueError(f"Le fichier modèle n'existe pas: {self.generator.template_path}")
+                
+            if not os.path.exists(output_folder):
+                # Create output folder if it doesn't exist
+                try:
+                    os.makedirs(output_folder, exist_ok=True)
+                    self.log(f"Dossier de sortie créé: {output_folder}")
+                except Exception as e:
+                    raise ValueError(f"Impossible de créer le dossier de sortie: {str(e)}")
+            
+            # Update generator paths and options
+            self.generator.output_folder = output_folder
+            self.generator.line_rates = self.line_rates_var.get()
+            
+            # Log start of generation
+            self.log(f"Début de la génération de la facture...")
+            self.log(f"Fichier de données: {data_file}")
+            self.log(f"Fichier modèle: {self.generator.template_path}")
+            
+            # Generate filename if invoice_id provided
+            output_file = None
+            if invoice_id:
+                output_file = os.path.join(output_folder, f"invoice_{invoice_id}.xlsx")
+            
+            # Generate the invoice(s) off the Tk thread; results come back through self.events
+            self.cancel_event = threading.Event()
+            self.cancel_btn.config(state=tk.NORMAL)
+            self.last_progress_log = 0.0
+            
+            worker = threading.Thread(
+                target=self._run_generation,
+                args=(data_file, invoice_id, output_file, client_info, output_folder, self.incremental_var.get(),
+                      self.strict_var.get()),
+                daemon=True
+            )
+            worker.start()
+            self.root.after(100, self._poll_events)
+        
+        except Exception as e:
+            self._show_error(str(e))
+    
+    def _run_generation(self, data_file, invoice_id, output_file, client_info, output_folder, incremental, strict):
+        """Worker thread: run the generator and post its progress and result to the Tk thread"""
+        try:
+            result = self.generator.create_invoice(
+                data_file,
+                invoice_id,
+                output_file,
+                client_info,
+                progress=lambda event: self.events.put(('progress', event)),
+                cancel_event=self.cancel_event,
+                incremental=incremental,
+                strict=strict
+            )
+            self.events.put(('done', (result, output_folder)))
+        except Exception as e:
+            self.events.put(('error', str(e)))
+    
+    def _poll_events(self):
+        """Handle the events posted by the worker thread; runs on the Tk thread via root.after"""
+        finished = False
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            
+            if kind == 'progress':
+                self._show_progress(payload)
+            elif kind == 'done':
+                finished = True
+                self._generation_finished()
+                self._log_stats()
+                self._show_result(*payload)
+            elif kind == 'error':
+                finished = True
+                self._generation_finished()
+                self._log_stats()
+                self._show_error(payload)
+        
+        if not finished:
+            self.root.after(100, self._poll_events)
+    
+    def _show_progress(self, event):
+        """Show a progress event in the status bar, and in the log about once a second"""
+        eta = f"{event['eta']:.0f} s" if event['eta'] is not None else "?"
+        message = (f"Facture {event['batch']}/{event['batches']} - "
+                   f"{event['rows_per_second']:.0f} lignes/s - reste {eta}")
+        self.status_var.set(message)
+        
+        now = time.monotonic()
+        if now - self.last_progress_log >= 1.0 or event['batch'] == event['batches']:
+            self.last_progress_log = now
+            self.log(message)
+    
+    def _generation_finished(self):
+        """Put the buttons back once the worker thread is done"""
+        self.generate_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state=tk.DISABLED)
+    
+    def _log_stats(self):
+        """Write the validation report, the duplicates found and the time spent in each stage to the log"""
+        report = self.generator.last_validation
+        if report is not None and report.issues:
+            self.log("Contrôle des données:")
+            for line in report.summary_lines():
+                self.log(line)
+        
+        for duplicate in self.generator.last_duplicates:
+            previous = ", ".join(match['display_id'] for match in duplicate['matches'])
+            self.log(f"Attention: la facture {duplicate['display_id']} est identique à {previous}")
+        
+        self.log("Temps par étape:")
+        for line in self.generator.stats.summary_lines():
+            self.log(line)
+    
+    def cancel_generation(self):
+        """Ask the worker to stop after the invoice it is currently writing"""
+        if self.cancel_event is not None and not self.cancel_event.is_set():
+            self.cancel_event.set()
+            self.cancel_btn.config(state=tk.DISABLED)
+            self.log("Annulation demandée, arrêt après la facture en cours...")
+            self.status_var.set("Annulation en cours...")
+    
+    def _show_error(self, error_msg):
+        """Log and display a generation error"""
+        self.generate_btn.config(state=tk.NORMAL)
+        self.log(f"Erreur: {error_msg}")
+        self.status_var.set("Erreur lors de la génération")
+        
+        # Show error message
+        messagebox.showerror("Erreur", f"Une erreur s'est produite lors de la génération de la facture:\n\n{error_msg}")
+    
+    def _show_result(self, result, output_folder):
+        """Report the generated invoice(s) to the user"""
+        if self.generator.cancelled:
+            count = len(result) if isinstance(result, list) else 1
+            self.log(f"Génération annulée: {count} facture(s) déjà générée(s)")
+            self.status_var.set("Génération annulée")
+            messagebox.showinfo("Génération annulée", f"La génération a été annulée.\n\n{count} facture(s) déjà générée(s) dans:\n{output_folder}")
+            return
+        
+        # Handle the result (could be a single path or a list of paths)
+        if isinstance(result, list):
+            # Multiple invoices were generated
+            self.log(f"{len(result)} factures générées avec succès:")
+            for idx, invoice_path in enumerate(result):
+                self.log(f"  {idx+1}. {invoice_path}")
+            
+            self.status_var.set(f"{len(result)} factures générées")
+            
+            # Show success message
+            messagebox.showinfo(
+                "Génération réussie", 
+                f"{len(result)} factures ont été générées avec succès.\n\nDossier: {output_folder}"
+            )
+            
+            # Ask if user wants to open the output folder
+            if messagebox.askyesno("Ouvrir le dossier", "Voulez-vous ouvrir le dossier contenant les factures générées?"):
+                import platform
+                import subprocess
+                
+                system = platform.system()
+                try:
+                    if system == 'Windows':
+                        os.startfile(output_folder)
+                    elif system == 'Darwin':  # macOS
+                        subprocess.call(['open', output_folder])
+                    else:  # Linux and other Unix-like systems
+                        subprocess.call(['xdg-open', output_folder])
+                except Exception as e:
+                    self.log(f"Erreur lors de l'ouverture du dossier: {str(e)}")
+                    messagebox.showwarning("Avertissement", f"Impossible d'ouvrir le dossier automatiquement.\n\nLes factures ont été enregistrées ici:\n{output_folder}")
+        else:
+            # Single invoice was generated
+            self.log(f"Facture générée avec succès: {result}")
+            self.status_var.set(f"Facture générée: {os.path.basename(result)}")
+            
+            # Show success message
+            messagebox.showinfo(
+                "Génération réussie", 
+                f"La facture a été générée avec succès.\n\nFichier: {result}"
+            )
+            
+            # Ask if user wants to open the generated file
+            if messagebox.askyesno("Ouvrir le fichier", "Voulez-vous ouvrir la facture générée?"):
+                import platform
+                import subprocess
+                
+                system = platform.system()
+                try:
+                    if system == 'Windows':
+                        os.startfile(result)
+                    elif system == 'Darwin':  # macOS
+                        subprocess.call(['open', result])
+                    else:  # Linux and other Unix-like systems
+                        subprocess.call(['xdg-open', result])
+                except Exception as e:
+                    self.log(f"Erreur lors de l'ouverture du fichier: {str(e)}")
+                    messagebox.showwarning("Avertissement", f"Impossible d'ouvrir le fichier automatiquement.\n\nLe fichier a été enregistré ici:\n{result}")
+    
+    def reset_form(self):
+        """Reset the form to default values"""
+        self.invoice_id_var.set("")
+        self.client_name_var.set("")
+        self.client_address_var.set("")
+        self.client_ice_var.set("")
+        self.data_file_var.set(os.path.join(self.generator.base_path, "AZZOUZIFCT.xlsx"))
+        self.output_folder_var.set(self.generator.base_path)
+        
+        self.log("Formulaire réinitialisé")
+        self.status_var.set("Prêt")
+
+
+def add_menu(root, app):
+    """Add menu bar to the application"""
+    menubar = tk.Menu(root)
+    
+    # File menu
+    filemenu = tk.Menu(menubar, tearoff=0)
+    filemenu.add_command(label="Sélectionner fichier de données", command=app.browse_data_file)
+    filemenu.add_command(label="Sélectionner dossier de sortie", command=app.browse_output_folder)
+    filemenu.add_separator()
+    filemenu.add_command(label="Quitter", command=root.quit)
+    menubar.add_cascade(label="Fichier", menu=filemenu)
+    
+    # Template menu
+    templatemenu = tk.Menu(menubar, tearoff=0)
+    templatemenu.add_command(label="Sélectionner modèle", command=lambda: select_template(app))
+    menubar.add_cascade(label="Modèle", menu=templatemenu)
+    
+    # Help menu
+    helpmenu = tk.Menu(menubar, tearoff=0)
+    helpmenu.add_command(label="À propos", command=lambda: show_about(root))
+    menubar.add_cascade(label="Aide", menu=helpmenu)
+    
+    root.config(menu=menubar)
+
+def select_template(app):
+    """Allow user to select a template file"""
+    file_path = filedialog.askopenfilename(
+        title="Sélectionner le fichier modèle",
+        filetypes=[("Excel files", "*.xlsx *.xls"), ("All files", "*.*")],
+        initialdir=app.generator.base_path
+    )
+    
+    if file_path:
+        app.generator.template_path = file_path
+        app.log(f"Fichier modèle sélectionné: {file_path}")
+
+def show_about(root):
+    """Show about dialog"""
+    messagebox.showinfo(
+        "À propos",
+        "Générateur de Factures\n\n"
+        "Version 1.0\n\n"
+        "Un programme pour générer des factures à partir de fichiers Excel.\n"
+        "Compatible avec Windows et Linux."
+    )
+
+def run(generator):
+    """Open the main window for `generator` and run the Tk event loop"""
+    # Handle high DPI displays on Windows
+    if os.name == 'nt':
+        try:
+            from ctypes import windll
+            windll.shcore.SetProcessDpiAwareness(1)
+        except:
+            pass
+    
+    root = tk.Tk()
+    app = InvoiceApp(root, generator)
+    add_menu(root, app)
+    
+    # Once the window is drawn, load pandas/openpyxl and the template in the background
+    root.after(200, lambda: threading.Thread(target=generator.warm_up, daemon=True).start())
+    root.mainloop()
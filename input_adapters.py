@@ -0,0 +1,240 @@
+"""Readers for the line items of a job, whatever their source.
+
+Every adapter returns a DataFrame whose first three columns are description,
+quantity and unit price, like the Excel data file, followed by the fourth column
+when there is one: the TVA rate of each line, read when
+InvoiceGenerator.line_rates is set. InvoiceGenerator then validates and converts
+them the same way for every source. The streaming counterparts yield the rows as
+tuples instead, so a large file is never loaded whole.
+
+- Excel (.xlsx, .xlsm, .xls): pandas / openpyxl, the slowest to parse
+- CSV (.csv, .txt, .tsv): pandas' C parser, read in chunks; ';' or tab separated
+  files may use a decimal comma
+- Parquet (.parquet, .pq) and Arrow/Feather (.arrow, .feather, .ipc): pyarrow,
+  reading only the first four columns, with no text parsing at all
+- in memory: a DataFrame, or any iterable of dicts or 3-tuples
+
+detect_format() picks the reader from the extension, or from the first bytes of
+the file when the extension is unknown.
+"""
+import os
+import re
+
+# Rows per chunk when reading CSV files
+CSV_CHUNK_ROWS = 100000
+
+EXTENSIONS = {
+    '.xlsx': 'excel', '.xlsm': 'excel', '.xls': 'excel',
+    '.csv': 'csv', '.txt': 'csv', '.tsv': 'csv',
+    '.parquet': 'parquet', '.pq': 'parquet',
+    '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow'
+}
+
+# File signatures, for paths without a known extension
+MAGIC = (
+    (b'PK\x03\x04', 'excel'),                        # .xlsx / .xlsm are zip archives
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'excel'),  # legacy .xls (OLE2)
+    (b'PAR1', 'parquet'),
+    (b'ARROW1', 'arrow')
+)
+
+FORMATS = ('excel', 'csv', 'parquet', 'arrow')
+
+# Columns read from a data file: description, quantity, unit price and the optional TVA rate
+DATA_COLUMNS = 4
+
+# A number written with a decimal comma, as in French exports ("12,5", "-1234,50")
+DECIMAL_COMMA = re.compile(r'-?\d+,\d+')
+
+
+def detect_format(path):
+    """Return 'excel', 'csv', 'parquet' or 'arrow' for a data file"""
+    extension = os.path.splitext(str(path))[1].lower()
+    if extension in EXTENSIONS:
+        return EXTENSIONS[extension]
+
+    with open(path, 'rb') as handle:
+        head = handle.read(8)
+    for signature, file_format in MAGIC:
+        if head.startswith(signature):
+            return file_format
+
+    # Anything else is read as delimited text
+    return 'csv'
+
+
+def _require_pyarrow(file_format):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise RuntimeError(f"La lecture des fichiers {file_format} nécessite le module pyarrow (pip install pyarrow)")
+
+
+def _sniff_layout(path):
+    """(separator, decimal mark, number of columns) of a CSV file from its first lines
+
+    The separator is ',' or ';' (common in French exports), tab for .tsv. The decimal mark is
+    ',' when the fields are not comma-separated and numbers such as "12,5" appear in them,
+    '.' otherwise.
+    """
+    import csv
+
+    with open(path, 'r', encoding='utf-8-sig', newline='') as handle:
+        sample = handle.read(64 * 1024)
+
+    if str(path).lower().endswith('.tsv'):
+        separator = '\t'
+    else:
+        try:
+            separator = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+        except csv.Error:
+            separator = ','
+
+    lines = [line for line in sample.splitlines() if line.strip()]
+    # The last line of the sample may be cut short
+    rows = list(csv.reader(lines[:-1] or lines, delimiter=separator))
+    decimal = '.'
+    if separator != ',' and any(DECIMAL_COMMA.fullmatch(field.strip()) for row in rows for field in row):
+        decimal = ','
+    return separator, decimal, len(rows[0]) if rows else 0
+
+
+def _point_decimals(chunk):
+    """chunk with the decimal-comma numbers of its text columns (all but the description) written with a point
+
+    pandas only applies decimal=',' to the columns it parses as numbers; a header line or a
+    stray text value leaves the whole column as text.
+    """
+    for column in chunk.columns[1:]:
+        values = chunk[column]
+        if values.dtype.kind not in 'biufc':
+            numbers = values.astype(str).str.strip()
+            comma = numbers.str.fullmatch(DECIMAL_COMMA.pattern) & values.notna()
+            if comma.any():
+                chunk[column] = values.where(~comma, numbers.str.replace(',', '.', regex=False))
+    return chunk
+
+
+def _read_csv_chunks(path, chunk_rows=CSV_CHUNK_ROWS):
+    """Iterator over DataFrame chunks of the first DATA_COLUMNS columns, no header"""
+    import pandas as pd
+
+    separator, decimal, width = _sniff_layout(path)
+    # Blank lines are kept so row numbers in messages match the file, as for Excel
+    chunks = pd.read_csv(
+        path, header=None, sep=separator, decimal=decimal, usecols=range(max(1, min(width, DATA_COLUMNS))),
+        skip_blank_lines=False, chunksize=chunk_rows, encoding='utf-8-sig'
+    )
+    if decimal == ',':
+        return (_point_decimals(chunk) for chunk in chunks)
+    return chunks
+
+
+def read_csv(path):
+    """Line items of a CSV file, parsed chunk by chunk"""
+    import pandas as pd
+
+    chunks = list(_read_csv_chunks(path))
+    if not chunks:
+        return pd.DataFrame(columns=range(3))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _read_table(path, file_format):
+    """First DATA_COLUMNS columns of a Parquet or Arrow file as a pyarrow Table"""
+    _require_pyarrow(file_format)
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+
+        names = pq.read_schema(path).names[:DATA_COLUMNS]
+        return pq.read_table(path, columns=names)
+
+    import pyarrow.feather as feather
+
+    table = feather.read_table(path, memory_map=True)
+    return table.select(list(range(min(DATA_COLUMNS, table.num_columns))))
+
+
+def read_arrow(path, file_format='arrow'):
+    """Line items of a Parquet or Arrow/Feather file"""
+    table = _read_table(path, file_format)
+    # Numeric columns without nulls come out of Arrow without a copy
+    frame = table.to_pandas()
+    frame.columns = range(frame.shape[1])
+    return frame
+
+
+def read_excel(path):
+    import pandas as pd
+
+    return pd.read_excel(path, header=None)
+
+
+def read_frame(path, file_format=None):
+    """Read a data file with the reader of its format; returns the raw DataFrame"""
+    file_format = file_format or detect_format(path)
+    if file_format == 'csv':
+        return read_csv(path)
+    if file_format in ('parquet', 'arrow'):
+        return read_arrow(path, file_format)
+    return read_excel(path)
+
+
+def frame_from_records(records):
+    """DataFrame of line items from a DataFrame, or an iterable of dicts or (description, quantity, price)
+
+    A fourth column holds the TVA rate of each line when the records give one: a 'tva_rate'
+    column (in a DataFrame with named columns) or key, or a fourth tuple element. Lines without
+    a rate get NaN there.
+    """
+    import pandas as pd
+
+    columns = ['description', 'quantity', 'unit_price', 'tva_rate']
+    if isinstance(records, pd.DataFrame):
+        if all(column in records.columns for column in columns[:3]):
+            frame = records[[column for column in columns if column in records.columns]]
+        else:
+            frame = records.iloc[:, :3]
+        return frame.set_axis(range(frame.shape[1]), axis=1)
+
+    rows = []
+    for record in records:
+        if isinstance(record, dict):
+            rows.append(tuple(record.get(column) for column in columns))
+        else:
+            rows.append((tuple(record) + (None,))[:4])
+
+    frame = pd.DataFrame(rows, columns=range(4)) if rows else pd.DataFrame(columns=range(3))
+    if rows and frame[3].isna().all():
+        frame = frame.iloc[:, :3]
+    return frame
+
+
+def iter_rows(path, file_format=None):
+    """Yield the raw (description, quantity, unit price[, TVA rate]) rows of a CSV, Parquet or Arrow file
+
+    Excel files are streamed by InvoiceGenerator.iter_line_items with openpyxl's read-only mode.
+    """
+    file_format = file_format or detect_format(path)
+
+    if file_format == 'csv':
+        for chunk in _read_csv_chunks(path):
+            yield from chunk.itertuples(index=False, name=None)
+        return
+
+    if file_format == 'parquet':
+        _require_pyarrow(file_format)
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        names = parquet_file.schema_arrow.names[:DATA_COLUMNS]
+        for record_batch in parquet_file.iter_batches(columns=names):
+            yield from zip(*(column.to_pylist() for column in record_batch.columns))
+        return
+
+    if file_format == 'arrow':
+        for record_batch in _read_table(path, file_format).to_batches():
+            yield from zip(*(column.to_pylist() for column in record_batch.columns))
+        return
+
+    raise ValueError(f"Format non lisible ligne par ligne: {file_format}")
@@ -0,0 +1,113 @@
+"""Per-stage timers and counters for invoice runs.
+
+A RunStats object is attached to every run of InvoiceGenerator (generator.stats).
+Each stage (loading the data, copying the template, building the cells, saving
+the file...) adds its duration with one perf_counter call on each side, so the
+bookkeeping costs far less than the I/O it measures and can stay on in
+production. An optional sink receives one dict per batch and one at the end of
+the run, e.g. to write a structured log.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+
+class RunStats:
+    """Cumulative time and call count per stage, plus named counters"""
+
+    def __init__(self, sink=None):
+        # sink(event) is called with plain dicts: {'event': 'batch', ...} and {'event': 'run', ...}
+        self.sink = sink
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed block as one call of stage `name`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name, seconds, calls=1):
+        total = self.stages.get(name)
+        if total is None:
+            self.stages[name] = [calls, seconds]
+        else:
+            total[0] += calls
+            total[1] += seconds
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_batch(self, batch, timings, error=None):
+        """Merge the stage timings measured while rendering one batch (possibly in another process)"""
+        for name, seconds in timings.items():
+            self.add_time(name, seconds)
+        self.count('invoices' if error is None else 'failed_invoices')
+        self.count('line_items', len(batch['items']))
+
+        if self.sink is not None:
+            event = {
+                'event': 'batch',
+                'invoice': batch['invoice_index'] + 1,
+                'invoices': batch['num_invoices'],
+                'output_file': batch['output_file'],
+                'items': len(batch['items']),
+                'timings': timings
+            }
+            if error is not None:
+                event['error'] = error
+            self.emit(event)
+
+    def emit(self, event):
+        """Pass an event to the sink; a failing sink never stops a run"""
+        if self.sink is None:
+            return
+        try:
+            self.sink(event)
+        except Exception as e:
+            print(f"Stats sink error: {str(e)}")
+
+    def finish(self):
+        """Stop the run clock and send the run summary to the sink"""
+        self.elapsed = time.perf_counter() - self.started
+        self.emit(dict(self.as_dict(), event='run'))
+        return self
+
+    def as_dict(self):
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        return {
+            'elapsed': round(elapsed, 6),
+            'stages': {
+                name: {'calls': calls, 'seconds': round(seconds, 6)}
+                for name, (calls, seconds) in self.stages.items()
+            },
+            'counters': dict(self.counters)
+        }
+
+    def summary_lines(self):
+        """Human-readable report: one line per stage, slowest first, then the counters"""
+        elapsed = self.elapsed if self.elapsed is not None else time.perf_counter() - self.started
+        lines = [f"Total: {elapsed:.3f} s"]
+        for name, (calls, seconds) in sorted(self.stages.items(), key=lambda stage: -stage[1][1]):
+            share = seconds / elapsed * 100 if elapsed > 0 else 0.0
+            per_call = seconds / calls * 1000 if calls else 0.0
+            lines.append(f"  {name:<12} {seconds:>9.3f} s {share:>5.1f}%  {calls:>7} x {per_call:.2f} ms")
+        if self.counters:
+            lines.append("  " + ", ".join(f"{name}={value}" for name, value in self.counters.items()))
+        return lines
+
+
+class JsonLinesSink:
+    """Stats sink appending each event as one JSON line to a file"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event):
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            handle.write(json.dumps(event, ensure_ascii=False) + "\n")
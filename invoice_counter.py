@@ -0,0 +1,107 @@
+"""Persistent invoice-number allocator.
+
+The last number handed out is kept in a small sequence file per year
+(".invoice_seq_YYYY") next to the invoices, so the next number is known
+without listing the output folder. Every read-modify-write happens under a
+lock file created with O_EXCL, which is atomic on local disks and on network
+shares alike, so several operators can generate invoices at the same time.
+"""
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+class InvoiceCounter:
+    """Hand out FA NNN/YYYY numbers in constant time, safely across processes"""
+
+    def __init__(self, folder, seed=None, lock_timeout=30.0, stale_after=120.0):
+        # seed() returns the last number already in use; it is only called the
+        # first time a year is seen (e.g. to carry on from existing invoice files)
+        self.folder = folder
+        self.seed = seed
+        self.lock_timeout = lock_timeout
+        self.stale_after = stale_after
+
+    def _sequence_path(self, year):
+        return os.path.join(self.folder, f".invoice_seq_{year}")
+
+    @contextmanager
+    def _locked(self, year):
+        """Hold the lock file of `year` for the duration of the block"""
+        lock_path = self._sequence_path(year) + ".lock"
+        deadline = time.monotonic() + self.lock_timeout
+
+        while True:
+            try:
+                handle = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                # A process that died while holding the lock must not block everyone forever
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > self.stale_after:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Compteur de factures verrouillé: {lock_path}")
+                time.sleep(0.05)
+
+        try:
+            os.write(handle, str(os.getpid()).encode('ascii'))
+            os.close(handle)
+            yield
+        finally:
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    def _read(self, year):
+        """Last number used in `year`, seeding the sequence the first time"""
+        try:
+            with open(self._sequence_path(year), 'r', encoding='ascii') as handle:
+                return int(handle.read().strip() or 0)
+        except FileNotFoundError:
+            return int(self.seed()) if self.seed is not None else 0
+
+    def _write(self, year, last):
+        """Replace the sequence file atomically so a crash never leaves it half-written"""
+        path = self._sequence_path(year)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='ascii') as handle:
+            handle.write(str(last))
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, path)
+
+    def reserve(self, count=1, year=None):
+        """Reserve `count` consecutive numbers and return the first one"""
+        year = year or datetime.now().year
+        os.makedirs(self.folder, exist_ok=True)
+
+        with self._locked(year):
+            last = self._read(year)
+            self._write(year, last + count)
+
+        return last + 1
+
+    def release(self, first, count=1, year=None):
+        """Give back numbers reserved by a job that wrote nothing, unless a later number was handed out since"""
+        year = year or datetime.now().year
+
+        with self._locked(year):
+            if self._read(year) == first + count - 1:
+                self._write(year, first - 1)
+                return True
+        return False
+
+    def observe(self, number, year=None):
+        """Record a number chosen by hand so it is never handed out again"""
+        year = year or datetime.now().year
+        os.makedirs(self.folder, exist_ok=True)
+
+        with self._locked(year):
+            if number > self._read(year):
+                self._write(year, number)
@@ -0,0 +1,256 @@
+"""Searchable index of the generated invoices.
+
+A SQLite database (".invoice_index.sqlite") in the output folder holds one row
+per written invoice: file (and sheet or archive member for the "workbook" and
+"zip" output modes), displayed number, client name, address and ICE, date,
+line descriptions, totals and a hash of the client and line items. It is
+updated by InvoiceGenerator as the files are written, so questions such as
+"which invoice contained item X for client Y" are answered without opening any
+spreadsheet:
+
+    InvoiceIndex(folder).search("main d'oeuvre", client="ACME")
+
+Descriptions and client names are searched with SQLite's FTS5 full-text index
+(word prefixes, case and accents ignored) when the SQLite build has it, and
+with LIKE otherwise.
+
+The hash of the client (name and ICE) and line items lets find_duplicates()
+flag a new invoice identical to one already written under another number,
+before it is written again.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from datetime import date, datetime
+
+INDEX_NAME = ".invoice_index.sqlite"
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL,
+    part TEXT NOT NULL DEFAULT '',
+    display_id TEXT NOT NULL,
+    invoice TEXT NOT NULL,
+    client_name TEXT,
+    client_address TEXT,
+    client_ice TEXT,
+    date TEXT,
+    descriptions TEXT NOT NULL,
+    lines INTEGER NOT NULL,
+    total_ht REAL,
+    tva REAL,
+    total_ttc REAL,
+    content TEXT NOT NULL,
+    written REAL NOT NULL,
+    UNIQUE (file, part)
+);
+CREATE INDEX IF NOT EXISTS invoices_content ON invoices (content);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (date);
+CREATE INDEX IF NOT EXISTS invoices_ice ON invoices (client_ice);
+"""
+
+# Full-text index of the descriptions and client of every row of invoices (rowid = invoices.id)
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS invoice_text
+USING fts5(descriptions, client, tokenize = 'unicode61 remove_diacritics 2')
+"""
+
+FIELDS = ('file', 'part', 'display_id', 'invoice', 'client_name', 'client_address', 'client_ice', 'date',
+          'descriptions', 'lines', 'total_ht', 'tva', 'total_ttc')
+
+DUPLICATE_CHECKS = ("off", "warn", "error")
+
+
+class DuplicateInvoiceError(ValueError):
+    """An invoice about to be written has the same client and line items as one already written"""
+
+    def __init__(self, duplicates):
+        self.duplicates = duplicates
+        super().__init__(
+            f"{len(duplicates)} facture(s) identique(s) à des factures déjà générées (même client, mêmes lignes)\n"
+            + "\n".join(f"  {duplicate['display_id']} = {', '.join(match['display_id'] for match in duplicate['matches'])}"
+                        for duplicate in duplicates[:10])
+        )
+
+
+def _client_text(value):
+    return " ".join(str(value).split()) if value is not None else ""
+
+
+def content_hash(batch):
+    """Hash of what makes two invoices the same: client name and ICE, and the line items (with their TVA rates)"""
+    client = batch['client_info'] or {}
+    content = [
+        _client_text(client.get('name')).casefold(),
+        _client_text(client.get('ice')),
+        [[item.description, round(item.quantity, 2), round(item.unit_price, 2)] for item in batch['items']]
+    ]
+    rates = getattr(batch['items'], 'tva_rates', None)
+    if rates is not None:
+        content.append(rates.tolist())
+    return hashlib.sha1(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _iso_date(value):
+    """A date as YYYY-MM-DD, from a date or a "dd/mm/YYYY" or ISO string"""
+    if value is None or isinstance(value, str) and not value.strip():
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    try:
+        return datetime.strptime(value.strip(), "%d/%m/%Y").strftime("%Y-%m-%d")
+    except ValueError:
+        return datetime.strptime(value.strip()[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+
+
+def _totals(batch):
+    """(Total HT, TVA, Total TTC) of a batch, as written on the invoice"""
+    totals = batch.get('totals')
+    if not totals:
+        from money import invoice_totals
+
+        items = batch['items']
+        if not len(items):
+            return 0.0, 0.0, 0.0
+        totals = invoice_totals(items.quantities, items.unit_prices, len(items), batch.get('tva_rate', 0.2),
+                                batch.get('rounding', "half_up"), items.tva_rates)[0]
+    return totals['ht'], totals['tva'], totals['ttc']
+
+
+def _match_expression(text):
+    """FTS5 query matching every word of text as a prefix; words are quoted so no syntax leaks through"""
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+class InvoiceIndex:
+    """The invoice index of one output folder"""
+
+    def __init__(self, folder, timeout=30.0):
+        self.path = os.path.join(folder, INDEX_NAME)
+        # Several operators (or job service workers) may write to the same folder
+        self.connection = sqlite3.connect(self.path, timeout=timeout)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+        try:
+            self.connection.execute(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: searches fall back to LIKE
+            self.fts = False
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.connection.commit()
+
+    def add(self, batch, file=None, part=""):
+        """Index a batch written to file (batch['output_file'] by default), replacing what was there
+
+        Not committed until commit(), so a job file can be indexed as a whole once it is in place.
+        """
+        file = os.path.abspath(file or batch['output_file'])
+        client = batch['client_info'] or {}
+        descriptions = batch['items'].descriptions
+        total_ht, tva, total_ttc = _totals(batch)
+
+        self.remove(file, part)
+        cursor = self.connection.execute(
+            "INSERT INTO invoices (file, part, display_id, invoice, client_name, client_address, client_ice, date, "
+            "descriptions, lines, total_ht, tva, total_ttc, content, written) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file, part, batch['display_id'], batch['initial_display_id'], _client_text(client.get('name')) or None,
+             _client_text(client.get('address')) or None, _client_text(client.get('ice')) or None,
+             _iso_date(batch.get('date')), "\n".join(descriptions), len(descriptions), total_ht, tva, total_ttc,
+             content_hash(batch), time.time())
+        )
+        if self.fts:
+            self.connection.execute(
+                "INSERT INTO invoice_text (rowid, descriptions, client) VALUES (?, ?, ?)",
+                (cursor.lastrowid, "\n".join(descriptions),
+                 " ".join(_client_text(client.get(field)) for field in ('name', 'ice')).strip())
+            )
+
+    def remove(self, file, part=""):
+        """Forget the invoice indexed for file (and part)"""
+        file = os.path.abspath(file)
+        for row in self.connection.execute("SELECT id FROM invoices WHERE file = ? AND part = ?", (file, part)).fetchall():
+            if self.fts:
+                self.connection.execute("DELETE FROM invoice_text WHERE rowid = ?", (row['id'],))
+            self.connection.execute("DELETE FROM invoices WHERE id = ?", (row['id'],))
+
+    def prune(self):
+        """Forget the invoices whose file no longer exists; returns the number of files forgotten"""
+        missing = [row for row in self.connection.execute("SELECT DISTINCT file FROM invoices").fetchall()
+                   if not os.path.exists(row['file'])]
+        for row in missing:
+            for part in self.connection.execute("SELECT part FROM invoices WHERE file = ?", (row['file'],)).fetchall():
+                self.remove(row['file'], part['part'])
+        self.commit()
+        return len(missing)
+
+    def find_duplicates(self, batch):
+        """Indexed invoices, still on disk, with the same client and line items as batch under another number
+
+        Invoices of the same job (same initial number) are not duplicates of each other: they are
+        the same invoice being written again.
+        """
+        rows = self.connection.execute(
+            f"SELECT {', '.join(FIELDS)} FROM invoices WHERE content = ? AND invoice != ? ORDER BY id",
+            (content_hash(batch), batch['initial_display_id'])
+        ).fetchall()
+        return [self._result(row) for row in rows if os.path.exists(row['file'])]
+
+    def search(self, text=None, client=None, ice=None, display_id=None, date_from=None, date_to=None, limit=100):
+        """Indexed invoices matching every criterion given, most recent first
+
+        text: words that must all appear in the line descriptions (as word prefixes with FTS5)
+        client: words of the client name (or ICE), the same way; ice: the exact ICE
+        display_id: part of the invoice number
+        date_from, date_to: inclusive bounds, as dates or "dd/mm/YYYY" / ISO strings
+        """
+        conditions, parameters = [], []
+        if self.fts:
+            match = [f"{column} : ({_match_expression(str(value))})"
+                     for column, value in (('descriptions', text), ('client', client)) if value and str(value).split()]
+            if match:
+                conditions.append("id IN (SELECT rowid FROM invoice_text WHERE invoice_text MATCH ?)")
+                parameters.append(" AND ".join(match))
+        else:
+            for column, value in (('descriptions', text), ('client_name', client)):
+                for word in str(value or "").split():
+                    conditions.append(f"{column} LIKE ?")
+                    parameters.append(f"%{word}%")
+        if ice:
+            conditions.append("client_ice = ?")
+            parameters.append(_client_text(ice))
+        if display_id:
+            conditions.append("display_id LIKE ?")
+            parameters.append(f"%{display_id}%")
+        if date_from:
+            conditions.append("date >= ?")
+            parameters.append(_iso_date(date_from))
+        if date_to:
+            conditions.append("date <= ?")
+            parameters.append(_iso_date(date_to))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.connection.execute(
+            f"SELECT {', '.join(FIELDS)} FROM invoices {where} ORDER BY date DESC, id DESC LIMIT ?",
+            parameters + [int(limit)]
+        ).fetchall()
+        return [self._result(row) for row in rows]
+
+    @staticmethod
+    def _result(row):
+        result = dict(zip(FIELDS, row))
+        result['descriptions'] = result['descriptions'].split("\n") if result['descriptions'] else []
+        return result
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        """Close the database; whatever was added since the last commit() is dropped"""
+        self.connection.close()
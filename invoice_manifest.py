@@ -0,0 +1,146 @@
+"""Manifest of generated invoices for incremental regeneration.
+
+A JSON file (".invoice_manifest.json") next to the invoices records, for every
+output file, a fingerprint of what went into it: a hash of its line items, a
+hash of the client info, a hash of the template file and the displayed invoice
+number. A re-run with the same inputs can then leave that file untouched and
+only render the invoices whose inputs changed.
+
+The manifest also remembers which invoice number each data file received,
+with the client and template it was generated for. A re-run without an
+explicit number keeps that number (and file names) while both are unchanged,
+whatever lines were edited: the per-file fingerprints then decide which files
+are rendered again. A data file generated for another client or with another
+template is another job and gets a new number.
+"""
+import os
+import json
+import hashlib
+import threading
+
+MANIFEST_NAME = ".invoice_manifest.json"
+
+# Template hashes keyed on path: (mtime, size, hash)
+_template_hash_cache = {}
+
+
+def template_hash(template_path):
+    """SHA-1 of the template file, recomputed only when its mtime or size changes"""
+    stat = os.stat(template_path)
+    cached = _template_hash_cache.get(template_path)
+
+    if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+        digest = hashlib.sha1()
+        with open(template_path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(chunk)
+        cached = (stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        _template_hash_cache[template_path] = cached
+
+    return cached[2]
+
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _line_rates(items):
+    rates = getattr(items, 'tva_rates', None)
+    return None if rates is None else _digest(rates.tolist())
+
+
+class InvoiceManifest:
+    """Fingerprints of the invoice files in one output folder"""
+
+    def __init__(self, folder, template_path):
+        self.path = os.path.join(folder, MANIFEST_NAME)
+        self.template = template_hash(template_path)
+        self.runs = {}
+        self.files = {}
+        self.changed = False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as handle:
+                content = json.load(handle)
+            self.runs = content.get('runs', {})
+            self.files = content.get('files', {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError) as e:
+            # A damaged manifest only costs a full regeneration
+            print(f"Ignoring unreadable manifest {self.path}: {str(e)}")
+
+    def fingerprint(self, batch):
+        """What an invoice file depends on; the file is rewritten when any of it changes"""
+        return {
+            'items': _digest([list(item) for item in batch['items']]),
+            'client': _digest(batch['client_info'] or {}),
+            'template': self.template,
+            'display_id': batch['display_id'],
+            # "Facture i/n" and the continuation note depend on the split of the whole job
+            'header': [batch['invoice_index'], batch['num_invoices'], batch['initial_display_id']],
+            'cached_totals': bool(batch.get('totals')),
+            'pricing': [batch.get('tva_rate'), batch.get('rounding'), _line_rates(batch['items'])]
+        }
+
+    def is_current(self, batch):
+        """True if the output file exists and was rendered from exactly these inputs"""
+        key = os.path.abspath(batch['output_file'])
+        return self.files.get(key) == self.fingerprint(batch) and os.path.exists(key)
+
+    def record(self, batch):
+        """Remember the inputs of a file that has just been written"""
+        self.files[os.path.abspath(batch['output_file'])] = self.fingerprint(batch)
+        self.changed = True
+
+    def job_fingerprint(self, client_info):
+        """What a job's number is tied to, besides its data file: the client and the template"""
+        return {'client': _digest(client_info or {}), 'template': self.template}
+
+    def invoice_id_for(self, data_file, fingerprint):
+        """(file ID, display ID) given to data_file by an earlier run of the same job, or None
+
+        Edited line items do not make another job; another client or template does, and the
+        earlier number is then not reused.
+        """
+        run = self.runs.get(os.path.abspath(data_file))
+        if not run:
+            return None
+        # Numbers remembered before fingerprints were kept, or with more in them, match on these keys alone
+        stored = run.get('fingerprint') or fingerprint
+        if any(stored.get(key) != value for key, value in fingerprint.items()):
+            print(f"{data_file} was given {run['display_id']} for another client or template: a new number is used")
+            return None
+        return run['file_id'], run['display_id']
+
+    def remember_invoice_id(self, data_file, file_id, display_id, fingerprint):
+        self.runs[os.path.abspath(data_file)] = {'file_id': file_id, 'display_id': display_id,
+                                                 'fingerprint': fingerprint}
+        self.changed = True
+
+    def forget_invoice_id(self, data_file):
+        self.runs.pop(os.path.abspath(data_file), None)
+        self.changed = True
+
+    def orphans(self, initial_display_id, written):
+        """Files recorded for the job initial_display_id that the run that just finished did not produce
+
+        They are left over from an earlier split of the same number into more invoices.
+        """
+        written = {os.path.abspath(path) for path in written}
+        return [path for path, fingerprint in self.files.items()
+                if fingerprint.get('header', [None] * 3)[2] == initial_display_id and path not in written]
+
+    def forget(self, path):
+        self.files.pop(os.path.abspath(path), None)
+        self.changed = True
+
+    def save(self):
+        """Write the manifest atomically, only if something was recorded"""
+        if not self.changed:
+            return
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump({'version': 1, 'runs': self.runs, 'files': self.files}, handle, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
+        self.changed = False
@@ -0,0 +1,327 @@
+"""Local job service: queue invoice generation jobs over HTTP.
+
+Lets another application (an ERP, a script) trigger generation without the Tk
+GUI. The service listens on 127.0.0.1 by default (host, or --host, picks another
+address; it has no authentication, so only expose it to trusted machines) and
+speaks a small JSON-over-HTTP protocol built on asyncio, so it needs nothing
+outside the standard library:
+
+    POST   /jobs        submit a job, returns {"id": ..., "status": "queued"}
+    GET    /jobs        every known job
+    GET    /jobs/<id>   status, progress, result files or error of one job
+    DELETE /jobs/<id>   cancel a queued or running job
+    GET    /health      queue length and worker count
+
+A job is a JSON object with either "data_file" (path of an Excel, CSV, Parquet
+or Arrow file) or "line_items" (list of {"description", "quantity",
+"unit_price"} with an optional "tva_rate"), plus the optional keys
+"client_info", "invoice_id", "output_folder", "backend", "output_mode",
+"stream", "incremental", "tva_rate", "rounding", "strict", "resume" and
+"duplicates". The validation report of the data (see validation.py) and the
+invoices found identical to earlier ones (see invoice_index.py) are part of the
+job status.
+
+Jobs wait in a bounded queue and run on a fixed number of workers, each with
+its own InvoiceGenerator, warmed up once so the template caches stay hot. Jobs
+for the same output folder run one at a time.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from main import InvoiceGenerator
+
+# Keys of a job request passed on to create_invoice as they are
+JOB_OPTIONS = ("backend", "output_mode", "stream", "incremental", "tva_rate", "rounding", "strict", "resume",
+               "duplicates")
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class JobService:
+    """Bounded queue of generation jobs executed by a pool of warm InvoiceGenerator workers"""
+
+    def __init__(self, host="127.0.0.1", port=8765, workers=2, queue_size=100, history=1000,
+                 generator_factory=InvoiceGenerator, max_body=64 * 1024 * 1024):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.queue_size = queue_size
+        self.history = history
+        self.generator_factory = generator_factory
+        self.max_body = max_body
+
+        # Every job by id, in submission order: plain dicts, see submit()
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._queue = None
+        self._server = None
+        self._tasks = []
+        self._executor = None
+        # Jobs writing to the same output folder run one at a time: its manifest, run journals and
+        # index are read, updated and replaced as a whole
+        self._folder_locks = {}
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+
+    def submit(self, request):
+        """Validate a job request and queue it; returns the job dict"""
+        if not isinstance(request, dict):
+            raise ValueError("La requête doit être un objet JSON")
+        if ('data_file' in request) == ('line_items' in request):
+            raise ValueError("Indiquez soit data_file, soit line_items")
+        if 'line_items' in request and not isinstance(request['line_items'], list):
+            raise ValueError("line_items doit être une liste")
+        if 'data_file' in request and not os.path.exists(request['data_file']):
+            raise ValueError(f"Le fichier de données n'existe pas: {request['data_file']}")
+        if self._queue.full():
+            raise OverflowError("File d'attente pleine")
+
+        job = {
+            'id': str(next(self._ids)),
+            'status': 'queued',
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'request': request,
+            'progress': None,
+            'files': None,
+            'errors': [],
+            'error': None,
+            'stats': None,
+            'validation': None,
+            'duplicates': [],
+            'cancel_event': threading.Event()
+        }
+        self.jobs[job['id']] = job
+        self._queue.put_nowait(job)
+        self._forget_old_jobs()
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a job: a queued one never starts, a running one stops after its current invoice"""
+        job = self.jobs[job_id]
+        if job['status'] in ('done', 'failed', 'cancelled'):
+            return False
+        job['cancel_event'].set()
+        if job['status'] == 'queued':
+            job['status'] = 'cancelled'
+            job['finished'] = time.time()
+        return True
+
+    def describe(self, job, details=True):
+        """JSON-ready view of a job"""
+        view = {key: job[key] for key in ('id', 'status', 'submitted', 'started', 'finished', 'files', 'error')}
+        if details:
+            view['progress'] = job['progress']
+            view['errors'] = job['errors']
+            view['stats'] = job['stats']
+            view['validation'] = job['validation']
+            view['duplicates'] = job['duplicates']
+            request = dict(job['request'])
+            if 'line_items' in request:
+                request['line_items'] = len(request['line_items'])
+            view['request'] = request
+        return view
+
+    def _forget_old_jobs(self):
+        """Drop the oldest finished jobs beyond `history`"""
+        excess = len(self.jobs) - self.history
+        for job_id in list(self.jobs):
+            if excess <= 0:
+                break
+            if self.jobs[job_id]['status'] in ('done', 'failed', 'cancelled'):
+                del self.jobs[job_id]
+                excess -= 1
+
+    def _run_job(self, generator, job):
+        """Worker thread: run one job on this worker's generator"""
+        request = job['request']
+        default_folder = generator.output_folder
+        try:
+            if request.get('output_folder'):
+                os.makedirs(request['output_folder'], exist_ok=True)
+                generator.output_folder = request['output_folder']
+
+            def progress(event):
+                job['progress'] = event
+
+            options = {key: request[key] for key in JOB_OPTIONS if key in request}
+            result = generator.create_invoice(
+                request.get('data_file', request.get('line_items')),
+                request.get('invoice_id'),
+                None,
+                request.get('client_info') or {},
+                progress=progress,
+                cancel_event=job['cancel_event'],
+                **options
+            )
+            job['files'] = result if isinstance(result, list) else [result]
+            job['errors'] = [
+                {'invoice': number, 'file': path, 'error': error} for number, path, error in generator.last_errors
+            ]
+            job['status'] = 'cancelled' if generator.cancelled else 'done'
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'failed'
+        finally:
+            job['stats'] = generator.stats.as_dict()
+            if generator.last_validation is not None:
+                job['validation'] = generator.last_validation.as_dict()
+            job['duplicates'] = [
+                {'invoice': duplicate['display_id'], 'file': duplicate['output_file'],
+                 'same_as': [match['display_id'] for match in duplicate['matches']]}
+                for duplicate in generator.last_duplicates
+            ]
+            job['finished'] = time.time()
+            generator.output_folder = default_folder
+
+    async def _worker(self, generator):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, generator.warm_up)
+
+        while True:
+            job = await self._queue.get()
+            try:
+                folder = os.path.abspath(job['request'].get('output_folder') or generator.output_folder)
+                async with self._folder_locks.setdefault(folder, asyncio.Lock()):
+                    # Still queued while waiting for the folder, so it may have been cancelled meanwhile
+                    if job['status'] != 'queued':
+                        continue
+                    job['status'] = 'running'
+                    job['started'] = time.time()
+                    await loop.run_in_executor(self._executor, self._run_job, generator, job)
+            finally:
+                self._queue.task_done()
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+
+    async def _read_request(self, reader):
+        """Return (method, path, body bytes) of one HTTP/1.1 request"""
+        request_line = (await reader.readline()).decode('latin-1').strip()
+        if not request_line:
+            return None
+        method, target, _ = request_line.split(" ", 2)
+
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        length = int(headers.get('content-length', 0))
+        if length > self.max_body:
+            raise OverflowError("Requête trop volumineuse")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target.split("?", 1)[0].rstrip("/") or "/", body
+
+    def _route(self, method, path, body):
+        """Return (status, payload) for one request"""
+        parts = path.strip("/").split("/")
+
+        if path == "/health":
+            return 200, {'workers': self.workers, 'queued': self._queue.qsize(),
+                         'running': sum(job['status'] == 'running' for job in self.jobs.values())}
+
+        if parts[0] != "jobs" or len(parts) > 2:
+            return 404, {'error': "Ressource inconnue"}
+
+        if len(parts) == 1:
+            if method == "GET":
+                return 200, {'jobs': [self.describe(job, details=False) for job in self.jobs.values()]}
+            if method == "POST":
+                try:
+                    job = self.submit(json.loads(body or b"null"))
+                except OverflowError as e:
+                    return 503, {'error': str(e)}
+                except ValueError as e:
+                    return 400, {'error': str(e)}
+                return 202, {'id': job['id'], 'status': job['status']}
+            return 405, {'error': "Méthode non autorisée"}
+
+        job = self.jobs.get(parts[1])
+        if job is None:
+            return 404, {'error': f"Tâche inconnue: {parts[1]}"}
+        if method == "GET":
+            return 200, self.describe(job)
+        if method == "DELETE":
+            if not self.cancel(job['id']):
+                return 409, {'error': "La tâche est déjà terminée", 'status': job['status']}
+            return 200, {'id': job['id'], 'status': job['status']}
+        return 405, {'error': "Méthode non autorisée"}
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                request = await self._read_request(reader)
+                if request is None:
+                    return
+                status, payload = self._route(*request)
+            except OverflowError as e:
+                status, payload = 413, {'error': str(e)}
+            except (ValueError, asyncio.IncompleteReadError):
+                status, payload = 400, {'error': "Requête HTTP invalide"}
+
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            writer.write(
+                f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """Start the workers and the HTTP listener; returns once the port is open"""
+        self._queue = asyncio.Queue(self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="invoice-job")
+        self._tasks = [asyncio.create_task(self._worker(self.generator_factory())) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # With port 0 the system picks a free port
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop listening, cancel the queued jobs and wait for the running ones"""
+        self._server.close()
+        await self._server.wait_closed()
+        for job in self.jobs.values():
+            if job['status'] in ('queued', 'running'):
+                self.cancel(job['id'])
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Invoice job service listening on http://{self.host}:{self.port}")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def serve(host="127.0.0.1", port=8765, workers=2, generator_factory=InvoiceGenerator):
+    """Run the job service until interrupted"""
+    service = JobService(host, port, workers, generator_factory=generator_factory)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
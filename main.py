@@ -1,14 +1,79 @@
 import os
+import io
 import sys
-import pandas as pd
-import openpyxl
-from openpyxl.styles import Font, Alignment, Border, Side
+import argparse
+import threading
 from datetime import datetime
+import time
 from pathlib import Path
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from tkinter.scrolledtext import ScrolledText
-from copy import copy
+import pickle
+from fast_writer import FastTemplateWriter, Formula, patch_cached_values, DEFAULT_COLUMN_WIDTH
+from invoice_counter import InvoiceCounter
+from template_layout import TemplateLayout
+from instrumentation import RunStats
+from invoice_manifest import InvoiceManifest, template_hash
+from run_journal import RunJournal
+from data_cache import DataCache
+import input_adapters
+
+# pandas, numpy and openpyxl take most of the start-up time, so they are imported where
+# they are used (or pre-warmed with InvoiceGenerator.warm_up once the window is shown)
+HEAVY_MODULES = ("numpy", "pandas", "openpyxl")
+
+# Default column positions (0-based) in a multi-client master workbook
+MASTER_COLUMNS = {
+    'name': 0,
+    'address': 1,
+    'ice': 2,
+    'description': 3,
+    'quantity': 4,
+    'unit_price': 5
+}
+
+# Output formats: spreadsheet through openpyxl, spreadsheet by XML patching, or PDF
+BACKENDS = ("openpyxl", "fast", "pdf")
+
+# Where the invoices of a job go: one file per invoice, every invoice in one workbook (one sheet
+# per invoice, or one page per invoice for PDF), or the per-invoice files packed in one .zip
+OUTPUT_MODES = ("files", "workbook", "zip")
+
+# Template layout: first row of the items table and rows available per invoice
+START_ROW = 12
+MAX_ROWS_PER_INVOICE = 23
+
+# Parsed templates keyed on path: (mtime, size, pickled workbook)
+_template_cache = {}
+
+def load_template_workbook(template_path):
+    """Return a fresh copy of the template workbook, parsing the file only when it changed"""
+    stat = os.stat(template_path)
+    cached = _template_cache.get(template_path)
+    
+    if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+        import openpyxl
+        
+        # Parse the template once and keep a pickled snapshot - unpickling is much
+        # cheaper than unzipping and parsing the XML again for every output file
+        workbook = openpyxl.load_workbook(template_path)
+        cached = (stat.st_mtime_ns, stat.st_size, pickle.dumps(workbook, pickle.HIGHEST_PROTOCOL))
+        _template_cache[template_path] = cached
+    
+    return pickle.loads(cached[2])
+
+def _cell_text(value):
+    """Text of a spreadsheet value, without the '.0' pandas adds to whole numbers such as ICE codes"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _merged_children(sheet):
+    """Return the (row, column) of every merged cell except the top-left cell of each range"""
+    children = set()
+    for merged_range in sheet.merged_cells.ranges:
+        for row, column in merged_range.cells:
+            if (row, column) != (merged_range.min_row, merged_range.min_col):
+                children.add((row, column))
+    return children
 
 class InvoiceGenerator:
     def __init__(self):
@@ -28,320 +93,480 @@ class InvoiceGenerator:
             
         self.template_path = os.path.join(self.base_path, "FACTURE COMPT.xlsx")
         self.output_folder = self.base_path
+        
+        # Writer backend: "openpyxl" (full workbook round-trip), "fast" (direct XML patch) or "pdf"
+        self.backend = "openpyxl"
+        
+        # Number of processes rendering invoices: 1 renders in-process, "auto" uses every core
+        self.workers = 1
+        
+        # Parsed data files, so loading an unchanged file again skips pandas; None disables it
+        self.data_cache = DataCache(os.path.join(self.base_path, ".cache"))
+        
+        # Output mode of a job, see OUTPUT_MODES
+        self.output_mode = "files"
+        
+        # Compute line totals, Total HT, TVA and TTC while generating and store them as the cached
+        # results of the formulas, so previewers and parsers can read them without recalculating
+        self.cached_totals = False
+        
+        # TVA rate of an invoice (money.TVA_RATE) and rounding of line totals and TVA, one of
+        # money.ROUNDING_MODES; line items given in memory may also carry their own 'tva_rate'
+        self.tva_rate = 0.2
+        self.rounding = "half_up"
+        
+        # Read the TVA rate of each line from the fourth column of data files (0.2 or "20%"; an empty
+        # cell takes the invoice rate). Off by default: older data files may have other things there
+        self.line_rates = False
+        
+        # Only re-render the invoices whose inputs changed since the last run (see invoice_manifest.py)
+        self.incremental = False
+        
+        # Keep a run journal of file-per-invoice jobs (see run_journal.py): a job interrupted by a crash
+        # or a cancel resumes with the same number and skips the invoices already written
+        self.resume = True
+        
+        # Index of the written invoices in the output folder (see invoice_index.py), searched with
+        # search_invoices(). Invoices identical to an indexed one (same client and line items, another
+        # number) are reported before they are written: "warn" prints them and carries on, "error" stops
+        # the job with a DuplicateInvoiceError, "off" does not look
+        self.archive_index = True
+        self.duplicates = "warn"
+        self.last_duplicates = []
+        
+        # The line items are checked before anything is written (see validation.py). In strict mode
+        # a job with errors stops with a ValidationError; otherwise invalid rows are skipped as before.
+        # max_rows, if set, is the most line items a job may have.
+        self.strict_validation = False
+        self.max_rows = None
+        self.last_validation = None
+        
+        # Batches that failed during the last parallel run: (invoice number, output file, error)
+        self.last_errors = []
+        
+        # Whether the last run was stopped early through its cancel_event
+        self.cancelled = False
+        
+        # Per-stage timers and counters of the last run; stats_sink(event), if set, receives
+        # one dict per rendered batch and a summary at the end of each run
+        self.stats_sink = None
+        self.stats = RunStats()
+    
+    def warm_up(self):
+        """Import the heavy modules and parse the template ahead of the first generation"""
+        import importlib
+        
+        for module in HEAVY_MODULES:
+            importlib.import_module(module)
+        
+        try:
+            if os.path.exists(self.template_path):
+                if self.backend == 'fast':
+                    FastTemplateWriter.for_template(self.template_path)
+                else:
+                    load_template_workbook(self.template_path)
+        except Exception as e:
+            print(f"Could not pre-load template: {str(e)}")
     
     def load_data(self, data_file):
-        """Load data from Excel file and extract description, quantity, and unit price"""
+        """Load data from Excel file and extract description, quantity, and unit price
+        
+        The line items come back as a LineItemTable: iterating it yields LineItem objects.
+        """
+        from line_items import LineItemTable
+        
+        columns = self.load_columns(data_file)
+        line_items = LineItemTable.from_columns(
+            columns['descriptions'], columns['quantities'], columns['unit_prices']
+        )
+        
+        # Return only the line items - calculations will be handled by the template
+        return {
+            'line_items': line_items
+        }
+    
+    def load_columns(self, data_file):
+        """Load a data file (Excel, CSV, Parquet or Arrow) as columnar arrays (descriptions, quantities, unit prices)
+        
+        With line_rates, the TVA rates of the fourth column come as 'tva_rates' (NaN: the invoice rate).
+        """
         try:
-            # Read the first sheet of the Excel file
-            df = pd.read_excel(data_file, header=None)
+            # An unchanged data file comes back from the cache in milliseconds; it holds no TVA rates
+            columns = None if self.line_rates else self._cached_columns(data_file)
+            if columns is not None:
+                return columns
+            
+            # First sheet of an Excel file, or the whole CSV / Parquet / Arrow file
+            df = input_adapters.read_frame(data_file)
             
             # Check if the dataframe has the expected structure
             if df.shape[1] < 3:
                 raise ValueError("Fichier incorrect: colonnes insuffisantes")
             
-            # Extract line items (Description, Quantity, Unit Price)
-            line_items = []
-            for idx, row in df.iterrows():
-                # Skip rows where either description, quantity or price is missing
-                if pd.notna(row[0]) and pd.notna(row[1]) and pd.notna(row[2]):
-                    try:
-                        # Convert to appropriate types
-                        description = str(row[0])
-                        quantity = float(row[1])
-                        unit_price = float(row[2])
-                        
-                        line_items.append({
-                            'description': description,
-                            'quantity': quantity,
-                            'unit_price': unit_price
-                        })
-                    except (ValueError, TypeError):
-                        # Skip rows where conversion to float fails
-                        print(f"Skipping row {idx+1}: Could not convert quantity or unit price to number")
-                        continue
-            
-            # Return only the line items - calculations will be handled by the template
-            return {
-                'line_items': line_items
-            }
+            columns = self._columns_from_frame(df, self.line_rates)
+            
+            if self.data_cache is not None and not self.line_rates:
+                try:
+                    self.data_cache.put(data_file, columns)
+                except Exception as e:
+                    print(f"Could not cache data file: {str(e)}")
+            
+            return columns
         except Exception as e:
             print(f"Error loading data: {str(e)}")
             raise
     
+    def columns_from_items(self, line_items):
+        """Columnar arrays, as load_columns returns them, from in-memory line items
+        
+        line_items is a DataFrame, or any iterable of line-item dicts or (description, quantity, unit price).
+        """
+        return self._columns_from_frame(input_adapters.frame_from_records(line_items), line_rates=True)
+    
+    def validate(self, data_file):
+        """ValidationReport of a data file or of in-memory line items, without writing anything"""
+        if isinstance(data_file, (str, os.PathLike)):
+            return self._validation_report(self.load_columns(data_file))
+        return self._validation_report(self.columns_from_items(data_file))
+    
+    def _validation_report(self, data, issues=None):
+        """Report of loaded columns: the issues found when parsing, then the template and size checks"""
+        import validation
+        
+        report = validation.ValidationReport(data.get('issues', []) if issues is None else issues)
+        if issues is None:
+            rows = data['rows'] + 1
+            report.extend(validation.check_descriptions(data['descriptions'], rows, self._description_chars()))
+            if self.max_rows is not None and len(rows) > self.max_rows:
+                report.extend(validation.check_row_count(len(rows), self.max_rows, rows[self.max_rows]))
+        return report
+    
+    def _check_data(self, report, strict):
+        """Keep and print the validation report of a run; in strict mode, stop on errors"""
+        self.last_validation = report
+        self.stats.count('validation_errors', len(report.errors))
+        self.stats.count('validation_warnings', len(report.warnings))
+        if report.issues:
+            print("Validation: " + "\n".join(report.summary_lines()))
+        if strict:
+            report.raise_if_errors()
+    
+    def _description_chars(self):
+        """Characters that fit in the template's description cell, or None if unknown"""
+        try:
+            reader = FastTemplateWriter.for_template(self.template_path)
+            layout = TemplateLayout.for_template(self.template_path, reader, START_ROW, MAX_ROWS_PER_INVOICE)
+            return layout.description_chars
+        except Exception as e:
+            print(f"Could not measure the description column: {str(e)}")
+            return None
+    
+    def _cached_columns(self, data_file):
+        """Columns of data_file from the data cache, or None on a miss"""
+        if self.data_cache is None:
+            return None
+        try:
+            columns = self.data_cache.get(data_file)
+        except Exception as e:
+            print(f"Could not read data cache: {str(e)}")
+            return None
+        
+        if columns is not None:
+            # Report the rows skipped when the file was parsed, as a fresh load would
+            for row, reason in columns['skipped']:
+                if reason == "not a number":
+                    print(f"Skipping row {row}: Could not convert quantity or unit price to number")
+        return columns
+    
+    def _columns_from_frame(self, df, line_rates=False):
+        """Coerce the first three columns in bulk and drop invalid rows with a mask
+        
+        With line_rates, a fourth column, if any, holds per-line TVA rates (NaN: the invoice rate);
+        rows whose rate is not a valid one are skipped like rows with an invalid number.
+        """
+        import numpy as np
+        import pandas as pd
+        import validation
+        from money import parse_rates
+        
+        raw = df.iloc[:, :3]
+        
+        # Rows where either description, quantity or price is missing
+        present = raw.notna().all(axis=1).to_numpy()
+        
+        # Convert quantity and unit price in one pass - invalid values become NaN
+        quantities = pd.to_numeric(raw.iloc[:, 1], errors='coerce').astype('float64').to_numpy()
+        unit_prices = pd.to_numeric(raw.iloc[:, 2], errors='coerce').astype('float64').to_numpy()
+        numeric = ~(np.isnan(quantities) | np.isnan(unit_prices))
+        
+        valid = present & numeric
+        
+        rates = None
+        if line_rates and df.shape[1] > 3:
+            rates, bad_rates = parse_rates(df.iloc[:, 3].to_numpy(dtype=object))
+            bad_rates &= valid
+            valid &= ~bad_rates
+        
+        # Report skipped rows the same way the row-by-row loader did
+        skipped = []
+        for idx in np.flatnonzero(~present):
+            skipped.append((int(idx) + 1, "missing value"))
+        for idx in np.flatnonzero(present & ~numeric):
+            print(f"Skipping row {idx+1}: Could not convert quantity or unit price to number")
+            skipped.append((int(idx) + 1, "not a number"))
+        if rates is not None:
+            for idx in np.flatnonzero(bad_rates):
+                print(f"Skipping row {idx+1}: Invalid TVA rate")
+                skipped.append((int(idx) + 1, "invalid TVA rate"))
+        skipped.sort()
+        
+        columns = {
+            'descriptions': raw.iloc[:, 0][valid].astype(str).to_numpy(dtype=object),
+            'quantities': quantities[valid],
+            'unit_prices': unit_prices[valid],
+            'rows': np.flatnonzero(valid),
+            'skipped': skipped
+        }
+        # Problems of the raw rows, reported together before anything is written
+        columns['issues'] = validation.check_frame(raw)
+        if rates is not None:
+            columns['tva_rates'] = rates[valid]
+            checked = present & numeric
+            columns['issues'] += validation.check_rates(df.iloc[:, 3].to_numpy(dtype=object)[checked],
+                                                        np.flatnonzero(checked) + 1)
+        return columns
+    
     def generate_invoice_id(self):
         """Generate a unique invoice ID in the format FA XXX/YYYY"""
+        return self.generate_invoice_ids(1)[0]
+    
+    def generate_invoice_ids(self, count):
+        """Reserve `count` consecutive invoice IDs and return them as (file ID, display ID) pairs"""
         # Get current year
         year = datetime.now().year
         
+        # The persistent counter hands out the numbers; the folder is only scanned to seed it
+        next_num = self._invoice_counter().reserve(count, year)
+        
+        # Format as 3-digit numbers and return both the file ID and the display ID
+        return [(f"{num:03d}", f"FA {num:03d}/{year}") for num in range(next_num, next_num + count)]
+    
+    def _invoice_counter(self):
+        """Invoice-number sequence stored in the output folder"""
+        return InvoiceCounter(self.output_folder, seed=self._last_invoice_number_on_disk)
+    
+    def _last_invoice_number_on_disk(self):
+        """Highest invoice number used by the files in the output folder (0 if none)"""
         # Look for existing invoice files in the output directory to determine the next number
         invoice_files = [f for f in os.listdir(self.output_folder) 
                         if f.startswith('invoice_') and f.endswith('.xlsx')]
         
-        if not invoice_files:
-            # No existing files, start with 001
-            next_num = 1
-        else:
-            # Extract numbers from existing files and find the max
-            nums = []
-            for f in invoice_files:
-                try:
-                    # Extract the number part from filenames like 'invoice_001.xlsx'
-                    num_part = f.replace('invoice_', '').replace('.xlsx', '')
-                    # Handle cases where there might be _1, _2 suffixes for multiple invoices
-                    if '_' in num_part:
-                        num_part = num_part.split('_')[0]
-                    nums.append(int(num_part))
-                except ValueError:
-                    continue
-            
-            next_num = max(nums) + 1 if nums else 1
+        # Extract numbers from existing files and find the max
+        nums = []
+        for f in invoice_files:
+            try:
+                # Extract the number part from filenames like 'invoice_001.xlsx'
+                num_part = f.replace('invoice_', '').replace('.xlsx', '')
+                # Handle cases where there might be _1, _2 suffixes for multiple invoices
+                if '_' in num_part:
+                    num_part = num_part.split('_')[0]
+                nums.append(int(num_part))
+            except ValueError:
+                continue
         
-        # Format as 3-digit number
-        formatted_num = f"{next_num:03d}"
-        
-        # Return both the file ID and the display ID
-        return formatted_num, f"FA {formatted_num}/{year}"
+        return max(nums) if nums else 0
     
-    def create_invoice(self, data_file, invoice_id=None, output_file=None, client_info=None):
+    def create_invoice(self, data_file, invoice_id=None, output_file=None, client_info=None, backend=None,
+                       workers=None, progress=None, cancel_event=None, stream=False, incremental=None,
+                       output_mode=None, tva_rate=None, rounding=None, strict=None, resume=None, duplicates=None):
+        """Generate the invoice file(s) for data_file and return the path (or list of paths)
+        
+        data_file is an Excel, CSV, Parquet or Arrow file, or line items given inline: a DataFrame,
+        or an iterable of dicts with 'description', 'quantity' and 'unit_price' (or of 3-tuples).
+        
+        With stream=True the data file (any format but legacy .xls) is read row by row and each batch
+        is written as soon as it is complete, so memory stays proportional to one batch instead of
+        the whole file.
+        
+        progress, if given, is called after every written invoice with a dict holding 'batch',
+        'batches', 'rows', 'total_rows', 'rows_per_second' and 'eta' (seconds, or None).
+        Setting cancel_event (a threading.Event) stops the run after the current invoice.
+        
+        With incremental=True, invoice files whose line items, client info, template and number are
+        the same as in the last run are left untouched (they are still returned), and a data file
+        generated without an explicit invoice_id keeps the number it received the first time, as
+        long as its client and template are unchanged (resume=False takes a new number).
+        
+        output_mode "workbook" writes every invoice of the job as a sheet (or PDF page) of one file,
+        and "zip" packs the per-invoice files into one archive without writing them separately; the
+        path of that single file is returned. Incremental mode only applies to "files".
+        
+        tva_rate and rounding override the generator's for this call. Totals are computed in
+        centimes by money.py, and always written with the formulas when rounding is not the
+        default or when lines have their own rates.
+        
+        The line items are validated before any file is written; generator.last_validation holds
+        the report. With strict=True (or generator.strict_validation) a job with errors raises
+        validation.ValidationError and writes nothing.
+        
+        Every invoice file is written to a hidden temporary file, flushed to disk and renamed into
+        place, so a crash never leaves a truncated invoice. With resume=True (generator.resume, the
+        default), a data file whose previous run was interrupted resumes it: same invoice number and
+        date, and only the invoices not written yet are rendered.
+        
+        Every invoice written is added to the archive index of the output folder (see
+        search_invoices). duplicates ("off", "warn" or "error", generator.duplicates by default) says
+        what to do with invoices identical to an indexed one; with "error" nothing is written, except
+        in streaming mode where the invoices are only checked as they are read.
+        """
     
+        self.stats = stats = RunStats(self.stats_sink)
+        manifest = None
+        journal = None
+        index = None
+        # A number taken from the counter for this call is given back if no invoice gets written
+        reserved = None
+        remember_id = False
+        generated_invoices = []
+        
         try:
+            # Use the generator's writer backend unless one is given for this call
+            backend = backend or self.backend
+            if backend not in BACKENDS:
+                raise ValueError(f"Moteur d'écriture inconnu: {backend}")
+            if backend == 'pdf':
+                from pdf_renderer import require_reportlab
+                require_reportlab()
+            
+            workers = self.workers if workers is None else workers
+            incremental = self.incremental if incremental is None else incremental
+            output_mode = output_mode or self.output_mode
+            if output_mode not in OUTPUT_MODES:
+                raise ValueError(f"Mode de sortie inconnu: {output_mode}")
+            tva_rate, rounding = self._pricing(tva_rate, rounding)
+            strict = self.strict_validation if strict is None else strict
+            resume = self.resume if resume is None else resume
+            duplicates = self._duplicate_check(duplicates)
+            self.last_validation = None
+            self.last_duplicates = []
+            
             # Check if template exists
             if not os.path.exists(self.template_path):
                 raise FileNotFoundError(f"Le fichier modèle n'existe pas: {self.template_path}")
                     
+            # Line items passed inline instead of a data file
+            inline = not isinstance(data_file, (str, os.PathLike))
+            
             # Check if data file exists
-            if not os.path.exists(data_file):
+            if not inline and not os.path.exists(data_file):
                 raise FileNotFoundError(f"Le fichier de données n'existe pas: {data_file}")
             
-            # Load data without auto-calculating
-            data = self.load_data(data_file)
+            # Streaming reads row by row; legacy .xls files can only be loaded whole
+            streaming = stream and not inline and os.path.splitext(data_file)[1].lower() != '.xls'
             
-            # Get total number of items
-            total_items = len(data['line_items'])
+            with stats.stage('load'):
+                if streaming:
+                    # Counting pass: the "Facture i/n" headers and file suffixes need n up front
+                    total_items, issues = self._scan_stream(data_file)
+                elif inline:
+                    data = self.columns_from_items(data_file)
+                    total_items = len(data['descriptions'])
+                    stats.count('skipped_rows', len(data['skipped']))
+                else:
+                    # Load data without auto-calculating
+                    data = self.load_columns(data_file)
+                    total_items = len(data['descriptions'])
+                    stats.count('skipped_rows', len(data['skipped']))
+            stats.count('rows', total_items)
             
-            # Set max rows per invoice to match your template
-            max_rows_per_invoice = 23  # Adjusted to match your 23-row template
+            # Every problem of the data at once, before the first file is opened
+            with stats.stage('validate'):
+                report = self._validation_report(None, issues) if streaming else self._validation_report(data)
+                self._check_data(report, strict)
             
-            # Calculate how many invoices we need
-            num_invoices = (total_items + max_rows_per_invoice - 1) // max_rows_per_invoice
+            if not total_items:
+                # No number is taken for a job without a single invoice
+                print("No line items to invoice")
+                return []
             
-            # Store all generated invoice paths
-            generated_invoices = []
+            if incremental and output_mode == 'files':
+                manifest = InvoiceManifest(self.output_folder, self.template_path)
             
-            # Generate invoice ID if not provided
-            initial_file_id, initial_display_id = self.generate_invoice_id() if invoice_id is None else (invoice_id, f"FA {invoice_id}/{datetime.now().year}")
-            file_id = initial_file_id
+            if resume and output_mode == 'files' and not inline:
+                journal = RunJournal(self.output_folder, data_file, self._job_fingerprint(
+                    data_file, invoice_id, output_file, client_info, backend, tva_rate, rounding
+                ))
             
-            # Define start_row here so it's available in all scopes
-            start_row = 12  # First row of items
+            index = self._open_index()
             
-            # Process each batch of items
-            for invoice_index in range(num_invoices):
-                # Calculate the start and end indices for this invoice
-                start_idx = invoice_index * max_rows_per_invoice
-                end_idx = min((invoice_index + 1) * max_rows_per_invoice, total_items)
-                
-                # Get items for this invoice
-                invoice_items = data['line_items'][start_idx:end_idx]
-                
-                # Set the output filename for this invoice
-                if output_file is None:
-                    # If multiple invoices, append a suffix to the filename
-                    if num_invoices > 1:
-                        current_file_id = f"{file_id}_{invoice_index + 1}"
-                        current_display_id = f"{initial_display_id}_{invoice_index + 1}"
-                    else:
-                        current_file_id = file_id
-                        current_display_id = initial_display_id
-                    
-                    current_output_file = os.path.join(self.output_folder, f"invoice_{current_file_id}.xlsx")
+            with stats.stage('invoice_id'):
+                # Generate invoice ID if not provided - an interrupted run or an incremental re-run keeps the previous one
+                remember_id = manifest is not None and invoice_id is None and not inline
+                if remember_id:
+                    # The number belongs to the job (data file, client, template): edited line items keep it and
+                    # only their files are rendered again; another client or template, or a restart, gets a new one
+                    job_fingerprint = manifest.job_fingerprint(client_info)
+                previous_id = manifest.invoice_id_for(data_file, job_fingerprint) if remember_id and resume else None
+                if journal is not None and journal.resuming:
+                    file_id, display_id = journal.job['file_id'], journal.job['display_id']
+                    print(f"Resuming the interrupted run of {data_file}: {len(journal.done)} invoice(s) already written")
+                elif previous_id:
+                    file_id, display_id = previous_id
                 else:
-                    # If output_file was specified but we have multiple invoices, add suffix
-                    if num_invoices > 1:
-                        base, ext = os.path.splitext(output_file)
-                        current_output_file = f"{base}_{invoice_index + 1}{ext}"
-                        current_display_id = f"{initial_display_id}_{invoice_index + 1}"
-                    else:
-                        current_output_file = output_file
-                        current_display_id = initial_display_id
-                
-                # Make sure output directory exists
-                os.makedirs(os.path.dirname(current_output_file), exist_ok=True)
-                
-                # Copy the template file directly - safest approach
-                import shutil
-                shutil.copy2(self.template_path, current_output_file)
-                
-                # Open the workbook and try a more direct approach
-                import openpyxl
-                workbook = openpyxl.load_workbook(current_output_file)
-                sheet = workbook.active
-                
-                # Define direct cell references instead of trying to access merged cells
-                
-                # Set invoice number and date - direct references
-                if 'E3' in sheet:
-                    sheet['E3'].value = current_display_id
-                
-                if 'I3' in sheet:
-                    sheet['I3'].value = datetime.now().strftime("%d/%m/%Y")
-                
-                # Set client info if provided - direct references
-                if client_info:
-                    if 'name' in client_info and 'H5' in sheet:
-                        sheet['H5'].value = client_info['name']
-                    if 'address' in client_info and 'H7' in sheet:
-                        sheet['H7'].value = client_info['address']
-                    if 'ice' in client_info and 'H9' in sheet:
-                        sheet['H9'].value = client_info['ice']
+                    file_id, display_id = self.generate_invoice_id() if invoice_id is None else (invoice_id, f"FA {invoice_id}/{datetime.now().year}")
+                    if invoice_id is None:
+                        reserved = int(file_id)
+                    if remember_id:
+                        manifest.remember_invoice_id(data_file, file_id, display_id, job_fingerprint)
                 
-                # Fill in items using explicit cell references
-                for idx, item in enumerate(invoice_items):
-                    row = start_row + idx
-                    
-                    # Description - try both A and B columns (since it might be a merged range)
-                    try:
-                        sheet.cell(row=row, column=1).value = item['description']
-                    except:
-                        try:
-                            # Try the first cell in another column in case it's part of the merge
-                            sheet.cell(row=row, column=2).value = item['description']
-                        except:
-                            print(f"Could not set description for row {row}")
-                    
-                    # Quantity (column H)
-                    try:
-                        sheet.cell(row=row, column=8).value = round(item['quantity'], 2)
-                    except:
-                        print(f"Could not set quantity for row {row}")
-                        
-                    # Unit price (column I)
-                    try:
-                        sheet.cell(row=row, column=9).value = round(item['unit_price'], 2)
-                    except:
-                        print(f"Could not set unit price for row {row}")
-                    
-                    # Calculate total for this row (quantity * unit price) - column J
-                    try:
-                        cell = sheet.cell(row=row, column=10)
-                        cell.value = f"=H{row}*I{row}"
-                    except:
-                        print(f"Could not set total formula for row {row}")
-                
-                # Clear unnecessary zeros in rows 35 and 36 column J 
-                try:
-                    # Clear row 35 if it has a zero
-                    cell_35 = sheet.cell(row=35, column=10)
-                    if cell_35.value == 0 or cell_35.value == "0":
-                        cell_35.value = None
-                    
-                    # Clear row 36 if it has a zero  
-                    cell_36 = sheet.cell(row=36, column=10)
-                    if cell_36.value == 0 or cell_36.value == "0":
-                        cell_36.value = None
-                except:
-                    print("Could not clear zero values in rows 35/36")
-                
-                # Find the proper total cells - these should be in a separate table below
-                # Identify them by checking columns G, H, or I for labels like "Total HT", "TVA", etc.
-                total_ht_row = None
-                tva_row = None
-                total_ttc_row = None
-                
-                # Search for the total cells by looking for their labels
-                for row in range(37, 45):  # Check rows after the main table
-                    for col in range(7, 10):  # Check columns G, H, I
-                        cell_value = sheet.cell(row=row, column=col).value
-                        if cell_value and isinstance(cell_value, str):
-                            cell_text = cell_value.lower()
-                            if "total ht" in cell_text:
-                                total_ht_row = row
-                            elif "tva" in cell_text:
-                                tva_row = row
-                            elif "ttc" in cell_text or "total ttc" in cell_text:
-                                total_ttc_row = row
-                
-                # If we found the total cells, update their formulas
-                if total_ht_row:
-                    try:
-                        subtotal_range = f"J{start_row}:J{start_row + len(invoice_items) - 1}"
-                        sheet.cell(row=total_ht_row, column=10).value = f"=SUM({subtotal_range})"
-                        print(f"Set Total HT formula in row {total_ht_row}")
-                    except:
-                        print(f"Could not set Total HT formula")
-                
-                if tva_row and total_ht_row:
-                    try:
-                        sheet.cell(row=tva_row, column=10).value = f"=J{total_ht_row}*0.2"
-                        print(f"Set TVA formula in row {tva_row}")
-                    except:
-                        print(f"Could not set TVA formula")
-                
-                if total_ttc_row and total_ht_row and tva_row:
-                    try:
-                        sheet.cell(row=total_ttc_row, column=10).value = f"=J{total_ht_row}+J{tva_row}"
-                        print(f"Set Total TTC formula in row {total_ttc_row}")
-                    except:
-                        print(f"Could not set Total TTC formula")
-                
-                # If we couldn't find the total rows, try using hardcoded values based on your template
-                if not total_ht_row:
-                    # Assume the totals are at fixed positions based on your template structure
-                    try:
-                        # Common positions for totals - adjust based on your template
-                        subtotal_range = f"J{start_row}:J{start_row + len(invoice_items) - 1}"
-                        
-                        # Try to find cells that contain "total ht", "tva", etc.
-                        found = False
-                        for row in range(35, 45):
-                            if found:
-                                break
-                            for col in range(5, 10):
-                                cell_value = sheet.cell(row=row, column=col).value
-                                if cell_value and isinstance(cell_value, str) and "total" in cell_value.lower():
-                                    # Found a total row, assume it's the start of the totals section
-                                    sheet.cell(row=row, column=10).value = f"=SUM({subtotal_range})"
-                                    sheet.cell(row=row+1, column=10).value = f"=J{row}*0.2"
-                                    sheet.cell(row=row+2, column=10).value = f"=J{row}+J{row+1}"
-                                    found = True
-                                    break
-                    except:
-                        print("Could not set totals with fallback method")
-                
-                # If this is not the first invoice, add note about it being a continuation
-                if invoice_index > 0:
-                    try:
-                        note_cell = sheet.cell(row=start_row - 2, column=1)
-                        note_cell.value = f"Suite de la facture {initial_display_id}"
-                        note_cell.font = Font(bold=True)
-                    except:
-                        print("Could not set continuation note")
-                    
-                    try:
-                        continuation_cell = sheet.cell(row=3, column=1)
-                        continuation_cell.value = f"Facture {invoice_index + 1}/{num_invoices}"
-                        continuation_cell.font = Font(bold=True)
-                    except:
-                        print("Could not set continuation header")
-                        
-                elif num_invoices > 1:
-                    try:
-                        multi_invoice_cell = sheet.cell(row=3, column=1)
-                        multi_invoice_cell.value = f"Facture 1/{num_invoices}"
-                        multi_invoice_cell.font = Font(bold=True)
-                    except:
-                        print("Could not set multi-invoice header")
-                
-                # Save the workbook
-                try:
-                    workbook.save(current_output_file)
-                except Exception as e:
-                    print(f"Error saving workbook: {str(e)}")
-                    # If we can't save, try to create a new file with the data
-                    self._write_fallback_file(current_output_file, invoice_items, current_display_id, client_info)
-                
-                # Add to the list of generated invoices
-                generated_invoices.append(current_output_file)
+                # A number typed by hand must not be handed out again by the counter
+                if invoice_id is not None and str(invoice_id).isdigit():
+                    self._invoice_counter().observe(int(invoice_id))
+            
+            invoice_date = datetime.now().strftime("%d/%m/%Y")
+            if journal is not None and journal.resuming:
+                # A resumed job keeps the date its first invoices were written with
+                invoice_date = journal.job['date']
+            
+            if streaming:
+                # Batches are read from the sheet as the writer consumes them
+                num_invoices = (total_items + MAX_ROWS_PER_INVOICE - 1) // MAX_ROWS_PER_INVOICE
+                batches = self._stream_batches(
+                    data_file, num_invoices, file_id, display_id, output_file, client_info, invoice_date,
+                    tva_rate, rounding
+                )
+            else:
+                # Describe every invoice up front so the batches can be rendered independently
+                with stats.stage('plan'):
+                    batches = self._plan_batches(data, file_id, display_id, output_file, client_info, invoice_date,
+                                                 tva_rate, rounding)
+                num_invoices = len(batches)
+            
+            if index is not None and duplicates != 'off':
+                batches = self._check_duplicates(index, batches, duplicates)
+            
+            if journal is not None:
+                journal.start(file_id, display_id, invoice_date)
+            
+            if output_mode == 'files':
+                # Render the batches, one after another or on a process pool
+                generated_invoices = self._render_batches(
+                    batches, backend, workers, progress, cancel_event, num_invoices, total_items, manifest,
+                    journal=journal, index=index
+                )
+                if journal is not None and not self.cancelled and not self.last_errors:
+                    journal.finish()
+                if manifest is not None and not self.cancelled:
+                    self._report_orphans(manifest, display_id, generated_invoices)
+            else:
+                # A single file for the whole job
+                job_file = self._job_output_file(output_file, file_id, backend, output_mode)
+                generated_invoices = self._render_job_file(
+                    batches, backend, workers, job_file, output_mode, progress, cancel_event, num_invoices, total_items,
+                    index
+                )
+                if index is not None:
+                    index.commit()
             
             # Return the paths of all generated invoices
             if len(generated_invoices) == 1:
@@ -353,81 +578,1097 @@ class InvoiceGenerator:
             print(f"Error creating invoice: {str(e)}")
             raise
         
-def _write_fallback_file(self, output_file, line_items, invoice_id, client_info=None):
-    """Fallback method to write data to a new Excel file if we can't modify the template"""
-    import openpyxl
-    from openpyxl.styles import Font, Alignment, Border, Side
+        finally:
+            if journal is not None:
+                journal.close()
+            
+            # Refused, cancelled before the first invoice or failed on every one: no gap in the numbering
+            nothing_written = not stats.counters.get('invoices') if output_mode == 'files' else not generated_invoices
+            if reserved is not None and nothing_written:
+                self._invoice_counter().release(reserved)
+                if journal is not None:
+                    journal.finish()
+                if remember_id:
+                    manifest.forget_invoice_id(data_file)
+            
+            # Keep the fingerprints of whatever was written, even if the run stopped early
+            if manifest is not None:
+                manifest.save()
+            if index is not None:
+                # Files already in place stay indexed even if the run stopped early; a job file only once written
+                if output_mode == 'files':
+                    index.commit()
+                index.close()
+            stats.finish()
     
-    # Create a new workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
+    def create_client_invoices(self, master_file, columns=None, backend=None, workers=None,
+                               progress=None, cancel_event=None):
+        """Generate the invoices of every client listed in one master workbook
+        
+        Each row of the master file holds a client (name, address, ICE) and one line item;
+        `columns` overrides the positions in MASTER_COLUMNS. progress and cancel_event work as in
+        create_invoice. Returns one entry per client: {'client_info': ..., 'invoice_id': ..., 'files': [...]}.
+        """
+        import numpy as np
+        import pandas as pd
+        
+        start_time = time.perf_counter()
+        self.stats = stats = RunStats(self.stats_sink)
+        index = None
+        invoice_ids = []
+        
+        try:
+            backend = backend or self.backend
+            if backend not in BACKENDS:
+                raise ValueError(f"Moteur d'écriture inconnu: {backend}")
+            if backend == 'pdf':
+                from pdf_renderer import require_reportlab
+                require_reportlab()
+            
+            workers = self.workers if workers is None else workers
+            tva_rate, rounding = self._pricing()
+            duplicates = self._duplicate_check()
+            self.last_duplicates = []
+            columns = dict(MASTER_COLUMNS, **(columns or {}))
+            
+            if not os.path.exists(self.template_path):
+                raise FileNotFoundError(f"Le fichier modèle n'existe pas: {self.template_path}")
+            
+            if not os.path.exists(master_file):
+                raise FileNotFoundError(f"Le fichier de données n'existe pas: {master_file}")
+            
+            # Load the master file once for every client
+            with stats.stage('load'):
+                df = pd.read_excel(master_file, header=None)
+                if df.shape[1] <= max(columns.values()):
+                    raise ValueError("Fichier incorrect: colonnes insuffisantes")
+                
+                data = self._columns_from_frame(
+                    df.iloc[:, [columns['description'], columns['quantity'], columns['unit_price']]]
+                )
+            stats.count('rows', len(data['descriptions']))
+            stats.count('skipped_rows', len(data['skipped']))
+            
+            with stats.stage('validate'):
+                self._check_data(self._validation_report(data), self.strict_validation)
+            
+            # Group the valid rows by client in a single pass, in order of first appearance
+            clients = df.iloc[data['rows'], [columns['name'], columns['address'], columns['ice']]]
+            group_ids = clients.groupby(list(clients.columns), sort=False, dropna=False).ngroup().to_numpy()
+            order = np.argsort(group_ids, kind='stable')
+            bounds = np.concatenate(([0], np.cumsum(np.bincount(group_ids)))) if len(group_ids) else [0]
+            
+            # One invoice number per client, allocated as a block
+            with stats.stage('invoice_id'):
+                invoice_ids = self.generate_invoice_ids(len(bounds) - 1)
+            stats.count('clients', len(bounds) - 1)
+            invoice_date = datetime.now().strftime("%d/%m/%Y")
+            
+            batches = []
+            results = []
+            for group, (file_id, display_id) in enumerate(invoice_ids):
+                rows = order[bounds[group]:bounds[group + 1]]
+                
+                # Client fields come from the first row of the group; empty fields are left out
+                client_info = {}
+                for field, value in zip(('name', 'address', 'ice'), clients.iloc[rows[0]]):
+                    if pd.notna(value) and str(value).strip():
+                        client_info[field] = _cell_text(value)
+                
+                client_data = {
+                    'descriptions': data['descriptions'][rows],
+                    'quantities': data['quantities'][rows],
+                    'unit_prices': data['unit_prices'][rows]
+                }
+                client_batches = self._plan_batches(client_data, file_id, display_id, None, client_info, invoice_date,
+                                                    tva_rate, rounding)
+                batches.extend(client_batches)
+                results.append({
+                    'client_info': client_info,
+                    'invoice_id': display_id,
+                    'files': [batch['output_file'] for batch in client_batches]
+                })
+            
+            index = self._open_index()
+            if index is not None and duplicates != 'off':
+                self._check_duplicates(index, batches, duplicates)
+            
+            # Render every client's invoices through the same pipeline
+            generated = set(self._render_batches(batches, backend, workers, progress, cancel_event, index=index))
+            for result in results:
+                result['files'] = [path for path in result['files'] if path in generated]
+            
+            # Summary report
+            elapsed = time.perf_counter() - start_time
+            print(f"Master file: {master_file}")
+            print(f"  Clients:          {len(results)}")
+            print(f"  Line items:       {len(data['descriptions'])}")
+            print(f"  Skipped rows:     {len(data['skipped'])}")
+            print(f"  Invoice files:    {len(generated)}")
+            print(f"  Failed batches:   {len(self.last_errors)}")
+            print(f"  Elapsed:          {elapsed:.2f}s")
+            
+            return results
+        
+        except Exception as e:
+            print(f"Error creating client invoices: {str(e)}")
+            raise
+        
+        finally:
+            if index is not None:
+                index.commit()
+                index.close()
+            # The block of numbers is given back when no invoice at all was written
+            if invoice_ids and not stats.counters.get('invoices'):
+                self._invoice_counter().release(int(invoice_ids[0][0]), len(invoice_ids))
+            stats.finish()
     
-    # Set header information
-    ws['A1'] = "FACTURE"
-    ws['A1'].font = Font(bold=True, size=16)
+    def search_invoices(self, text=None, **criteria):
+        """Invoices of the output folder's archive index matching text and criteria, most recent first
+        
+        criteria are those of InvoiceIndex.search: client, ice, display_id, date_from, date_to, limit.
+        Each result is a dict with the file, number, client, date, descriptions and totals.
+        """
+        from invoice_index import InvoiceIndex
+        
+        index = InvoiceIndex(self.output_folder)
+        try:
+            return index.search(text, **criteria)
+        finally:
+            index.close()
     
-    ws['A3'] = "Facture N°:"
-    ws['B3'] = invoice_id
-    ws['B3'].font = Font(bold=True)
+    def _duplicate_check(self, duplicates=None):
+        from invoice_index import DUPLICATE_CHECKS
+        
+        duplicates = duplicates or self.duplicates
+        if duplicates not in DUPLICATE_CHECKS:
+            raise ValueError(f"Contrôle des doublons inconnu: {duplicates}")
+        return duplicates
     
-    ws['A4'] = "Date:"
-    ws['B4'] = datetime.now().strftime("%d/%m/%Y")
+    def _open_index(self):
+        """Archive index of the output folder, or None when it is disabled or cannot be opened"""
+        if not self.archive_index:
+            return None
+        import sqlite3
+        from invoice_index import InvoiceIndex
+        
+        try:
+            return InvoiceIndex(self.output_folder)
+        except sqlite3.Error as e:
+            # The index is a convenience; the invoices are written without it
+            print(f"Invoice index unavailable: {str(e)}")
+            return None
     
-    # Set client info if provided
+    def _check_duplicates(self, index, batches, duplicates):
+        """Look the batches up in the archive index before they are written; returns the batches
+        
+        A list is checked as a whole, so with duplicates="error" nothing is written; a stream of
+        batches is checked one batch at a time, as the batches are read.
+        """
+        from invoice_index import DuplicateInvoiceError
+        
+        if not isinstance(batches, list):
+            return (self._check_duplicates(index, [batch], duplicates)[0] for batch in batches)
+        
+        found = []
+        for batch in batches:
+            matches = index.find_duplicates(batch)
+            if matches:
+                found.append({'display_id': batch['display_id'], 'output_file': batch['output_file'], 'matches': matches})
+        
+        if found:
+            self.last_duplicates.extend(found)
+            self.stats.count('duplicates', len(found))
+            if duplicates == 'error':
+                raise DuplicateInvoiceError(found)
+            for duplicate in found:
+                previous = ", ".join(f"{match['display_id']} ({match['file']})" for match in duplicate['matches'])
+                print(f"Warning: invoice {duplicate['display_id']} has the same client and line items as {previous}")
+        return batches
+    
+    def _report_orphans(self, manifest, initial_display_id, generated_invoices):
+        """Warn about files of this number left over from an earlier, longer split, and drop them from the manifest
+        
+        The files themselves are kept: they may be invoices that were already sent.
+        """
+        for path in manifest.orphans(initial_display_id, generated_invoices):
+            manifest.forget(path)
+            if os.path.exists(path):
+                self.stats.count('orphaned_files')
+                print(f"Warning: {path} belongs to an earlier run of {initial_display_id} and was not rewritten")
+    
+    def _job_fingerprint(self, data_file, invoice_id, output_file, client_info, backend, tva_rate, rounding):
+        """What the files of a job depend on; an interrupted run is only resumed when all of it is unchanged"""
+        stat = os.stat(data_file)
+        return {
+            'data': [stat.st_mtime_ns, stat.st_size],
+            'template': template_hash(self.template_path),
+            'invoice_id': invoice_id,
+            'output_file': output_file and os.path.abspath(output_file),
+            'client': client_info or {},
+            'backend': backend,
+            'pricing': [tva_rate, rounding, self.cached_totals, self.line_rates],
+            'rows_per_invoice': MAX_ROWS_PER_INVOICE
+        }
+    
+    def _plan_batches(self, data, file_id, initial_display_id, output_file, client_info, invoice_date,
+                      tva_rate=None, rounding=None):
+        """Split the line items into one batch per output file, with its file name and headers"""
+        from line_items import LineItemTable
+        
+        tva_rate, rounding = self._pricing(tva_rate, rounding)
+        line_rates = self._line_rates(data.get('tva_rates'), tva_rate)
+        
+        # One table for the whole job; each batch gets a view of its rows, not a copy
+        table = LineItemTable.from_columns(data['descriptions'], data['quantities'], data['unit_prices'], line_rates)
+        
+        # Calculate how many invoices we need
+        num_invoices = (len(table) + MAX_ROWS_PER_INVOICE - 1) // MAX_ROWS_PER_INVOICE
+        
+        # Totals of every batch in one vectorized pass
+        totals = None
+        if self._computes_totals(rounding, line_rates):
+            totals = self._batch_totals(table.quantities, table.unit_prices, tva_rate, rounding, line_rates)
+        
+        # Describe every invoice up front so the batches can be rendered independently
+        batches = []
+        
+        # Process each batch of items
+        for invoice_index, invoice_items in enumerate(table.batches(MAX_ROWS_PER_INVOICE)):
+            batches.append(self._describe_batch(
+                invoice_index, num_invoices, invoice_items, file_id, initial_display_id,
+                output_file, client_info, invoice_date, totals[invoice_index] if totals else None,
+                tva_rate, rounding
+            ))
+        
+        return batches
+    
+    def _pricing(self, tva_rate=None, rounding=None):
+        """Validated (TVA rate, rounding mode) of a job: the ones given, else the generator's"""
+        import money
+        
+        tva_rate = money.check_rate(self.tva_rate if tva_rate is None else tva_rate)
+        return tva_rate, money.check_rounding(rounding or self.rounding)
+    
+    def _line_rates(self, rates, tva_rate):
+        """Per-line TVA rates with the invoice rate filled in, or None when every line uses it"""
+        import numpy as np
+        import money
+        
+        if rates is None or not len(rates):
+            return None
+        rates = np.where(np.isnan(rates), tva_rate, rates)
+        for rate in np.unique(rates).tolist():
+            money.check_rate(rate)
+        return None if (rates == tva_rate).all() else rates
+    
+    def _computes_totals(self, rounding, line_rates):
+        """Whether a job's totals are computed: asked for, or needed for its rounding or mixed rates"""
+        return self.cached_totals or rounding != "half_up" or line_rates is not None
+    
+    def _batch_totals(self, quantities, unit_prices, tva_rate=None, rounding="half_up", line_rates=None):
+        """Line totals, Total HT, TVA and TTC of each batch of MAX_ROWS_PER_INVOICE items"""
+        import money
+        
+        # Quantities and prices are written rounded to two decimals; the totals must match them
+        tva_rate = self.tva_rate if tva_rate is None else tva_rate
+        return money.invoice_totals(quantities, unit_prices, MAX_ROWS_PER_INVOICE, tva_rate, rounding, line_rates)
+    
+    def _describe_batch(self, invoice_index, num_invoices, invoice_items, file_id, initial_display_id,
+                        output_file, client_info, invoice_date, totals=None, tva_rate=None, rounding="half_up"):
+        """Everything a worker needs to render one invoice on its own: file name, IDs, headers and items"""
+        # Set the output filename for this invoice
+        if output_file is None:
+            # If multiple invoices, append a suffix to the filename
+            if num_invoices > 1:
+                current_file_id = f"{file_id}_{invoice_index + 1}"
+                current_display_id = f"{initial_display_id}_{invoice_index + 1}"
+            else:
+                current_file_id = file_id
+                current_display_id = initial_display_id
+            
+            current_output_file = os.path.join(self.output_folder, f"invoice_{current_file_id}.xlsx")
+        else:
+            # If output_file was specified but we have multiple invoices, add suffix
+            if num_invoices > 1:
+                base, ext = os.path.splitext(output_file)
+                current_output_file = f"{base}_{invoice_index + 1}{ext}"
+                current_display_id = f"{initial_display_id}_{invoice_index + 1}"
+            else:
+                current_output_file = output_file
+                current_display_id = initial_display_id
+        
+        # Make sure output directory exists
+        os.makedirs(os.path.dirname(current_output_file), exist_ok=True)
+        
+        return {
+            'output_file': current_output_file,
+            'display_id': current_display_id,
+            'initial_display_id': initial_display_id,
+            'items': invoice_items,
+            'client_info': client_info,
+            'invoice_index': invoice_index,
+            'num_invoices': num_invoices,
+            'start_row': START_ROW,
+            'date': invoice_date,
+            'totals': totals,
+            'tva_rate': self.tva_rate if tva_rate is None else tva_rate,
+            'rounding': rounding
+        }
+    
+    def iter_line_items(self, data_file, report_skipped=True):
+        """Stream (description, quantity, unit price) from a data file row by row
+        
+        .xlsx files are read with openpyxl in read-only mode so only the current row is held in
+        memory; CSV files are parsed in chunks and Parquet / Arrow files one record batch at a time.
+        With line_rates, each row also has its TVA rate (NaN: the invoice rate).
+        """
+        yield from self._valid_rows(self._raw_rows(data_file), report_skipped)
+    
+    def _raw_rows(self, data_file):
+        """Rows of a data file as read, before any check or conversion"""
+        if input_adapters.detect_format(data_file) != 'excel':
+            yield from input_adapters.iter_rows(data_file)
+            return
+        
+        import openpyxl
+        
+        workbook = openpyxl.load_workbook(data_file, read_only=True, data_only=True)
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    
+    def _scan_stream(self, data_file, chunk_rows=10000):
+        """Counting pass of a streamed job: (valid rows, validation issues)
+        
+        The rows are validated chunk by chunk with the same vectorized checks as a loaded file.
+        """
+        import numpy as np
+        import pandas as pd
+        import validation
+        
+        description_chars = self._description_chars()
+        issues = []
+        chunk = []
+        first_row = 1
+        row_number = 0
+        
+        width = 4 if self.line_rates else 3
+        
+        def check():
+            frame = pd.DataFrame([tuple(row[:width]) + (None,) * (width - len(row)) for row in chunk],
+                                 columns=range(width))
+            issues.extend(validation.check_frame(frame, first_row))
+            present = frame.iloc[:, :3].notna().all(axis=1).to_numpy()
+            issues.extend(validation.check_descriptions(
+                frame[0][present].to_numpy(), np.flatnonzero(present) + first_row, description_chars
+            ))
+            if self.line_rates:
+                numeric = present & pd.to_numeric(frame[1], errors='coerce').notna().to_numpy() \
+                    & pd.to_numeric(frame[2], errors='coerce').notna().to_numpy()
+                issues.extend(validation.check_rates(frame[3][numeric].to_numpy(dtype=object),
+                                                     np.flatnonzero(numeric) + first_row))
+        
+        def rows():
+            nonlocal chunk, first_row, row_number
+            for row in self._raw_rows(data_file):
+                row_number += 1
+                chunk.append(row)
+                if len(chunk) == chunk_rows:
+                    check()
+                    first_row += len(chunk)
+                    chunk = []
+                yield row
+            if chunk:
+                check()
+        
+        # Rows are counted as _valid_rows converts them, so n matches the batches written later
+        count = 0
+        excess_row = None
+        for _ in self._valid_rows(rows(), report_skipped=False):
+            count += 1
+            if count == (self.max_rows or 0) + 1:
+                # _valid_rows yields each row as soon as it is read: row_number is that row
+                excess_row = row_number
+        issues.extend(validation.check_row_count(count, self.max_rows, excess_row))
+        return count, issues
+    
+    def _valid_rows(self, rows, report_skipped=True):
+        """Convert raw rows to (description, quantity, unit price), skipping incomplete or invalid ones
+        
+        With line_rates the TVA rate of the row follows (NaN: the invoice rate).
+        """
+        from money import rate_value
+        
+        for idx, row in enumerate(rows):
+            rate = row[3] if self.line_rates and len(row) > 3 else None
+            row = tuple(row[:3]) + (None,) * (3 - len(row))
+            
+            # Skip rows where either description, quantity or price is missing (None, or NaN from pandas)
+            if any(value is None or value != value for value in row):
+                continue
+            try:
+                item = str(row[0]), float(row[1]), float(row[2])
+            except (ValueError, TypeError):
+                # Skip rows where conversion to float fails
+                if report_skipped:
+                    print(f"Skipping row {idx+1}: Could not convert quantity or unit price to number")
+                continue
+            if not self.line_rates:
+                yield item
+                continue
+            try:
+                yield item + (rate_value(rate),)
+            except ValueError:
+                if report_skipped:
+                    print(f"Skipping row {idx+1}: Invalid TVA rate")
+    
+    def _stream_batches(self, data_file, num_invoices, file_id, initial_display_id, output_file, client_info,
+                        invoice_date, tva_rate=None, rounding="half_up"):
+        """Yield the batches of data_file one at a time, reading the sheet as they are consumed"""
+        from line_items import LineItemTable
+        
+        tva_rate, rounding = self._pricing(tva_rate, rounding)
+        
+        def table(rows):
+            invoice_items = LineItemTable.from_items(rows)
+            invoice_items.tva_rates = self._line_rates(invoice_items.tva_rates, tva_rate)
+            return invoice_items
+        
+        rows = []
+        invoice_index = 0
+        for row in self.iter_line_items(data_file):
+            rows.append(row)
+            if len(rows) == MAX_ROWS_PER_INVOICE:
+                invoice_items = table(rows)
+                yield self._describe_batch(invoice_index, num_invoices, invoice_items, file_id,
+                                           initial_display_id, output_file, client_info, invoice_date,
+                                           self._streamed_totals(invoice_items, tva_rate, rounding),
+                                           tva_rate, rounding)
+                rows = []
+                invoice_index += 1
+        
+        if rows:
+            invoice_items = table(rows)
+            yield self._describe_batch(invoice_index, num_invoices, invoice_items, file_id,
+                                       initial_display_id, output_file, client_info, invoice_date,
+                                       self._streamed_totals(invoice_items, tva_rate, rounding),
+                                       tva_rate, rounding)
+    
+    def _streamed_totals(self, invoice_items, tva_rate=None, rounding="half_up"):
+        """Totals of one streamed batch, or None when they are not computed"""
+        if not self._computes_totals(rounding, invoice_items.tva_rates):
+            return None
+        return self._batch_totals(invoice_items.quantities, invoice_items.unit_prices, tva_rate, rounding,
+                                  invoice_items.tva_rates)[0]
+    
+    def _job_output_file(self, output_file, file_id, backend, output_mode):
+        """Path of the single file a "workbook" or "zip" job writes"""
+        if output_mode == 'zip':
+            extension = ".zip"
+        else:
+            extension = ".pdf" if backend == 'pdf' else ".xlsx"
+        
+        if output_file is None:
+            job_file = os.path.join(self.output_folder, f"invoice_{file_id}{extension}")
+        else:
+            job_file = os.path.splitext(output_file)[0] + extension
+        
+        os.makedirs(os.path.dirname(os.path.abspath(job_file)), exist_ok=True)
+        return job_file
+    
+    def _render_job_file(self, batches, backend, workers, job_file, output_mode, progress, cancel_event,
+                         total_batches, total_rows, index=None):
+        """Write every batch of the job into job_file and return [job_file] (or [] if nothing was written)
+        
+        With an archive index, every invoice is added to it as a sheet (or member) of job_file; the
+        caller commits the index once the file is in place.
+        """
+        import zipfile
+        
+        if not total_batches:
+            return []
+        
+        def in_job_file(batches):
+            for batch in batches:
+                batch['job_file'] = job_file
+                yield batch
+        
+        batches = in_job_file(batches)
+        
+        # Written next to job_file and renamed over it once complete, like the per-invoice files
+        temp_path = _temp_path(job_file)
+        try:
+            with open(temp_path, 'wb') as handle:
+                if output_mode == 'zip':
+                    # The invoices are already compressed; store them as they are, in batch order
+                    with zipfile.ZipFile(handle, 'w', zipfile.ZIP_STORED) as archive:
+                        self._render_batches(batches, backend, workers, progress, cancel_event,
+                                             total_batches, total_rows, archive=archive, index=index)
+                else:
+                    # Sheets are copied inside one openpyxl workbook (pages of one PDF): the fast writer and
+                    # extra workers do not apply
+                    unused = [option for option, ignored in (("the fast backend", backend == 'fast'),
+                                                             ("workers", workers not in (None, 1, "1")))
+                              if ignored]
+                    if unused:
+                        renderer = "reportlab" if backend == 'pdf' else "openpyxl"
+                        print(f"Warning: the workbook output mode renders with {renderer} in one process; "
+                              f"{' and '.join(unused)} are not used (the zip mode uses both)")
+                    self._render_workbook(handle, batches, backend, progress, cancel_event, total_batches, total_rows,
+                                          index)
+                
+                # One flush and fsync for the whole job
+                handle.flush()
+                os.fsync(handle.fileno())
+            if self.cancelled and not self.stats.counters.get('invoices'):
+                # Cancelled before the first invoice: no empty job file
+                os.remove(temp_path)
+                return []
+            os.replace(temp_path, job_file)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        
+        return [job_file]
+    
+    def _render_workbook(self, handle, batches, backend, progress, cancel_event, total_batches, total_rows,
+                         index=None):
+        """Write every batch as a sheet of one workbook (a page of one PDF for the pdf backend)"""
+        self.last_errors = []
+        self.cancelled = False
+        report = _progress_reporter(progress, total_batches, total_rows)
+        
+        # The layout is read from the template once, like for the per-invoice backends
+        if backend == 'pdf':
+            from pdf_renderer import open_document, draw_invoice
+            
+            layout = TemplateLayout.for_template(self.template_path, FastTemplateWriter.for_template(self.template_path),
+                                                 START_ROW, MAX_ROWS_PER_INVOICE)
+            document = None
+        else:
+            from openpyxl.styles import Font
+            
+            workbook = load_template_workbook(self.template_path)
+            template_sheet = workbook.active
+            layout = TemplateLayout.for_template(self.template_path, _SheetReader(template_sheet),
+                                                 START_ROW, MAX_ROWS_PER_INVOICE)
+            images = [(image._data(), image) for image in template_sheet._images]
+            sheet_cells = {}
+        
+        for batch in batches:
+            if cancel_event is not None and cancel_event.is_set():
+                self.cancelled = True
+                break
+            
+            timings = {}
+            started = time.perf_counter()
+            if backend == 'pdf':
+                if document is None:
+                    document = open_document(handle, f"Facture {batch['initial_display_id']}")
+                draw_invoice(document, batch, layout)
+                document.showPage()
+            else:
+                # Every sheet is a copy of the untouched template sheet, images included
+                sheet = _copy_template_sheet(workbook, template_sheet, f"Facture {batch['invoice_index'] + 1}", images)
+                cells, bold_cells = build_invoice_cells(layout, batch)
+                for (row, column), value in cells.items():
+                    sheet.cell(row=row, column=column).value = value
+                for row, column in bold_cells:
+                    sheet.cell(row=row, column=column).font = Font(bold=True)
+                sheet_cells[sheet] = cells
+            timings['sheet'] = time.perf_counter() - started
+            if index is not None:
+                index.add(batch, batch.get('job_file'), f"Facture {batch['invoice_index'] + 1}")
+            
+            self.stats.add_batch(batch, timings)
+            report(batch)
+        
+        if (document is None) if backend == 'pdf' else not sheet_cells:
+            # Cancelled before the first invoice: nothing to save
+            return
+        
+        # Write the file once
+        with self.stats.stage('save'):
+            if backend == 'pdf':
+                if document is not None:
+                    document.save()
+            else:
+                workbook.remove(template_sheet)
+                workbook.active = 0
+                if any(getattr(value, 'cached', None) is not None
+                       for cells in sheet_cells.values() for value in cells.values()):
+                    # openpyxl cannot write a formula's cached result; add them to the saved sheets
+                    buffer = io.BytesIO()
+                    workbook.save(buffer)
+                    handle.write(patch_cached_values(buffer.getvalue(), {
+                        f"xl/worksheets/sheet{workbook.index(sheet) + 1}.xml": cells
+                        for sheet, cells in sheet_cells.items()
+                    }))
+                else:
+                    workbook.save(handle)
+    
+    def _render_batches(self, batches, backend, workers, progress=None, cancel_event=None,
+                        total_batches=None, total_rows=None, manifest=None, archive=None, journal=None, index=None):
+        """Render every batch and return the output files in batch order
+        
+        batches may also be a lazy iterator (streaming mode), in which case total_batches and
+        total_rows must be given; at most a few batches are then held in memory at once.
+        With a manifest, batches whose output file is current are skipped and the others recorded.
+        With a run journal, batches an interrupted run already wrote are skipped and every file
+        written is recorded as soon as it is in place.
+        With an archive index, every invoice written (or resumed) is added to it.
+        With an archive (an open zipfile.ZipFile), each invoice is rendered in memory and stored in
+        it under its file name; the member names are returned instead of paths.
+        """
+        self.last_errors = []
+        self.cancelled = False
+        
+        if total_batches is None:
+            batches = list(batches)
+            total_batches = len(batches)
+            total_rows = sum(len(batch['items']) for batch in batches)
+        
+        if workers == "auto":
+            workers = os.cpu_count() or 1
+        workers = min(int(workers or 1), total_batches)
+        
+        report = _progress_reporter(progress, total_batches, total_rows)
+        
+        def prepare(batch):
+            # PDF output goes next to where the spreadsheet would have been
+            if backend == 'pdf':
+                batch['output_file'] = os.path.splitext(batch['output_file'])[0] + ".pdf"
+            batch['archive'] = archive is not None
+            return batch
+        
+        def skipped(batch):
+            # Already written by the interrupted run, or unchanged since the last one
+            if journal is not None and journal.is_done(batch):
+                self.stats.count('resumed')
+                if manifest is not None:
+                    manifest.record(batch)
+                if index is not None:
+                    index.add(batch)
+                return True
+            if manifest is not None and manifest.is_current(batch):
+                self.stats.count('unchanged')
+                return True
+            return False
+        
+        def written(batch):
+            if manifest is not None:
+                manifest.record(batch)
+            if journal is not None:
+                journal.record(batch)
+            if index is not None:
+                # In archive mode the invoice is a member of the job file
+                if archive is None:
+                    index.add(batch)
+                else:
+                    index.add(batch, batch.get('job_file'), os.path.basename(batch['output_file']))
+        
+        def store(batch, result):
+            # In archive mode the worker returns the file's bytes
+            if archive is None:
+                return result
+            name = os.path.basename(batch['output_file'])
+            archive.writestr(name, result)
+            return name
+        
+        # A single batch is not worth the cost of starting a pool
+        if workers <= 1:
+            generated_invoices = []
+            for batch in map(prepare, batches):
+                if cancel_event is not None and cancel_event.is_set():
+                    self.cancelled = True
+                    break
+                if skipped(batch):
+                    generated_invoices.append(batch['output_file'])
+                    report(batch)
+                    continue
+                result, timings = _render_batch_timed(self.template_path, backend, batch)
+                generated_invoices.append(store(batch, result))
+                self.stats.add_batch(batch, timings)
+                written(batch)
+                report(batch)
+            return generated_invoices
+        
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor
+        
+        generated_invoices = []
+        
+        def collect(batch, future):
+            # Collect the results in order; a failed batch does not stop the others
+            if future is None:
+                # Skipped - nothing was submitted
+                generated_invoices.append(batch['output_file'])
+                report(batch)
+                return
+            if future.cancelled():
+                return
+            try:
+                result, timings = future.result()
+                generated_invoices.append(store(batch, result))
+                self.stats.add_batch(batch, timings)
+                written(batch)
+            except Exception as e:
+                print(f"Error creating invoice {batch['invoice_index'] + 1}/{batch['num_invoices']}: {str(e)}")
+                self.last_errors.append((batch['invoice_index'] + 1, batch['output_file'], str(e)))
+                self.stats.add_batch(batch, {}, error=str(e))
+            report(batch)
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Keep only a couple of batches per worker in flight so memory stays bounded
+            pending = deque()
+            for batch in map(prepare, batches):
+                if cancel_event is not None and cancel_event.is_set():
+                    self.cancelled = True
+                    break
+                if skipped(batch):
+                    pending.append((batch, None))
+                else:
+                    pending.append((batch, executor.submit(_render_batch_timed, self.template_path, backend, batch)))
+                if len(pending) >= workers * 2:
+                    collect(*pending.popleft())
+            
+            # On cancel, drop the batches no worker has started; running ones still finish
+            if self.cancelled:
+                for _, future in pending:
+                    if future is not None:
+                        future.cancel()
+            while pending:
+                if cancel_event is not None and cancel_event.is_set() and not self.cancelled:
+                    self.cancelled = True
+                    for _, future in pending:
+                        if future is not None:
+                            future.cancel()
+                collect(*pending.popleft())
+        
+        if not generated_invoices and self.last_errors:
+            raise RuntimeError(f"Aucune facture n'a pu être générée: {self.last_errors[0][2]}")
+        
+        return generated_invoices
+
+def _progress_reporter(progress, total_batches, total_rows):
+    """Return report(batch), which passes rows done, rate and ETA to progress after each invoice"""
+    start_time = time.perf_counter()
+    done_rows = 0
+    
+    def report(batch):
+        nonlocal done_rows
+        done_rows += len(batch['items'])
+        if progress is not None:
+            elapsed = time.perf_counter() - start_time
+            rate = done_rows / elapsed if elapsed > 0 else 0.0
+            progress({
+                'batch': batch['invoice_index'] + 1,
+                'batches': total_batches,
+                'rows': done_rows,
+                'total_rows': total_rows,
+                'rows_per_second': rate,
+                'eta': (total_rows - done_rows) / rate if rate else None
+            })
+    
+    return report
+
+def _copy_template_sheet(workbook, template_sheet, title, images):
+    """Append a copy of the template sheet; openpyxl's copy_worksheet leaves out the images
+    
+    images holds (data, image) for every image of the template sheet - openpyxl closes an
+    image's file once its data has been read, so the bytes are read a single time by the caller.
+    """
+    from copy import deepcopy
+    from openpyxl.drawing.image import Image
+    
+    sheet = workbook.copy_worksheet(template_sheet)
+    sheet.title = title
+    for data, image in images:
+        clone = Image(io.BytesIO(data))
+        clone.anchor = deepcopy(image.anchor)
+        clone.width, clone.height = image.width, image.height
+        sheet.add_image(clone)
+    return sheet
+
+def build_invoice_cells(layout, batch):
+    """Work out the cells of one invoice as {(row, column): value} plus the cells to set in bold
+    
+    layout is the TemplateLayout of the template, so no cell of the template is read here.
+    """
+    display_id = batch['display_id']
+    invoice_items = batch['items']
+    client_info = batch['client_info']
+    invoice_index = batch['invoice_index']
+    num_invoices = batch['num_invoices']
+    initial_display_id = batch['initial_display_id']
+    totals = batch.get('totals')
+    tva_rate = batch.get('tva_rate', 0.2)
+    line_rates = invoice_items.tva_rates
+    start_row = layout.start_row
+    header = layout.header_cells
+    total_column = layout.TOTAL_COLUMN
+    
+    cells = {}
+    bold_cells = []
+    
+    # Excel function rounding like the money engine; banker's rounding has none
+    round_function = None
+    if totals:
+        from money import EXCEL_ROUNDING
+        round_function = EXCEL_ROUNDING[batch.get('rounding', "half_up")]
+    
+    def formula(text, value_key, index=None, rounded=False):
+        # With precomputed totals, round like the cached value and store it with the formula
+        if not totals:
+            return text
+        value = totals[value_key] if index is None else totals[value_key][index]
+        if rounded and round_function is None:
+            # No Excel formula gives the same rounding: write the computed amount itself
+            return value
+        return Formula(text, value)
+    
+    def rounded(expression):
+        return f"{round_function}({expression},2)" if totals and round_function else expression
+    
+    def tva_formula(total_ht_row):
+        if line_rates is None:
+            return f"={rounded(f'J{total_ht_row}*{tva_rate:g}')}"
+        # One rounded term per rate, on the lines at that rate
+        rows_by_rate = {}
+        for idx, rate in enumerate(line_rates.tolist()):
+            rows_by_rate.setdefault(rate, []).append(f"J{start_row + idx}")
+        return "=" + "+".join(
+            rounded(f"SUM({','.join(rows)})*{rate:g}") for rate, rows in sorted(rows_by_rate.items())
+        )
+    
+    def set_cell(row, column, value, what):
+        if not layout.is_writable(row, column):
+            print(f"Could not set {what}")
+            return False
+        cells[(row, column)] = value
+        return True
+    
+    # Set invoice number and date - direct references
+    set_cell(*header['invoice_id'], display_id, "invoice number")
+    set_cell(*header['date'], batch['date'], "date")
+    
+    # Set client info if provided - direct references
     if client_info:
-        row = 6
         if 'name' in client_info:
-            ws['A6'] = "Client:"
-            ws['B6'] = client_info['name']
-            row = 7
+            set_cell(*header['name'], client_info['name'], "client name")
         if 'address' in client_info:
-            ws[f'A{row}'] = "Adresse:"
-            ws[f'B{row}'] = client_info['address']
-            row += 1
+            set_cell(*header['address'], client_info['address'], "client address")
         if 'ice' in client_info:
-            ws[f'A{row}'] = "ICE:"
-            ws[f'B{row}'] = client_info['ice']
+            set_cell(*header['ice'], client_info['ice'], "client ICE")
     
-    # Create header row for items
-    row = 10
-    headers = ["Description", "Quantité", "Prix unitaire", "Total"]
-    for col, header in enumerate(headers, start=1):
-        ws.cell(row=row, column=col).value = header
-        ws.cell(row=row, column=col).font = Font(bold=True)
+    # Quantities and prices are written rounded like the money engine rounds them for the totals
+    from money import to_amounts
+    quantities = to_amounts(invoice_items.quantities).tolist()
+    unit_prices = to_amounts(invoice_items.unit_prices).tolist()
     
-    # Add line items
-    for idx, item in enumerate(line_items):
-        row = 11 + idx
-        # Description
-        ws.cell(row=row, column=1).value = item['description']
-        # Quantity
-        ws.cell(row=row, column=2).value = round(item['quantity'], 2)
-        # Unit price
-        ws.cell(row=row, column=3).value = round(item['unit_price'], 2)
-        # Total (formula)
-        ws.cell(row=row, column=4).value = f"=B{row}*C{row}"
+    # Fill in items using explicit cell references
+    for idx, item in enumerate(invoice_items):
+        row = start_row + idx
+        
+        # Description - column A, or B when A is part of a merged range
+        set_cell(row, layout.description_columns[idx], item.description, f"description for row {row}")
+        
+        # Quantity (column H)
+        set_cell(row, layout.QUANTITY_COLUMN, quantities[idx], f"quantity for row {row}")
+        
+        # Unit price (column I)
+        set_cell(row, layout.UNIT_PRICE_COLUMN, unit_prices[idx], f"unit price for row {row}")
+        
+        # Calculate total for this row (quantity * unit price) - column J
+        line_formula = f"={rounded(f'H{row}*I{row}')}"
+        set_cell(row, total_column, formula(line_formula, 'lines', idx, rounded=True), f"total formula for row {row}")
     
-    # Add totals
-    total_row = 11 + len(line_items) + 1
-    ws.cell(row=total_row, column=3).value = "Total HT:"
-    ws.cell(row=total_row, column=3).font = Font(bold=True)
-    ws.cell(row=total_row, column=4).value = f"=SUM(D11:D{10 + len(line_items)})"
+    # Clear unnecessary zeros below the table
+    for cell in layout.zero_cells:
+        cells[cell] = None
     
-    ws.cell(row=total_row + 1, column=3).value = "TVA (20%):"
-    ws.cell(row=total_row + 1, column=3).font = Font(bold=True)
-    ws.cell(row=total_row + 1, column=4).value = f"=D{total_row}*0.2"
+    total_ht_row = layout.total_ht_row
+    tva_row = layout.tva_row
+    total_ttc_row = layout.total_ttc_row
+    subtotal_range = f"J{start_row}:J{start_row + len(invoice_items) - 1}"
     
-    ws.cell(row=total_row + 2, column=3).value = "Total TTC:"
-    ws.cell(row=total_row + 2, column=3).font = Font(bold=True)
-    ws.cell(row=total_row + 2, column=4).value = f"=D{total_row}+D{total_row + 1}"
+    # If we found the total cells, update their formulas
+
+    if total_ht_row and set_cell(total_ht_row, total_column, formula(f"=SUM({subtotal_range})", 'ht'), "Total HT formula"):
+        print(f"Set Total HT formula in row {total_ht_row}")
     
-    # Save this new workbook
-    wb.save(output_file)
+    if tva_row and total_ht_row and \
+            set_cell(tva_row, total_column, formula(tva_formula(total_ht_row), 'tva', rounded=True), "TVA formula"):
+        print(f"Set TVA formula in row {tva_row}")
+    
+    if total_ttc_row and total_ht_row and tva_row and \
+            set_cell(total_ttc_row, total_column, formula(f"=J{total_ht_row}+J{tva_row}", 'ttc'), "Total TTC formula"):
+        print(f"Set Total TTC formula in row {total_ttc_row}")
+    
+    # If we couldn't find the total rows, fill the block that starts at the first "total" label
+    row = layout.fallback_total_row
+    if not total_ht_row and row:
+        set_cell(row, total_column, formula(f"=SUM({subtotal_range})", 'ht'), "totals with fallback method")
+        set_cell(row + 1, total_column, formula(tva_formula(row), 'tva', rounded=True), "totals with fallback method")
+        set_cell(row + 2, total_column, formula(f"=J{row}+J{row+1}", 'ttc'), "totals with fallback method")
+    
+    # If this is not the first invoice, add note about it being a continuation
+    if invoice_index > 0:
+        if set_cell(*header['continuation_note'], f"Suite de la facture {initial_display_id}", "continuation note"):
+            bold_cells.append(header['continuation_note'])
         
-def _write_fallback_file(self, output_file, line_items, invoice_id, client_info=None):
+        if set_cell(*header['invoice_count'], f"Facture {invoice_index + 1}/{num_invoices}", "continuation header"):
+            bold_cells.append(header['invoice_count'])
+            
+    elif num_invoices > 1:
+        if set_cell(*header['invoice_count'], f"Facture 1/{num_invoices}", "multi-invoice header"):
+            bold_cells.append(header['invoice_count'])
+    
+    return cells, bold_cells
+
+class _SheetReader:
+    """Read access to an openpyxl sheet with the same interface as FastTemplateWriter"""
+    
+    def __init__(self, sheet):
+        self.sheet = sheet
+    
+    def value(self, row, column):
+        return self.sheet.cell(row=row, column=column).value
+    
+    @property
+    def merged_children(self):
+        return _merged_children(self.sheet)
+    
+    def column_width(self, column):
+        # Like FastTemplateWriter.column_width: a <col> width (customWidth is any non-zero width), else the default
+        for dimension in self.sheet.column_dimensions.values():
+            if dimension.min and dimension.min <= column <= dimension.max and dimension.customWidth:
+                return dimension.width
+        default = self.sheet.sheet_format.defaultColWidth
+        return float(default) if default else DEFAULT_COLUMN_WIDTH
+
+def render_invoice_batch(template_path, backend, batch, timings=None):
+    """Write one invoice batch to batch['output_file'] - runs in the caller or in a worker process
+    
+    The file is built in memory, then written next to its final path and renamed over it (see
+    _write_atomic), so the output file is either the previous one or the complete new one.
+    If batch['archive'] is set the bytes are returned instead of being written.
+    If a dict is given as timings, the seconds spent in each stage ('template', 'layout', 'cells',
+    'save', 'fallback') are added to it.
+    """
+    destination = io.BytesIO()
+    mark = time.perf_counter()
+    
+    def lap(stage):
+        nonlocal mark
+        now = time.perf_counter()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + now - mark
+        mark = now
+    
+    if backend in ('fast', 'pdf'):
+        # Patch the worksheet XML of the in-memory template parts (PDF only reads the template)
+        writer = FastTemplateWriter.for_template(template_path)
+        reader = writer
+    else:
+        # Start from a clone of the cached template instead of copying and re-parsing it
+        workbook = load_template_workbook(template_path)
+        sheet = workbook.active
+        reader = _SheetReader(sheet)
+    lap('template')
+    
+    # The template is only analysed the first time (per process) it is seen
+    layout = TemplateLayout.for_template(template_path, reader, START_ROW, MAX_ROWS_PER_INVOICE)
+    lap('layout')
+    
+    if backend == 'pdf':
+        # Drawn straight from the batch and the layout - there is no spreadsheet to fill
+        from pdf_renderer import write_pdf
+        write_pdf(destination, batch, layout)
+        result = _saved(batch, destination)
+        lap('save')
+        return result
+    
+    cells, bold_cells = build_invoice_cells(layout, batch)
+    lap('cells')
+    
+    # Save the workbook
+    try:
+        if backend == 'fast':
+            destination.write(writer.render(cells, bold_cells))
+        else:
+            from openpyxl.styles import Font
+            
+            for (row, column), value in cells.items():
+                sheet.cell(row=row, column=column).value = value
+            for row, column in bold_cells:
+                sheet.cell(row=row, column=column).font = Font(bold=True)
+            
+            if batch.get('totals'):
+                # openpyxl cannot write a formula's cached result; add them to the saved sheet XML
+                buffer = io.BytesIO()
+                workbook.save(buffer)
+                sheet_part = f"xl/worksheets/sheet{workbook.index(sheet) + 1}.xml"
+                destination.write(patch_cached_values(buffer.getvalue(), {sheet_part: cells}))
+            else:
+                workbook.save(destination)
+        result = _saved(batch, destination)
+        lap('save')
+    except Exception as e:
+        print(f"Error saving workbook: {str(e)}")
+        # If we can't save, try to create a new file with the data, dropping whatever was partly written
+        destination = io.BytesIO()
+        _write_fallback_file(destination, batch['items'], batch['display_id'], batch['client_info'],
+                             batch.get('tva_rate', 0.2))
+        result = _saved(batch, destination)
+        lap('fallback')
+    
+    return result
+
+def _saved(batch, buffer):
+    """What render_invoice_batch returns: the bytes of the file in archive mode, else its path once written"""
+    if batch.get('archive'):
+        return buffer.getvalue()
+    _write_atomic(batch['output_file'], buffer.getbuffer())
+    return batch['output_file']
+
+def _temp_path(path):
+    """Hidden temporary file next to path, one per process and thread; the number scan never takes it for an invoice"""
+    folder, name = os.path.split(os.path.abspath(path))
+    return os.path.join(folder, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def _write_atomic(path, data):
+    """Replace path with data: written to a temporary file, fsynced, then renamed over it"""
+    temp_path = _temp_path(path)
+    try:
+        with open(temp_path, 'wb') as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def _render_batch_timed(template_path, backend, batch):
+    """render_invoice_batch returning (output file or bytes, stage timings) - the unit of work of _render_batches"""
+    timings = {}
+    result = render_invoice_batch(template_path, backend, batch, timings)
+    return result, timings
+
+def _write_fallback_file(output_file, line_items, invoice_id, client_info=None, tva_rate=0.2):
     """Fallback method to write data to a new Excel file if we can't modify the template"""
     import openpyxl
-    from openpyxl.styles import Font, Alignment, Border, Side
+    from openpyxl.styles import Font
+    from money import to_amounts
     
     # Create a new workbook
     wb = openpyxl.Workbook()
@@ -470,11 +1711,11 @@ def _write_fallback_file(self, output_file, line_items, invoice_id, client_info=
     for idx, item in enumerate(line_items):
         row = 11 + idx
         # Description
-        ws.cell(row=row, column=1).value = item['description']
+        ws.cell(row=row, column=1).value = item.description
         # Quantity
-        ws.cell(row=row, column=2).value = round(item['quantity'], 2)
+        ws.cell(row=row, column=2).value = float(to_amounts(item.quantity))
         # Unit price
-        ws.cell(row=row, column=3).value = round(item['unit_price'], 2)
+        ws.cell(row=row, column=3).value = float(to_amounts(item.unit_price))
         # Total (formula)
         ws.cell(row=row, column=4).value = f"=B{row}*C{row}"
     
@@ -486,7 +1727,7 @@ def _write_fallback_file(self, output_file, line_items, invoice_id, client_info=
     
     ws.cell(row=total_row + 1, column=3).value = "TVA (20%):"
     ws.cell(row=total_row + 1, column=3).font = Font(bold=True)
-    ws.cell(row=total_row + 1, column=4).value = f"=D{total_row}*0.2"
+    ws.cell(row=total_row + 1, column=4).value = f"=D{total_row}*{tva_rate:g}"
     
     ws.cell(row=total_row + 2, column=3).value = "Total TTC:"
     ws.cell(row=total_row + 2, column=3).font = Font(bold=True)
@@ -494,450 +1735,238 @@ def _write_fallback_file(self, output_file, line_items, invoice_id, client_info=
     
     # Save this new workbook
     wb.save(output_file)
-            
-    def _write_fallback_file(self, output_file, line_items, invoice_id, client_info=None):
-        """Fallback method to write data to a new Excel file if we can't modify the template"""
-        import openpyxl
-        from openpyxl.styles import Font, Alignment, Border, Side
-        
-        # Create a new workbook
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        
-        # Set header information
-        ws['A1'] = "FACTURE"
-        ws['A1'].font = Font(bold=True, size=16)
-        
-        ws['A3'] = "Facture N°:"
-        ws['B3'] = invoice_id
-        ws['B3'].font = Font(bold=True)
-        
-        ws['A4'] = "Date:"
-        ws['B4'] = datetime.now().strftime("%d/%m/%Y")
-        
-        # Set client info if provided
-        if client_info:
-            row = 6
-            if 'name' in client_info:
-                ws['A6'] = "Client:"
-                ws['B6'] = client_info['name']
-                row = 7
-            if 'address' in client_info:
-                ws[f'A{row}'] = "Adresse:"
-                ws[f'B{row}'] = client_info['address']
-                row += 1
-            if 'ice' in client_info:
-                ws[f'A{row}'] = "ICE:"
-                ws[f'B{row}'] = client_info['ice']
-        
-        # Create header row for items
-        row = 10
-        headers = ["Description", "Quantité", "Prix unitaire", "Total"]
-        for col, header in enumerate(headers, start=1):
-            ws.cell(row=row, column=col).value = header
-            ws.cell(row=row, column=col).font = Font(bold=True)
-        
-        # Add line items
-        for idx, item in enumerate(line_items):
-            row = 11 + idx
-            # Description
-            ws.cell(row=row, column=1).value = item['description']
-            # Quantity
-            ws.cell(row=row, column=2).value = round(item['quantity'], 2)
-            # Unit price
-            ws.cell(row=row, column=3).value = round(item['unit_price'], 2)
-            # Total (formula)
-            ws.cell(row=row, column=4).value = f"=B{row}*C{row}"
-        
-        # Add totals
-        total_row = 11 + len(line_items) + 1
-        ws.cell(row=total_row, column=3).value = "Total HT:"
-        ws.cell(row=total_row, column=3).font = Font(bold=True)
-        ws.cell(row=total_row, column=4).value = f"=SUM(D11:D{10 + len(line_items)})"
-        
-        ws.cell(row=total_row + 1, column=3).value = "TVA (20%):"
-        ws.cell(row=total_row + 1, column=3).font = Font(bold=True)
-        ws.cell(row=total_row + 1, column=4).value = f"=D{total_row}*0.2"
-        
-        ws.cell(row=total_row + 2, column=3).value = "Total TTC:"
-        ws.cell(row=total_row + 2, column=3).font = Font(bold=True)
-        ws.cell(row=total_row + 2, column=4).value = f"=D{total_row}+D{total_row + 1}"
-        
-        # Save this new workbook
-        wb.save(output_file)
 
-class InvoiceApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Générateur de Factures")
-        self.root.geometry("750x600")
-        self.root.configure(padx=20, pady=20)
-        # Initialize the invoice generator
-        self.generator = InvoiceGenerator()
-        
-        # Check if template file exists
-        if not os.path.exists(self.generator.template_path):
-            messagebox.showwarning(
-                "Fichier modèle manquant",
-                f"Le fichier modèle n'a pas été trouvé à l'emplacement:\n{self.generator.template_path}\n\n"
-                "Veuillez sélectionner le fichier modèle lors de la première utilisation."
-            )
-        
-        # Default data file path
-        self.data_file = os.path.join(self.generator.base_path, "AZZOUZIFCT.xlsx")
-        
-        # Check if data file exists
-        if not os.path.exists(self.data_file):
-            # Set to empty and will require user selection
-            self.data_file = ""
-        
-        # Create the main frame
-        self.main_frame = ttk.Frame(root)
-        self.main_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Create styles
-        self.style = ttk.Style()
-        self.style.configure("TLabel", font=("Arial", 11))
-        self.style.configure("TButton", font=("Arial", 11))
-        self.style.configure("TEntry", font=("Arial", 11))
-        self.style.configure("Header.TLabel", font=("Arial", 14, "bold"))
-        
-        # Create the header
-        header = ttk.Label(self.main_frame, text="Générateur de Factures", style="Header.TLabel")
-        header.pack(pady=(0, 20))
-        
-        # Create the form frame
-        form_frame = ttk.Frame(self.main_frame)
-        form_frame.pack(fill=tk.X, pady=10)
-        
-        # Data file selection
-        file_frame = ttk.Frame(form_frame)
-        file_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(file_frame, text="Fichier de données:").pack(side=tk.LEFT, padx=(0, 10))
-        
-        self.data_file_var = tk.StringVar(value=self.data_file)
-        data_file_entry = ttk.Entry(file_frame, textvariable=self.data_file_var, width=40)
-        data_file_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
-        
-        browse_btn = ttk.Button(file_frame, text="Parcourir...", command=self.browse_data_file)
-        browse_btn.pack(side=tk.LEFT)
-        
-        # Invoice ID
-        id_frame = ttk.Frame(form_frame)
-        id_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(id_frame, text="Numéro de facture:").pack(side=tk.LEFT, padx=(0, 10))
-        
-        self.invoice_id_var = tk.StringVar()
-        invoice_id_entry = ttk.Entry(id_frame, textvariable=self.invoice_id_var, width=15)
-        invoice_id_entry.pack(side=tk.LEFT)
-        
-        ttk.Label(id_frame, text="(Laissez vide pour générer automatiquement)").pack(side=tk.LEFT, padx=(10, 0))
-        
-        # Client info
-        client_frame = ttk.LabelFrame(form_frame, text="Informations client")
-        client_frame.pack(fill=tk.X, pady=10)
-        
-        # Client name
-        name_frame = ttk.Frame(client_frame)
-        name_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(name_frame, text="Nom / Société:").pack(side=tk.LEFT, padx=(0, 10))
-        
-        self.client_name_var = tk.StringVar()
-        client_name_entry = ttk.Entry(name_frame, textvariable=self.client_name_var, width=40)
-        client_name_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
-        
-        # Client address
-        address_frame = ttk.Frame(client_frame)
-        address_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(address_frame, text="Adresse:").pack(side=tk.LEFT, padx=(0, 10))
-        
-        self.client_address_var = tk.StringVar()
-        client_address_entry = ttk.Entry(address_frame, textvariable=self.client_address_var, width=40)
-        client_address_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
-        
-        # Client ICE
-        ice_frame = ttk.Frame(client_frame)
-        ice_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(ice_frame, text="ICE:").pack(side=tk.LEFT, padx=(0, 10))
-        
-        self.client_ice_var = tk.StringVar()
-        client_ice_entry = ttk.Entry(ice_frame, textvariable=self.client_ice_var, width=40)
-        client_ice_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
-        
-        # Output options
-        output_frame = ttk.LabelFrame(form_frame, text="Options de sortie")
-        output_frame.pack(fill=tk.X, pady=10)
-        
-        # Output folder
-        folder_frame = ttk.Frame(output_frame)
-        folder_frame.pack(fill=tk.X, pady=5)
-        
-        ttk.Label(folder_frame, text="Dossier de sortie:").pack(side=tk.LEFT, padx=(0, 10))
-        
-        self.output_folder_var = tk.StringVar(value=self.generator.output_folder)
-        output_folder_entry = ttk.Entry(folder_frame, textvariable=self.output_folder_var, width=40)
-        output_folder_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 10))
-        
-        browse_output_btn = ttk.Button(folder_frame, text="Parcourir...", command=self.browse_output_folder)
-        browse_output_btn.pack(side=tk.LEFT)
-        
-        # Buttons
-        button_frame = ttk.Frame(self.main_frame)
-        button_frame.pack(fill=tk.X, pady=20)
-        
-        self.generate_btn = ttk.Button(button_frame, text="Générer la facture", command=self.generate_invoice)
-        self.generate_btn.pack(side=tk.RIGHT, padx=5)
-        
-        reset_btn = ttk.Button(button_frame, text="Réinitialiser", command=self.reset_form)
-        reset_btn.pack(side=tk.RIGHT, padx=5)
-        
-        # Log area
-        log_frame = ttk.LabelFrame(self.main_frame, text="Journal")
-        log_frame.pack(fill=tk.BOTH, expand=True, pady=10)
-        
-        self.log_text = ScrolledText(log_frame, height=10)
-        self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
-        self.log_text.config(state=tk.DISABLED)
-        
-        # Status bar
-        self.status_var = tk.StringVar(value="Prêt")
-        status_bar = ttk.Label(self.main_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
-        status_bar.pack(fill=tk.X, side=tk.BOTTOM, pady=(10, 0))
-        
-    def log(self, message):
-        """Add a message to the log area"""
-        self.log_text.config(state=tk.NORMAL)
-        self.log_text.insert(tk.END, f"{datetime.now().strftime('%H:%M:%S')} - {message}\n")
-        self.log_text.see(tk.END)
-        self.log_text.config(state=tk.DISABLED)
+
+def launch_gui(generator=None):
+    """Open the Tk interface - tkinter is only imported from here"""
+    import gui
+    gui.run(generator or InvoiceGenerator())
+
+def profile_startup(modules=("main", "gui") + HEAVY_MODULES):
+    """Print the import time of each start-up module, measured in a fresh interpreter"""
+    import subprocess
+    
+    # -X importtime reports every import as "self | cumulative | name", nested imports indented
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True
+    )
+    
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Only top-level imports; their cumulative time includes everything they pulled in
+        if not name.startswith("  "):
+            timings.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    
+    total = sum(cumulative for _, _, cumulative in timings)
+    print(f"{'module':<32}{'cumulative':>12}{'self':>10}")
+    for name, self_ms, cumulative_ms in sorted(timings, key=lambda timing: -timing[2]):
+        if cumulative_ms >= 1 or name in modules:
+            deferred = "  (deferred)" if name in HEAVY_MODULES else ""
+            print(f"{name:<32}{cumulative_ms:>10.1f}ms{self_ms:>8.1f}ms{deferred}")
+    print(f"{'total':<32}{total:>10.1f}ms")
+
+def _workers_arg(value):
+    """Parse --workers: a number of processes or "auto" """
+    if value == "auto":
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid worker count: {value}")
+
+def _rate_arg(value):
+    """TVA rate given as a percentage: 20, 5.5 or 20%, returned as a fraction
+    
+    Rates between 0 and 1 are refused rather than guessed: 0.2 is a fraction written in the wrong unit.
+    """
+    try:
+        rate = float(value.strip().rstrip("%"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid TVA rate: {value} (give a percentage, e.g. 20)")
+    if not (rate == 0 or 1 <= rate < 100):
+        raise argparse.ArgumentTypeError(f"invalid TVA rate: {value} (give a percentage, e.g. 20 for 20%)")
+    if round(rate, 2) != rate:
+        # The totals are computed in basis points; a finer rate would disagree with the written formula
+        raise argparse.ArgumentTypeError(f"invalid TVA rate: {value} (at most two decimals, e.g. 5.5)")
+    return rate / 100
+
+def build_parser():
+    """Command line interface for headless runs"""
+    parser = argparse.ArgumentParser(prog="main", description="Générateur de Factures")
+    parser.add_argument("--profile-startup", action="store_true", help="print a per-module import-time breakdown")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    # Options shared by every generating command
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--out", help="output folder (default: ~/Desktop/facture)")
+    common.add_argument("--template", help="invoice template (default: ~/Desktop/facture/FACTURE COMPT.xlsx)")
+    common.add_argument("--backend", choices=BACKENDS, help="writer backend (pdf needs reportlab)")
+    common.add_argument("--workers", type=_workers_arg, help='number of rendering processes, or "auto"')
+    common.add_argument("--output-mode", choices=OUTPUT_MODES,
+                        help="one file per invoice (default), one workbook for the job (built in one process, "
+                             "with openpyxl for spreadsheets), or one .zip")
+    common.add_argument("--cached-totals", action="store_true",
+                        help="compute the totals and store them as cached formula results")
+    common.add_argument("--tva-rate", type=_rate_arg, help="TVA rate in percent, e.g. 20 or 5.5 (default: 20)")
+    common.add_argument("--line-rates", action="store_true",
+                        help="read the TVA rate of each line from the 4th column of the data file (0.2 or 20%%)")
+    common.add_argument("--rounding", choices=("half_up", "half_even", "down", "up"),
+                        help="rounding of line totals and TVA (default: half_up, like Excel's ROUND)")
+    common.add_argument("--strict", action="store_true",
+                        help="write nothing if the data has errors (missing or invalid values, negative quantities...)")
+    common.add_argument("--max-rows", type=int, help="most line items a job may have")
+    common.add_argument("--duplicates", choices=("off", "warn", "error"),
+                        help="invoices identical to one already generated: warn (default), stop, or do not check")
+    common.add_argument("--stats", action="store_true", help="print the time spent in each stage at the end")
+    common.add_argument("--stats-log", help="append per-invoice and run statistics to this file as JSON lines")
+    
+    generate = subparsers.add_parser("generate", parents=[common], help="generate the invoices of one client")
+    generate.add_argument("--data", required=True, help="Excel, CSV, Parquet or Arrow file with description, quantity and unit price")
+    generate.add_argument("--client", help="client name / company")
+    generate.add_argument("--address", help="client address")
+    generate.add_argument("--ice", help="client ICE number")
+    generate.add_argument("--invoice-id", help="invoice number (default: next free number)")
+    generate.add_argument("--stream", action="store_true", help="read the data file row by row (bounded memory)")
+    generate.add_argument("--incremental", action="store_true",
+                          help="only re-render the invoices whose inputs changed since the last run")
+    generate.add_argument("--restart", action="store_true",
+                          help="start over with a new number instead of resuming an interrupted run")
+    
+    batch = subparsers.add_parser("batch", parents=[common], help="generate invoices for every client of a master file")
+    batch.add_argument("--master", required=True, help="Excel file with client and line-item columns")
+    
+    serve = subparsers.add_parser("serve", parents=[common], help="run the local HTTP job service")
+    serve.add_argument("--host", default="127.0.0.1",
+                       help="address to listen on (default: 127.0.0.1; the service has no authentication)")
+    serve.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    serve.add_argument("--jobs", type=int, default=2, help="number of jobs run at the same time (default: 2)")
+    
+    search = subparsers.add_parser("search", help="search the invoices already generated")
+    search.add_argument("text", nargs="?", help="words of the line descriptions")
+    search.add_argument("--out", help="output folder (default: ~/Desktop/facture)")
+    search.add_argument("--client", help="words of the client name")
+    search.add_argument("--ice", help="client ICE number")
+    search.add_argument("--invoice-id", help="part of the invoice number")
+    search.add_argument("--from", dest="date_from", help="first date, dd/mm/YYYY or YYYY-MM-DD")
+    search.add_argument("--to", dest="date_to", help="last date, dd/mm/YYYY or YYYY-MM-DD")
+    search.add_argument("--limit", type=int, default=100, help="most invoices listed (default: 100)")
+    
+    subparsers.add_parser("gui", help="open the graphical interface (default)")
+    
+    return parser
+
+def _configure(generator, args):
+    """Apply the shared command line options to the generator"""
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        generator.output_folder = args.out
+    if args.template:
+        generator.template_path = args.template
+    if args.backend:
+        generator.backend = args.backend
+    if args.workers is not None:
+        generator.workers = args.workers
+    if args.output_mode:
+        generator.output_mode = args.output_mode
+    if args.cached_totals:
+        generator.cached_totals = True
+    if args.tva_rate is not None:
+        generator.tva_rate = args.tva_rate
+    if args.line_rates:
+        generator.line_rates = True
+    if args.rounding:
+        generator.rounding = args.rounding
+    if args.strict:
+        generator.strict_validation = True
+    if args.max_rows is not None:
+        generator.max_rows = args.max_rows
+    if args.duplicates:
+        generator.duplicates = args.duplicates
+    if args.stats_log:
+        from instrumentation import JsonLinesSink
+        generator.stats_sink = JsonLinesSink(args.stats_log)
+
+def main(argv=None):
+    """Entry point: run a headless command, or the GUI when no command is given"""
+    args = build_parser().parse_args(argv)
+    
+    if args.profile_startup:
+        profile_startup()
+    
+    if args.command in (None, "gui"):
+        launch_gui()
+        return 0
+    
+    if args.command == "serve":
+        from job_service import serve
         
-    def browse_data_file(self):
-        """Open file dialog to select data file"""
-        file_path = filedialog.askopenfilename(
-            title="Sélectionner le fichier de données",
-            filetypes=[("Excel files", "*.xlsx *.xls"), ("All files", "*.*")],
-            initialdir=self.generator.base_path
-        )
+        def make_generator():
+            generator = InvoiceGenerator()
+            _configure(generator, args)
+            return generator
         
-        if file_path:
-            self.data_file_var.set(file_path)
-            self.log(f"Fichier de données sélectionné: {file_path}")
+        serve(args.host, args.port, args.jobs, make_generator)
+        return 0
     
-    def browse_output_folder(self):
-        """Open folder dialog to select output folder"""
-        folder_path = filedialog.askdirectory(
-            title="Sélectionner le dossier de sortie",
-            initialdir=self.generator.output_folder
-        )
+    if args.command == "search":
+        generator = InvoiceGenerator()
+        if args.out:
+            generator.output_folder = args.out
         
-        if folder_path:
-            self.output_folder_var.set(folder_path)
-            self.log(f"Dossier de sortie sélectionné: {folder_path}")
+        found = generator.search_invoices(args.text, client=args.client, ice=args.ice, display_id=args.invoice_id,
+                                          date_from=args.date_from, date_to=args.date_to, limit=args.limit)
+        for invoice in found:
+            location = invoice['file'] + (f" [{invoice['part']}]" if invoice['part'] else "")
+            print(f"{invoice['date']}  {invoice['display_id']}  {invoice['client_name'] or '-'}  "
+                  f"{invoice['total_ttc']:.2f}  {location}")
+        return 0
     
-    def generate_invoice(self):
-        """Generate the invoice(s) with the provided information"""
-        try:
-            # Disable the generate button during processing
-            self.generate_btn.config(state=tk.DISABLED)
-            self.status_var.set("Génération en cours...")
-            self.root.update()
-            
-            # Get values from form
-            data_file = self.data_file_var.get()
-            invoice_id = self.invoice_id_var.get() if self.invoice_id_var.get() else None
-            output_folder = self.output_folder_var.get()
-            
-            # Create client info dictionary
+    generator = InvoiceGenerator()
+    _configure(generator, args)
+    
+    try:
+        if args.command == "generate":
             client_info = {}
-            if self.client_name_var.get():
-                client_info['name'] = self.client_name_var.get()
-            if self.client_address_var.get():
-                client_info['address'] = self.client_address_var.get()
-            if self.client_ice_var.get():
-                client_info['ice'] = self.client_ice_var.get()
-            
-            # Validate inputs
-            if not os.path.exists(data_file):
-                raise ValueError(f"Le fichier de données n'existe pas: {data_file}")
-                
-            if not os.path.exists(self.generator.template_path):
-                raise ValueError(f"Le fichier modèle n'existe pas: {self.generator.template_path}")
-                
-            if not os.path.exists(output_folder):
-                # Create output folder if it doesn't exist
-                try:
-                    os.makedirs(output_folder, exist_ok=True)
-                    self.log(f"Dossier de sortie créé: {output_folder}")
-                except Exception as e:
-                    raise ValueError(f"Impossible de créer le dossier de sortie: {str(e)}")
-            
-            # Update generator paths
-            self.generator.output_folder = output_folder
+            if args.client:
+                client_info['name'] = args.client
+            if args.address:
+                client_info['address'] = args.address
+            if args.ice:
+                client_info['ice'] = args.ice
             
-            # Log start of generation
-            self.log(f"Début de la génération de la facture...")
-            self.log(f"Fichier de données: {data_file}")
-            self.log(f"Fichier modèle: {self.generator.template_path}")
-            
-            # Generate filename if invoice_id provided
+            # Same naming as the GUI when an invoice number is given
             output_file = None
-            if invoice_id:
-                output_file = os.path.join(output_folder, f"invoice_{invoice_id}.xlsx")
-            
-            # Generate the invoice(s)
-            result = self.generator.create_invoice(
-                data_file,
-                invoice_id,
-                output_file,
-                client_info
-            )
-            
-            # Handle the result (could be a single path or a list of paths)
-            if isinstance(result, list):
-                # Multiple invoices were generated
-                self.log(f"{len(result)} factures générées avec succès:")
-                for idx, invoice_path in enumerate(result):
-                    self.log(f"  {idx+1}. {invoice_path}")
-                
-                self.status_var.set(f"{len(result)} factures générées")
-                
-                # Show success message
-                messagebox.showinfo(
-                    "Génération réussie", 
-                    f"{len(result)} factures ont été générées avec succès.\n\nDossier: {output_folder}"
-                )
-                
-                # Ask if user wants to open the output folder
-                if messagebox.askyesno("Ouvrir le dossier", "Voulez-vous ouvrir le dossier contenant les factures générées?"):
-                    import platform
-                    import subprocess
-                    
-                    system = platform.system()
-                    try:
-                        if system == 'Windows':
-                            os.startfile(output_folder)
-                        elif system == 'Darwin':  # macOS
-                            subprocess.call(['open', output_folder])
-                        else:  # Linux and other Unix-like systems
-                            subprocess.call(['xdg-open', output_folder])
-                    except Exception as e:
-                        self.log(f"Erreur lors de l'ouverture du dossier: {str(e)}")
-                        messagebox.showwarning("Avertissement", f"Impossible d'ouvrir le dossier automatiquement.\n\nLes factures ont été enregistrées ici:\n{output_folder}")
-            else:
-                # Single invoice was generated
-                self.log(f"Facture générée avec succès: {result}")
-                self.status_var.set(f"Facture générée: {os.path.basename(result)}")
-                
-                # Show success message
-                messagebox.showinfo(
-                    "Génération réussie", 
-                    f"La facture a été générée avec succès.\n\nFichier: {result}"
-                )
-                
-                # Ask if user wants to open the generated file
-                if messagebox.askyesno("Ouvrir le fichier", "Voulez-vous ouvrir la facture générée?"):
-                    import platform
-                    import subprocess
-                    
-                    system = platform.system()
-                    try:
-                        if system == 'Windows':
-                            os.startfile(result)
-                        elif system == 'Darwin':  # macOS
-                            subprocess.call(['open', result])
-                        else:  # Linux and other Unix-like systems
-                            subprocess.call(['xdg-open', result])
-                    except Exception as e:
-                        self.log(f"Erreur lors de l'ouverture du fichier: {str(e)}")
-                        messagebox.showwarning("Avertissement", f"Impossible d'ouvrir le fichier automatiquement.\n\nLe fichier a été enregistré ici:\n{result}")
-        
-        except Exception as e:
-            # Log error
-            error_msg = str(e)
-            self.log(f"Erreur: {error_msg}")
-            self.status_var.set("Erreur lors de la génération")
+            if args.invoice_id:
+                output_file = os.path.join(generator.output_folder, f"invoice_{args.invoice_id}.xlsx")
             
-            # Show error message
-            messagebox.showerror("Erreur", f"Une erreur s'est produite lors de la génération de la facture:\n\n{error_msg}")
+            result = generator.create_invoice(args.data, args.invoice_id, output_file, client_info,
+                                              stream=args.stream, incremental=args.incremental,
+                                              resume=not args.restart)
+            for invoice_path in (result if isinstance(result, list) else [result]):
+                print(invoice_path)
         
-        finally:
-            # Re-enable the generate button
-            self.generate_btn.config(state=tk.NORMAL)
-    
-    def reset_form(self):
-        """Reset the form to default values"""
-        self.invoice_id_var.set("")
-        self.client_name_var.set("")
-        self.client_address_var.set("")
-        self.client_ice_var.set("")
-        self.data_file_var.set(os.path.join(self.generator.base_path, "AZZOUZIFCT.xlsx"))
-        self.output_folder_var.set(self.generator.base_path)
-        
-        self.log("Formulaire réinitialisé")
-        self.status_var.set("Prêt")
-
-
-def add_menu(root, app):
-    """Add menu bar to the application"""
-    menubar = tk.Menu(root)
-    
-    # File menu
-    filemenu = tk.Menu(menubar, tearoff=0)
-    filemenu.add_command(label="Sélectionner fichier de données", command=app.browse_data_file)
-    filemenu.add_command(label="Sélectionner dossier de sortie", command=app.browse_output_folder)
-    filemenu.add_separator()
-    filemenu.add_command(label="Quitter", command=root.quit)
-    menubar.add_cascade(label="Fichier", menu=filemenu)
-    
-    # Template menu
-    templatemenu = tk.Menu(menubar, tearoff=0)
-    templatemenu.add_command(label="Sélectionner modèle", command=lambda: select_template(app))
-    menubar.add_cascade(label="Modèle", menu=templatemenu)
-    
-    # Help menu
-    helpmenu = tk.Menu(menubar, tearoff=0)
-    helpmenu.add_command(label="À propos", command=lambda: show_about(root))
-    menubar.add_cascade(label="Aide", menu=helpmenu)
-    
-    root.config(menu=menubar)
-
-def select_template(app):
-    """Allow user to select a template file"""
-    file_path = filedialog.askopenfilename(
-        title="Sélectionner le fichier modèle",
-        filetypes=[("Excel files", "*.xlsx *.xls"), ("All files", "*.*")],
-        initialdir=app.generator.base_path
-    )
+        elif args.command == "batch":
+            generator.create_client_invoices(args.master)
     
-    if file_path:
-        app.generator.template_path = file_path
-        app.log(f"Fichier modèle sélectionné: {file_path}")
-
-def show_about(root):
-    """Show about dialog"""
-    messagebox.showinfo(
-        "À propos",
-        "Générateur de Factures\n\n"
-        "Version 1.0\n\n"
-        "Un programme pour générer des factures à partir de fichiers Excel.\n"
-        "Compatible avec Windows et Linux."
-    )
+    except Exception as e:
+        print(f"Erreur: {str(e)}", file=sys.stderr)
+        return 1
+    
+    finally:
+        if args.stats:
+            for line in generator.stats.summary_lines():
+                print(line, file=sys.stderr)
+    
+    for invoice_number, invoice_path, error in generator.last_errors:
+        print(f"Erreur facture {invoice_number} ({invoice_path}): {error}", file=sys.stderr)
+    
+    return 1 if generator.last_errors else 0
 
 if __name__ == "__main__":
-    # Handle high DPI displays on Windows
-    if os.name == 'nt':
-        try:
-            from ctypes import windll
-            windll.shcore.SetProcessDpiAwareness(1)
-        except:
-            pass
-    
-    root = tk.Tk()
-    app = InvoiceApp(root)
-    add_menu(root, app)
-    root.mainloop()
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Invoice totals computed in bulk, in integer centimes.
+
+Quantities and unit prices are rounded to the centime once, by to_cents, and
+written to the invoice as to_amounts() gives them, so the cells and the totals
+computed here start from the same numbers. Once in centimes every product is
+an exact integer (in 1/10000) and is rounded to the centime with integer
+arithmetic. TVA rates are held as integer basis points (20% -> 2000) for the
+same reason.
+
+Rounding is done on whole arrays with integer arithmetic, in one of
+ROUNDING_MODES:
+- "half_up": half away from zero, like Excel's ROUND (the default)
+- "half_even": half to the even centime (banker's rounding)
+- "down": toward zero, like ROUNDDOWN
+- "up": away from zero, like ROUNDUP
+
+The TVA rate is either one rate for the invoice or one rate per line. With
+several rates on an invoice, the TVA is rounded once per rate, on the HT of
+the lines at that rate, and the per-rate amounts are added up.
+"""
+import numpy as np
+
+# TVA rate applied to the Total HT
+TVA_RATE = 0.2
+
+ROUNDING_MODES = ("half_up", "half_even", "down", "up")
+
+# Excel function giving the same result as each rounding mode; banker's rounding has none
+EXCEL_ROUNDING = {"half_up": "ROUND", "down": "ROUNDDOWN", "up": "ROUNDUP", "half_even": None}
+
+
+def check_rounding(rounding):
+    if rounding not in ROUNDING_MODES:
+        raise ValueError(f"Mode d'arrondi inconnu: {rounding}")
+    return rounding
+
+
+def _whole_basis_points(rates):
+    """True where a rate is a whole number of basis points (0.01%), as the totals compute with"""
+    scaled = np.asarray(rates, dtype=np.float64) * 10000
+    return np.abs(scaled - np.rint(scaled)) < 1e-6
+
+
+def check_rate(rate):
+    """A TVA rate as a fraction (0.2 for 20%), in whole basis points
+
+    A finer rate would be rounded for the computed totals but not in the formula written to the
+    sheet, and Excel would then recalculate another TVA.
+    """
+    rate = float(rate)
+    if not 0 <= rate < 1:
+        raise ValueError(f"Taux de TVA invalide: {rate} (attendu entre 0 et 1, ex. 0.2 pour 20%)")
+    if not _whole_basis_points(rate):
+        raise ValueError(f"Taux de TVA trop précis: {rate} (au plus deux décimales en pourcentage, ex. 5.5%)")
+    return rate
+
+
+def rate_value(value):
+    """The TVA rate of a data file cell as a fraction: 0.2, or text such as "20%" or "5,5 %"
+
+    NaN for an empty cell; ValueError for anything else that is not a rate between 0 and 1.
+    """
+    if value is None or isinstance(value, float) and value != value:
+        return np.nan
+    if isinstance(value, str):
+        text = value.strip().replace(",", ".")
+        if not text:
+            return np.nan
+        scale = 100 if text.endswith("%") else 1
+        try:
+            value = float(text.rstrip("%").strip()) / scale
+        except ValueError:
+            raise ValueError(f"Taux de TVA invalide: {value}")
+    return check_rate(value)
+
+
+def parse_rates(values):
+    """rate_value of every cell: (rates, NaN where empty or invalid; mask of the invalid cells)"""
+    import pandas as pd
+
+    cells = pd.Series(values, dtype=object)
+    rates = pd.to_numeric(cells, errors='coerce').to_numpy(dtype=np.float64, copy=True)
+    invalid = (rates < 0) | (rates >= 1) | ~_whole_basis_points(np.nan_to_num(rates))
+    # Text cells ("20%", "5,5") one by one; numbers, the bulk of a column, are done above
+    for index in np.flatnonzero(np.isnan(rates)).tolist():
+        try:
+            rates[index] = rate_value(cells.iat[index])
+        except ValueError:
+            invalid[index] = True
+    rates[invalid] = np.nan
+    return rates, invalid
+
+
+def to_cents(values):
+    """Amounts as int64 centimes, rounded to the nearest centime (half to even on the scaled value)
+
+    0.015 gives 2 centimes where round(0.015, 2) gives 0.01, so the amounts written to an
+    invoice must come from to_amounts(), not from round().
+    """
+    return np.rint(np.asarray(values, dtype=np.float64) * 100).astype(np.int64)
+
+
+def to_amounts(values):
+    """Amounts rounded to the centime exactly like to_cents, as float64 - the values written to the cells"""
+    return to_cents(values) / 100
+
+
+def to_basis_points(rates):
+    """TVA rates as int64 basis points: 0.2 -> 2000"""
+    return np.rint(np.asarray(rates, dtype=np.float64) * 10000).astype(np.int64)
+
+
+def _divide_rounded(numerator, divisor, rounding="half_up"):
+    """Integer division rounded with the given rounding mode, element-wise"""
+    numerator = np.asarray(numerator, dtype=np.int64)
+    magnitude, remainder = np.divmod(np.abs(numerator), divisor)
+
+    if rounding == "half_up":
+        magnitude = magnitude + (2 * remainder >= divisor)
+    elif rounding == "half_even":
+        magnitude = magnitude + ((2 * remainder > divisor) | ((2 * remainder == divisor) & (magnitude % 2 == 1)))
+    elif rounding == "up":
+        magnitude = magnitude + (remainder > 0)
+    else:
+        check_rounding(rounding)
+
+    return np.where(numerator < 0, -magnitude, magnitude)
+
+
+def line_totals(quantities, unit_prices, rounding="half_up"):
+    """Quantity x unit price of every line, in centimes"""
+    return _divide_rounded(to_cents(quantities) * to_cents(unit_prices), 100, rounding)
+
+
+def batch_totals(line_cents, batch_size, tva_rate=TVA_RATE, rounding="half_up", line_rates=None):
+    """Total HT, TVA and Total TTC (centimes) of consecutive batches of batch_size lines
+
+    line_rates, if given, holds the TVA rate of every line and replaces tva_rate.
+    """
+    line_cents = np.asarray(line_cents, dtype=np.int64)
+    if not len(line_cents):
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    starts = np.arange(0, len(line_cents), batch_size)
+    total_ht = np.add.reduceat(line_cents, starts)
+
+    if line_rates is None:
+        tva = _divide_rounded(total_ht * int(to_basis_points(tva_rate)), 10000, rounding)
+    else:
+        tva = sum(_divide_rounded(base * rate, 10000, rounding)
+                  for rate, base, _ in _bases_by_rate(line_cents, starts, line_rates))
+    return total_ht, tva, total_ht + tva
+
+
+def _bases_by_rate(line_cents, starts, line_rates):
+    """(rate in basis points, HT of each batch at that rate, lines of each batch at that rate) per distinct rate"""
+    points = to_basis_points(line_rates)
+    for rate in np.unique(points).tolist():
+        at_rate = points == rate
+        yield rate, np.add.reduceat(np.where(at_rate, line_cents, 0), starts), np.add.reduceat(at_rate, starts)
+
+
+def invoice_totals(quantities, unit_prices, batch_size, tva_rate=TVA_RATE, rounding="half_up", line_rates=None):
+    """Per-batch totals as plain floats: [{'lines': [...], 'ht': ..., 'tva': ..., 'ttc': ...}, ...]
+
+    With line_rates, each batch also gets 'tva_by_rate': [(rate, HT at that rate, TVA), ...].
+    """
+    check_rounding(rounding)
+    lines = line_totals(quantities, unit_prices, rounding)
+    total_ht, tva, total_ttc = batch_totals(lines, batch_size, tva_rate, rounding, line_rates)
+
+    line_values = (lines / 100).tolist()
+    totals = [
+        {
+            'lines': line_values[index * batch_size:(index + 1) * batch_size],
+            'ht': ht / 100,
+            'tva': tax / 100,
+            'ttc': ttc / 100
+        }
+        for index, (ht, tax, ttc) in enumerate(zip(total_ht.tolist(), tva.tolist(), total_ttc.tolist()))
+    ]
+
+    if line_rates is not None and len(lines):
+        starts = np.arange(0, len(lines), batch_size)
+        for rate, base, count in _bases_by_rate(lines, starts, line_rates):
+            amounts = _divide_rounded(base * rate, 10000, rounding)
+            for batch, base_cents, tax, lines_at_rate in zip(totals, base.tolist(), amounts.tolist(), count.tolist()):
+                # Rates with no line in this batch are left out
+                if lines_at_rate:
+                    batch.setdefault('tva_by_rate', []).append((rate / 10000, base_cents / 100, tax / 100))
+
+    return totals
@@ -0,0 +1,192 @@
+"""Native PDF output for invoices.
+
+Draws an invoice batch straight to PDF with reportlab: letterhead taken from the
+template, invoice number and date, client block, the item table with as many
+rows as the template and the HT / TVA / TTC totals. No spreadsheet is written
+and no office suite is started, so PDFs are rendered in batch and on the same
+process pool as the .xlsx backends.
+
+reportlab is optional and only imported when a PDF is drawn.
+"""
+from money import TVA_RATE, invoice_totals, to_amounts
+
+# Page geometry in points (A4 portrait, 15 mm margins)
+MM = 72 / 25.4
+PAGE_WIDTH = 210 * MM
+PAGE_HEIGHT = 297 * MM
+MARGIN = 15 * MM
+
+# Item table: (title, width, alignment)
+TABLE_COLUMNS = (
+    ("Désignation", 95 * MM, 'left'),
+    ("Qté", 20 * MM, 'right'),
+    ("P.U", 30 * MM, 'right'),
+    ("Montant", 35 * MM, 'right')
+)
+ROW_HEIGHT = 6.5 * MM
+FONT = "Helvetica"
+BOLD_FONT = "Helvetica-Bold"
+
+
+def require_reportlab():
+    """Fail early, with an explicit message, when reportlab is not installed"""
+    try:
+        import reportlab  # noqa: F401
+    except ImportError:
+        raise RuntimeError("La sortie PDF nécessite le module reportlab (pip install reportlab)")
+
+
+def format_amount(value):
+    """1234.5 -> '1 234,50', the French way"""
+    return f"{value:,.2f}".replace(",", " ").replace(".", ",")
+
+
+def format_quantity(value):
+    return format_amount(value)[:-3] if float(value).is_integer() else format_amount(value)
+
+
+def _clip(canvas, text, font, size, width):
+    """Shorten text with an ellipsis until it fits in width"""
+    text = str(text)
+    if canvas.stringWidth(text, font, size) <= width:
+        return text
+    while text and canvas.stringWidth(text + "…", font, size) > width:
+        text = text[:-1]
+    return text + "…"
+
+
+def _totals(batch):
+    """Line totals and HT / TVA / TTC of the batch, as computed for the spreadsheet"""
+    if batch.get('totals'):
+        return batch['totals']
+
+    items = batch['items']
+    totals = invoice_totals(items.quantities, items.unit_prices, max(len(items), 1), batch.get('tva_rate', TVA_RATE),
+                            batch.get('rounding', "half_up"), items.tva_rates)
+    return totals[0] if totals else {'lines': [], 'ht': 0.0, 'tva': 0.0, 'ttc': 0.0}
+
+
+def _tva_rows(batch, totals):
+    """(label, amount) of the TVA lines: one per rate when the lines have different rates"""
+    by_rate = totals.get('tva_by_rate')
+    if by_rate and len(by_rate) > 1:
+        return [(f"TVA {rate * 100:g}% sur {format_amount(base)}", tax) for rate, base, tax in by_rate]
+    rate = by_rate[0][0] if by_rate else batch.get('tva_rate', TVA_RATE)
+    return [(f"TVA {rate * 100:g}%", totals['tva'])]
+
+
+def draw_invoice(canvas, batch, layout):
+    """Draw one invoice page on a reportlab canvas"""
+    top = PAGE_HEIGHT - MARGIN
+    right = PAGE_WIDTH - MARGIN
+    client_info = batch['client_info'] or {}
+
+    # Letterhead from the template, top left
+    y = top
+    for index, line in enumerate(layout.letterhead):
+        # The company name is drawn larger; measure each line in the font it is drawn with
+        font, size = (BOLD_FONT, 14) if index == 0 else (FONT, 9)
+        canvas.setFont(font, size)
+        canvas.drawString(MARGIN, y - 10, _clip(canvas, line, font, size, 95 * MM))
+        y -= 18 if index == 0 else 12
+
+    # Invoice number and date, top right
+    canvas.setFont(BOLD_FONT, 16)
+    canvas.drawRightString(right, top - 12, "FACTURE")
+    canvas.setFont(FONT, 10)
+    canvas.drawRightString(right, top - 30, f"N° {batch['display_id']}")
+    canvas.drawRightString(right, top - 44, f"Date: {batch['date']}")
+
+    # Client block
+    box_left = PAGE_WIDTH / 2
+    box_top = top - 62
+    canvas.rect(box_left, box_top - 52, right - box_left, 52)
+    canvas.setFont(BOLD_FONT, 10)
+    canvas.drawString(box_left + 6, box_top - 14, _clip(canvas, client_info.get('name', ""), BOLD_FONT, 10,
+                                                        right - box_left - 12))
+    canvas.setFont(FONT, 9)
+    canvas.drawString(box_left + 6, box_top - 29, _clip(canvas, client_info.get('address', ""), FONT, 9,
+                                                       right - box_left - 12))
+    if client_info.get('ice'):
+        canvas.drawString(box_left + 6, box_top - 44, f"ICE: {client_info['ice']}")
+
+    # "Facture i/n" and continuation note
+    y = box_top - 70
+    canvas.setFont(BOLD_FONT, 9)
+    if batch['num_invoices'] > 1:
+        canvas.drawString(MARGIN, y, f"Facture {batch['invoice_index'] + 1}/{batch['num_invoices']}")
+    if batch['invoice_index'] > 0:
+        canvas.drawRightString(right, y, f"Suite de la facture {batch['initial_display_id']}")
+
+    # Item table: header row and as many rows as the template has
+    totals = _totals(batch)
+    lines = totals['lines']
+    y -= 10
+    canvas.setFillGray(0.9)
+    canvas.rect(MARGIN, y - ROW_HEIGHT, right - MARGIN, ROW_HEIGHT, fill=1)
+    canvas.setFillGray(0)
+    canvas.setFont(BOLD_FONT, 9)
+    x = MARGIN
+    for title, width, _ in TABLE_COLUMNS:
+        canvas.drawCentredString(x + width / 2, y - ROW_HEIGHT + 6, title)
+        x += width
+
+    table_top = y
+    canvas.setFont(FONT, 9)
+    items = list(batch['items'])
+    quantities = to_amounts(batch['items'].quantities).tolist()
+    unit_prices = to_amounts(batch['items'].unit_prices).tolist()
+    for index in range(layout.max_rows):
+        y -= ROW_HEIGHT
+        if index < len(items):
+            item = items[index]
+            values = (item.description, format_quantity(quantities[index]),
+                      format_amount(unit_prices[index]), format_amount(lines[index]))
+            x = MARGIN
+            for value, (_, width, align) in zip(values, TABLE_COLUMNS):
+                text = _clip(canvas, value, FONT, 9, width - 8)
+                if align == 'left':
+                    canvas.drawString(x + 4, y - ROW_HEIGHT + 6, text)
+                else:
+                    canvas.drawRightString(x + width - 4, y - ROW_HEIGHT + 6, text)
+                x += width
+    table_bottom = y - ROW_HEIGHT
+
+    # Table borders
+    canvas.rect(MARGIN, table_bottom, right - MARGIN, table_top - table_bottom)
+    x = MARGIN
+    for _, width, _ in TABLE_COLUMNS[:-1]:
+        x += width
+        canvas.line(x, table_top, x, table_bottom)
+    canvas.line(MARGIN, table_top - ROW_HEIGHT, right, table_top - ROW_HEIGHT)
+
+    # Totals, under the amount column
+    label_left = right - TABLE_COLUMNS[-1][1] - TABLE_COLUMNS[-2][1] - TABLE_COLUMNS[-3][1]
+    y = table_bottom
+    rows = [("Total HT", totals['ht'], FONT)]
+    rows += [(label, value, FONT) for label, value in _tva_rows(batch, totals)]
+    rows.append(("Total TTC", totals['ttc'], BOLD_FONT))
+    for label, value, font in rows:
+        canvas.rect(label_left, y - ROW_HEIGHT, right - label_left, ROW_HEIGHT)
+        canvas.setFont(font, 9)
+        canvas.drawString(label_left + 4, y - ROW_HEIGHT + 6, label)
+        canvas.drawRightString(right - 4, y - ROW_HEIGHT + 6, format_amount(value))
+        y -= ROW_HEIGHT
+
+
+def open_document(output_file, title):
+    """Start a PDF document; output_file may be a path or a binary file object"""
+    from reportlab.pdfgen import canvas as pdf_canvas
+
+    canvas = pdf_canvas.Canvas(output_file, pagesize=(PAGE_WIDTH, PAGE_HEIGHT), pageCompression=1)
+    canvas.setTitle(title)
+    return canvas
+
+
+def write_pdf(output_file, batch, layout):
+    """Write one invoice batch as a single-page PDF"""
+    canvas = open_document(output_file, f"Facture {batch['display_id']}")
+    draw_invoice(canvas, batch, layout)
+    canvas.showPage()
+    canvas.save()
+    return output_file
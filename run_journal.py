@@ -0,0 +1,131 @@
+"""Run journal of a job, so an interrupted run can carry on where it stopped.
+
+While the invoices of a job are written (one file each), a journal file
+(".invoice_run_<key>.jsonl") in the output folder records the job - data file,
+invoice number, date and a fingerprint of its inputs - followed by one line per
+invoice file once it has been renamed into place. Lines are only appended and
+flushed, so a crash loses at most the line being written.
+
+When the same job is started again (same data file, template, client and
+options) while its journal is still there, the run resumes: it reuses the
+invoice number and date of the interrupted run instead of reserving a new
+number, and skips the batches whose file the journal lists and which are still
+on disk with the recorded size. The journal is deleted once every batch of the
+job has been written.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+
+JOURNAL_PREFIX = ".invoice_run_"
+
+
+def journal_path(folder, data_file):
+    """Journal of the jobs of data_file in folder"""
+    key = hashlib.sha1(os.path.abspath(data_file).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(folder, f"{JOURNAL_PREFIX}{key}.jsonl")
+
+
+class RunJournal:
+    """Batches of a job already written, read back from (and appended to) its journal file"""
+
+    def __init__(self, folder, data_file, fingerprint):
+        self.path = journal_path(folder, data_file)
+        self.data_file = os.path.abspath(data_file)
+        # Through JSON and back, so it compares equal to the one read from the file
+        self.fingerprint = json.loads(json.dumps(fingerprint, sort_keys=True))
+        # Header of the interrupted run being resumed, or None for a fresh start
+        self.job = None
+        # Output path -> size of every file the interrupted run finished
+        self.done = {}
+        self._handle = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as handle:
+                lines = handle.read().splitlines()
+        except FileNotFoundError:
+            return
+
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # The last line of a crashed run may be cut short
+                break
+
+        if not entries or entries[0].get('event') != 'start':
+            print(f"Ignoring unreadable run journal {self.path}")
+            return
+        if entries[0].get('fingerprint') != self.fingerprint:
+            # Another job for the same data file (changed data, template or options): start over
+            return
+
+        self.job = entries[0]
+        for entry in entries[1:]:
+            if entry.get('event') == 'done':
+                self.done[entry['file']] = entry['size']
+
+    @property
+    def resuming(self):
+        return self.job is not None
+
+    def start(self, file_id, display_id, date):
+        """Open the journal for this run: a new one, or the interrupted run's, compacted"""
+        if self.resuming:
+            entries = [self.job] + [{'event': 'done', 'file': path, 'size': size} for path, size in self.done.items()]
+            entries.append({'event': 'resume', 'time': time.time()})
+        else:
+            self.job = {
+                'event': 'start', 'data_file': self.data_file, 'fingerprint': self.fingerprint,
+                'file_id': file_id, 'display_id': display_id, 'date': date, 'time': time.time()
+            }
+            entries = [self.job]
+
+        # Rewritten whole (then only appended to), so a torn last line never stays in the middle
+        temp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            for entry in entries:
+                handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.path)
+        self._handle = open(self.path, 'a', encoding='utf-8')
+
+    def is_done(self, batch):
+        """True if an earlier run of this job wrote the batch's file and it is still complete"""
+        key = os.path.abspath(batch['output_file'])
+        size = self.done.get(key)
+        if size is None:
+            return False
+        try:
+            return os.path.getsize(key) == size
+        except OSError:
+            return False
+
+    def record(self, batch):
+        """Note a batch whose file has just been renamed into place"""
+        key = os.path.abspath(batch['output_file'])
+        self.done[key] = size = os.path.getsize(key)
+        if self._handle is not None:
+            self._handle.write(json.dumps({'event': 'done', 'index': batch['invoice_index'], 'file': key,
+                                           'size': size}, ensure_ascii=False) + "\n")
+            self._handle.flush()
+
+    def close(self):
+        """Stop appending; the journal stays for a later resume"""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def finish(self):
+        """The whole job is written: the journal is no longer needed"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
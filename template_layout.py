@@ -0,0 +1,119 @@
+"""Template layout discovery.
+
+The invoice template is inspected once per file version: header cells, item
+table bounds, merged ranges and the rows of the totals block. Every batch, and
+every worker process, then reuses the cached TemplateLayout instead of scanning
+the sheet again.
+"""
+import os
+
+# Layouts keyed on (template path, reader class): (mtime, size, layout). Readers may measure the
+# same template slightly differently, so a layout is only reused with the kind of reader that built it
+_layout_cache = {}
+
+
+class TemplateLayout:
+    """Where each invoice field goes in the template, as (row, column) pairs"""
+
+    # Single cells of the invoice header
+    HEADER_CELLS = {
+        'invoice_id': (3, 5),    # E3
+        'date': (3, 9),          # I3
+        'name': (5, 8),          # H5
+        'address': (7, 8),       # H7
+        'ice': (9, 8),           # H9
+        'invoice_count': (3, 1)  # A3 - "Facture i/n" on multi-invoice jobs
+    }
+
+    # Columns of the item table
+    QUANTITY_COLUMN = 8     # H
+    UNIT_PRICE_COLUMN = 9   # I
+    TOTAL_COLUMN = 10       # J
+
+    def __init__(self, reader, start_row=12, max_rows=23):
+        # reader exposes value(row, column), column_width(column) and merged_children, like FastTemplateWriter
+        self.start_row = start_row
+        self.max_rows = max_rows
+        self.end_row = start_row + max_rows - 1
+        self.header_cells = dict(self.HEADER_CELLS)
+        self.header_cells['continuation_note'] = (start_row - 2, 1)
+
+        # Every cell covered by a merged range except its top-left cell; these cannot be written
+        self.merged_children = frozenset(reader.merged_children)
+
+        # Description goes in column A, or B when A is covered by a merged range
+        self.description_columns = [
+            1 if (row, 1) not in self.merged_children else 2
+            for row in range(start_row, self.end_row + 1)
+        ]
+
+        # Characters that fit in the description cell of an item row, across the columns it is merged with
+        column = self.description_columns[0]
+        span = [column]
+        while (start_row, span[-1] + 1) in self.merged_children:
+            span.append(span[-1] + 1)
+        self.description_chars = int(sum(reader.column_width(column) for column in span))
+
+        # Zeros left in the two rows under the table are cleared
+        self.zero_cells = []
+        for row in (self.end_row + 1, self.end_row + 2):
+            value = reader.value(row, self.TOTAL_COLUMN)
+            if value == 0 or value == "0":
+                self.zero_cells.append((row, self.TOTAL_COLUMN))
+
+        # Text of column A above the invoice fields (company name, address...), for the PDF output
+        header_cells = set(self.header_cells.values())
+        self.letterhead = [
+            str(reader.value(row, 1)).strip()
+            for row in range(1, start_row - 2)
+            if (row, 1) not in header_cells and isinstance(reader.value(row, 1), str) and reader.value(row, 1).strip()
+        ]
+
+        self._find_totals(reader)
+
+    def _find_totals(self, reader):
+        """Locate the Total HT / TVA / Total TTC rows from their labels"""
+        self.total_ht_row = None
+        self.tva_row = None
+        self.total_ttc_row = None
+
+        # Labels like "Total HT", "TVA" in columns G, H or I below the table
+        for row in range(self.end_row + 3, self.end_row + 11):
+            for col in range(7, 10):
+                cell_value = reader.value(row, col)
+                if cell_value and isinstance(cell_value, str):
+                    cell_text = cell_value.lower()
+                    if "total ht" in cell_text:
+                        self.total_ht_row = row
+                    elif "tva" in cell_text:
+                        self.tva_row = row
+                    elif "ttc" in cell_text or "total ttc" in cell_text:
+                        self.total_ttc_row = row
+
+        # Otherwise the first "total" label in columns E-I starts a HT/TVA/TTC block
+        self.fallback_total_row = None
+        if not self.total_ht_row:
+            for row in range(self.end_row + 1, self.end_row + 11):
+                if any(
+                    isinstance(reader.value(row, col), str) and "total" in reader.value(row, col).lower()
+                    for col in range(5, 10)
+                ):
+                    self.fallback_total_row = row
+                    break
+
+    def is_writable(self, row, column):
+        """False for cells hidden inside a merged range"""
+        return (row, column) not in self.merged_children
+
+    @classmethod
+    def for_template(cls, template_path, reader, start_row=12, max_rows=23):
+        """Return the layout of template_path, analysing `reader` only when the file changed"""
+        stat = os.stat(template_path)
+        key = (template_path, type(reader))
+        cached = _layout_cache.get(key)
+
+        if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+            cached = (stat.st_mtime_ns, stat.st_size, cls(reader, start_row, max_rows))
+            _layout_cache[key] = cached
+
+        return cached[2]
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_adapters import _sniff_layout, iter_rows, read_csv  # noqa: E402
+
+
+def test_semicolon_csv_reads_decimal_comma(tmp_path):
+    path = tmp_path / "items.csv"
+    path.write_text("Description;Quantité;Prix\nVis;2,5;10,25\nÉcrou;3;1,5\n", encoding='utf-8')
+
+    assert _sniff_layout(path) == (';', ',', 3)
+    frame = read_csv(path)
+    assert [float(value) for value in frame[1][1:]] == [2.5, 3.0]
+    assert [float(value) for value in frame[2][1:]] == [10.25, 1.5]
+    rows = list(iter_rows(path))
+    assert [(row[0], float(row[1]), float(row[2])) for row in rows[1:]] == [("Vis", 2.5, 10.25), ("Écrou", 3.0, 1.5)]
+
+
+def test_semicolon_csv_without_header_is_numeric(tmp_path):
+    path = tmp_path / "items.csv"
+    path.write_text("Vis;2,5;10,25\nÉcrou;3;1,5\n", encoding='utf-8')
+
+    frame = read_csv(path)
+    assert frame[1].tolist() == [2.5, 3.0]
+    assert frame[2].tolist() == [10.25, 1.5]
+
+
+def test_comma_csv_keeps_decimal_point(tmp_path):
+    path = tmp_path / "items.csv"
+    path.write_text("Vis,2.5,10.25\n\"Écrou, M6\",3,1.5\n", encoding='utf-8')
+
+    assert _sniff_layout(path) == (',', '.', 3)
+    assert list(iter_rows(path)) == [("Vis", 2.5, 10.25), ("Écrou, M6", 3.0, 1.5)]
@@ -0,0 +1,179 @@
+"""Validation of line items before any invoice is written.
+
+The checks run on whole columns at once (pandas / numpy masks), right after the
+data is loaded and before the first file is opened, and report every problem
+of the job in one go instead of one "Skipping row" line at a time:
+
+errors
+- a missing description, quantity or unit price on a non-empty row
+- a quantity or unit price that is not a number, or not finite
+- a negative quantity
+- a description longer than the description cell of the template
+- more rows than the job allows (InvoiceGenerator.max_rows)
+- a TVA rate that is not a rate between 0 and 1 (0.2 or "20%"), when the
+  rates are read per line (InvoiceGenerator.line_rates)
+
+warnings
+- a header row (first row with text in both number columns), skipped
+- a zero quantity or a negative unit price
+- an amount with more than two decimals, which is rounded when written
+
+Each issue is a dict {'row', 'column', 'reason', 'severity', 'value'}; rows are
+numbered like the data file (first row = 1). In strict mode the run stops with a
+ValidationError when the report has errors, before anything is written.
+"""
+import numpy as np
+
+ERROR = "error"
+WARNING = "warning"
+
+COLUMNS = ("description", "quantity", "unit_price")
+
+
+class ValidationError(ValueError):
+    """The data has errors and strict validation is on; nothing was written"""
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__(
+            f"Données invalides: {len(report.errors)} erreur(s), aucune facture n'a été écrite\n"
+            + "\n".join(report.summary_lines(limit=10)[1:])
+        )
+
+
+class ValidationReport:
+    """Every issue found in the line items of a job"""
+
+    def __init__(self, issues=()):
+        self.issues = list(issues)
+
+    def extend(self, issues):
+        self.issues.extend(issues)
+
+    @property
+    def errors(self):
+        return [issue for issue in self.issues if issue['severity'] == ERROR]
+
+    @property
+    def warnings(self):
+        return [issue for issue in self.issues if issue['severity'] == WARNING]
+
+    def sorted_issues(self):
+        return sorted(self.issues, key=lambda issue: (issue['row'], COLUMNS.index(issue['column'])
+                                                      if issue['column'] in COLUMNS else len(COLUMNS)))
+
+    def summary_lines(self, limit=20):
+        """Counts, then one line per issue (errors first), at most `limit` of them"""
+        issues = sorted(self.sorted_issues(), key=lambda issue: issue['severity'] != ERROR)
+        lines = [f"{len(self.errors)} errors, {len(self.warnings)} warnings"]
+        for issue in issues[:limit]:
+            value = f" ({issue['value']})" if issue['value'] is not None else ""
+            lines.append(f"  {issue['severity']}: row {issue['row']}, {issue['column']}: {issue['reason']}{value}")
+        if len(issues) > limit:
+            lines.append(f"  ... and {len(issues) - limit} more")
+        return lines
+
+    def as_dict(self):
+        return {'errors': len(self.errors), 'warnings': len(self.warnings), 'issues': self.sorted_issues()}
+
+    def raise_if_errors(self):
+        if self.errors:
+            raise ValidationError(self)
+
+
+def _issues(mask, rows, column, reason, severity, values=None):
+    """One issue per True entry of mask; rows holds the file row number of every entry"""
+    found = np.flatnonzero(mask)
+    if not len(found):
+        return []
+    shown = [None] * len(found) if values is None else [_shown(values[index]) for index in found.tolist()]
+    return [
+        {'row': row, 'column': column, 'reason': reason, 'severity': severity, 'value': value}
+        for row, value in zip(rows[found].tolist(), shown)
+    ]
+
+
+def _shown(value):
+    text = str(value)
+    return text if len(text) <= 40 else text[:39] + "…"
+
+
+def check_frame(frame, first_row=1):
+    """Issues of the raw rows of a data file (first three columns, before conversion)
+
+    first_row is the file row number of the frame's first row, for frames read in chunks.
+    """
+    import pandas as pd
+
+    raw = frame.iloc[:, :3]
+    rows = np.arange(first_row, first_row + len(raw))
+    missing = raw.isna().to_numpy().reshape(len(raw), -1)
+    if missing.shape[1] < 3:
+        return []
+
+    # Fully empty rows are layout, not data
+    blank = missing.all(axis=1)
+
+    values = {}
+    not_number = {}
+    for index in (1, 2):
+        column = raw.iloc[:, index]
+        numbers = pd.to_numeric(column, errors='coerce').astype('float64').to_numpy()
+        values[index] = numbers
+        not_number[index] = ~missing[:, index] & np.isnan(numbers)
+
+    # A header row: text in both number columns of the first non-empty row of the file
+    header = np.zeros(len(raw), dtype=bool)
+    filled = np.flatnonzero(~blank)
+    if first_row == 1 and len(filled) and not_number[1][filled[0]] and not_number[2][filled[0]]:
+        header[filled[0]] = True
+
+    issues = _issues(header, rows, "description", "header row, skipped", WARNING, raw.iloc[:, 0].to_numpy())
+    for index, name in enumerate(COLUMNS):
+        issues += _issues(missing[:, index] & ~blank, rows, name, "missing value", ERROR)
+
+    for index in (1, 2):
+        name = COLUMNS[index]
+        numbers = values[index]
+        issues += _issues(not_number[index] & ~header, rows, name, "not a number", ERROR,
+                          raw.iloc[:, index].to_numpy())
+        issues += _issues(np.isinf(numbers), rows, name, "not a finite number", ERROR, numbers)
+
+        # Written rounded to two decimals
+        finite = np.isfinite(numbers)
+        scaled = np.where(finite, numbers, 0) * 100
+        issues += _issues(finite & (np.abs(scaled - np.rint(scaled)) > 1e-6), rows, name,
+                          "more than 2 decimals, rounded", WARNING, numbers)
+
+    quantities = values[1]
+    issues += _issues(quantities < 0, rows, "quantity", "negative quantity", ERROR, quantities)
+    issues += _issues(quantities == 0, rows, "quantity", "zero quantity", WARNING)
+    issues += _issues(values[2] < 0, rows, "unit_price", "negative unit price", WARNING, values[2])
+    return issues
+
+
+def check_rates(values, rows):
+    """TVA rate cells that are not a rate between 0 and 1; rows are file row numbers"""
+    from money import parse_rates
+
+    values = np.asarray(values, dtype=object)
+    _, invalid = parse_rates(values)
+    return _issues(invalid, np.asarray(rows), "tva_rate", "not a TVA rate (0.2 or 20%)", ERROR, values)
+
+
+def check_descriptions(descriptions, rows, max_chars):
+    """Descriptions longer than max_chars characters; rows are file row numbers"""
+    if not max_chars or not len(descriptions):
+        return []
+    lengths = np.fromiter((len(str(description)) for description in descriptions), dtype=np.int64,
+                          count=len(descriptions))
+    return _issues(lengths > max_chars, np.asarray(rows), "description",
+                   f"longer than the template's {max_chars} characters", ERROR, lengths)
+
+
+def check_row_count(count, max_rows, first_excess_row):
+    """An error on the first valid row beyond max_rows, given the number of valid rows"""
+    if max_rows is None or count <= max_rows:
+        return []
+    return [{'row': int(first_excess_row), 'column': "description", 'reason': f"more than {max_rows} rows",
+             'severity': ERROR, 'value': count}]